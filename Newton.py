@@ -1,47 +1,305 @@
 import numpy as np
-import csv
-from numba import njit, float64
-from numba.types import Tuple
-import time, sys
-
-def simulate_newton(mass1: int, position1: list, velocity1: list, mass2: int, position2: list, velocity2: list, target_time: float, dt: float, save_every: int = 100, G: float = 6.67430e-11):
-    @njit(Tuple((float64[:], float64[:]))(float64, float64[:], float64, float64[:]), cache = True)
-    def calculate_gravitational_force(mass1, position1, mass2, position2):
-        # Calculate distance vector and squared distance
-        DPosition = position2 - position1
-        distance_squared = np.dot(DPosition, DPosition)
-
-        # Collision check
-        if distance_squared == 0:
-            raise ValueError("Distance between bodies cannot be zero.")
-
-        # Calculate force magnitude and vector
-        force_magnitude = G * mass1 * mass2 / distance_squared
-        force_vector = force_magnitude * (DPosition / np.sqrt(distance_squared))
-        
-        return force_vector, -force_vector
-
-    @njit(Tuple((float64[:], float64[:]))(float64, float64[:],  float64[:],  float64[:], float64), cache = True)
-    def update_position(mass, position, velocity, force_vector, dt):
-        # Calculate acceleration
-        acceleration = force_vector / mass
-        #print(acceleration)
-        # Update velocity and position
-        velocity += acceleration * dt
-        position += velocity * dt
-
-        return position, velocity
+import time, hashlib, os
+from trajectory import TrajectoryWriter, BackgroundWriter, read_events
+from checkpoint import save_checkpoint, load_checkpoint, remove_checkpoint
+from cache import cache_dir, cache_key, cache_lookup, cache_store, engine_version
+from metrics import run_metrics, finish_metrics
+import newton_kernels, barnes_hut
+from newton_kernels import calculate_gravitational_force, update_position, integrate_nbody_chunk, FORCE_DIRECT, FORCE_TREE
+from newton_kernels import INTEGRATOR_EULER, INTEGRATOR_LEAPFROG, INTEGRATOR_YOSHIDA4, INTEGRATOR_WISDOM_HOLMAN
+from newton_kernels import integrate_two_body_ensemble
+from newton_kernels import POST_NEWTONIAN_NONE, POST_NEWTONIAN_1PN, POST_NEWTONIAN_2PN, POST_NEWTONIAN_2_5PN
+from newton_kernels import STATUS_FINISHED, EVENT_CAPTURE, EVENT_ESCAPE, EVENT_PERIAPSIS, EVENT_APOAPSIS
+
+FORCE_MODES = {"direct": FORCE_DIRECT, "tree": FORCE_TREE}
+INTEGRATORS = {
+    "euler": INTEGRATOR_EULER,
+    "leapfrog": INTEGRATOR_LEAPFROG,
+    "verlet": INTEGRATOR_LEAPFROG,
+    "yoshida4": INTEGRATOR_YOSHIDA4,
+    "wisdom_holman": INTEGRATOR_WISDOM_HOLMAN,
+}
+# Force evaluations per step of each integrator
+FORCE_EVALUATIONS = {"euler": 1, "leapfrog": 1, "verlet": 1, "yoshida4": 3, "wisdom_holman": 1}
+POST_NEWTONIAN = {None: POST_NEWTONIAN_NONE, "1pn": POST_NEWTONIAN_1PN, "2pn": POST_NEWTONIAN_2PN, "2.5pn": POST_NEWTONIAN_2_5PN}
+# Sources whose hash versions the cached Newton results
+ENGINE_SOURCES = (os.path.abspath(__file__), newton_kernels.__file__, barnes_hut.__file__)
+EVENT_NAMES = {EVENT_CAPTURE: "capture", EVENT_ESCAPE: "escape", EVENT_PERIAPSIS: "periapsis", EVENT_APOAPSIS: "apoapsis"}
+
+
+def check_post_newtonian(post_newtonian, integrator, force):
+    if post_newtonian not in POST_NEWTONIAN:
+        raise ValueError(f"Unknown post-Newtonian order: {post_newtonian}")
+    if post_newtonian is not None and integrator == "wisdom_holman":
+        raise ValueError("Post-Newtonian corrections are not supported by the wisdom_holman integrator.")
+    if post_newtonian is not None and force != "direct":
+        raise ValueError("Post-Newtonian corrections are only supported with direct forces.")
+
+
+def simulate_nbody(masses, positions, velocities, target_time: float, dt: float, save_every: int = 100, G: float = 6.67430e-11, chunk_size: int = 10000, force: str = "direct", theta: float = 0.5, integrator: str = "euler", adaptive: bool = False, eta: float = 0.01, dt_min: float = None, output: str = "Newton.traj", buffers: int = 2, backpressure: str = "block", checkpoint_every: float = None, resume: bool = False, capture_radius: float = 0.0, escape_radius: float = np.inf, apsides: bool = False, post_newtonian: str = None, c: float = 299792458, cache=False, metrics=None, progress=None):
+    # N-body engine: masses (N,), positions (N, 2) and velocities (N, 2) are kept as
+    # contiguous arrays and the whole integration runs in integrate_nbody_chunk, the
+    # pairwise forces are summed on all cores once N reaches PARALLEL_THRESHOLD.
+    # force="tree" replaces the O(N^2) sum with a Barnes-Hut quadtree rebuilt every step,
+    # theta is its opening angle (0 = exact, larger = faster and less accurate).
+    # integrator: "euler" (semi-implicit, 1st order), "leapfrog"/"verlet" (2nd order),
+    # "yoshida4" (4th order) or "wisdom_holman" (Kepler drift around body 0, for systems
+    # dominated by the first mass), all of them symplectic.
+    # adaptive=True makes dt the largest step and shrinks it to eta times the shortest
+    # free-fall / crossing time of any pair (not below dt_min), rows are still written
+    # every dt * save_every seconds, interpolated between the actual steps.
+    # Rows go to the trajectory store at output (see trajectory.py), written by a
+    # background thread from `buffers` recycled chunk arrays while the kernel fills the
+    # next one. backpressure: "block" waits for the writer when all buffers are in
+    # flight, "grow" allocates another one instead.
+    # checkpoint_every (wall-clock seconds) snapshots the state at the next chunk boundary
+    # into output/checkpoint.npz, resume=True continues from it and appends to output.
+    # A resumed run is bit-for-bit the uninterrupted one as long as chunk_size is kept.
+    # Events of the pair of bodies 0 and 1 are located on the interpolant of each step:
+    # the run stops when their separation falls to capture_radius or rises to
+    # escape_radius, apsides=True records periapsis / apoapsis passages. Returns the final
+    # positions, velocities and {event name: times}, also saved to output/events.npz.
+    # post_newtonian="1pn" adds the Einstein-Infeld-Hoffmann corrections (perihelion
+    # advance, 1PN interaction of every body with every other), "2pn" also the 2PN terms
+    # of each pair and "2.5pn" their gravitational radiation reaction, see
+    # newton_kernels.post_newtonian_row. Their velocity dependence is handled by
+    # time-symmetric kicks (newton_kernels.kick), leapfrog and yoshida4 keep their order.
+    # cache=True (or a cache directory) reuses the result of an identical earlier run,
+    # keyed on all inputs and the engine version, see cache.py
+    # metrics (a metrics.RunMetrics, or a path for its JSON) records phase timings, step,
+    # force evaluation and row counters, throughput and peak memory of the run, progress
+    # is called with a metrics.Progress (fraction done, ETA) after chunks, see metrics.py
+    if force not in FORCE_MODES:
+        raise ValueError(f"Unknown force mode: {force}")
+    if integrator not in INTEGRATORS:
+        raise ValueError(f"Unknown integrator: {integrator}")
+    check_post_newtonian(post_newtonian, integrator, force)
+    if adaptive and integrator == "wisdom_holman":
+        raise ValueError("Adaptive steps are not supported by the wisdom_holman integrator.")
+    if integrator == "wisdom_holman" and (capture_radius > 0 or escape_radius < np.inf or apsides):
+        raise ValueError("Events are not supported by the wisdom_holman integrator.")
+    if dt_min is None:
+        dt_min = dt * 1e-9
+    start_time = time.time()
+    instrument = run_metrics(metrics, progress)
+    instrument.start("newton", target_time)
+
+    with instrument.phase("setup"):
+        masses = np.ascontiguousarray(masses, dtype=np.float64)
+        positions = np.array(positions, dtype=np.float64, order="C")
+        velocities = np.array(velocities, dtype=np.float64, order="C")
+        n = masses.shape[0]
+        if positions.shape != (n, 2) or velocities.shape != (n, 2):
+            raise ValueError("positions and velocities must have shape (N, 2) matching masses.")
+
+        acc = np.empty((n, 2), dtype=np.float64)
+
+        columns = ["time"]
+        for i in range(1, n + 1):
+            columns += [f"x{i}", f"y{i}"]
+        units = {column: "s" if column == "time" else "m" for column in columns}
+        params = {
+            "engine": "newton", "bodies": n, "target_time": target_time, "dt": dt, "save_every": save_every, "G": G,
+            "force": force, "theta": theta, "integrator": integrator, "adaptive": adaptive, "eta": eta, "dt_min": dt_min,
+            "capture_radius": capture_radius, "escape_radius": escape_radius, "apsides": apsides,
+            "post_newtonian": post_newtonian, "c": c,
+        }
+        # A checkpoint only fits the same initial state and the same chunk boundaries
+        initial_state = hashlib.sha256(masses.tobytes() + positions.tobytes() + velocities.tobytes()).hexdigest()
+        checkpoint_params = dict(params, chunk_size=int(chunk_size), initial_state=initial_state)
+        key = None
+        cached = None
+        if cache and not resume:
+            key = cache_key(checkpoint_params, engine_version(*ENGINE_SOURCES))
+            cached = cache_lookup(key, output, cache_dir(cache))
+    if cached is not None:
+        print(f"Newton method loaded from cache: {key[:12]}")
+        finish_metrics(metrics, instrument, cached=True)
+        return cached["positions"], cached["velocities"], read_events(output)
+
+    sim_time = 0.0
+    counter = 0
+    total_steps = 0
+    status = STATUS_FINISHED
+    event_t = []
+    event_kind = []
+    chunk_event_t = np.empty(64)
+    chunk_event_kind = np.empty(64, dtype=np.int64)
+    # Quadtree arrays handed to every chunk, a direct run gets the smallest ones
+    workspace = barnes_hut.allocate_quadtree(n if force == "tree" else 0)
+    resume_rows = None
+    if resume:
+        with instrument.phase("checkpoint"):
+            state = load_checkpoint(output, checkpoint_params)
+        sim_time = float(state["sim_time"])
+        counter = int(state["counter"])
+        total_steps = int(state["steps"])
+        positions[:] = state["positions"]
+        velocities[:] = state["velocities"]
+        resume_rows = int(state["rows"])
+        event_t = [state["event_t"]]
+        event_kind = [state["event_kind"]]
+
+    with TrajectoryWriter(output, columns, units, params, resume_rows) as writer, \
+            BackgroundWriter(writer, (int(chunk_size), 1 + 2 * n), buffers, backpressure) as background:
+        last_checkpoint = time.time()
+
+        while sim_time < target_time and status == STATUS_FINISHED:
+            # write is the time spent waiting for the background writer
+            with instrument.phase("write"):
+                out = background.acquire()
+            with instrument.phase("integrate"):
+                sim_time, counter, saved, steps, events, status = integrate_nbody_chunk(
+                    float(G), masses, positions, velocities, acc,
+                    sim_time, float(target_time), float(dt), int(save_every), counter, out,
+                    FORCE_MODES[force], float(theta), float(c), POST_NEWTONIAN[post_newtonian], INTEGRATORS[integrator],
+                    bool(adaptive), float(eta), float(dt_min),
+                    float(capture_radius), float(escape_radius), bool(apsides), chunk_event_t, chunk_event_kind, *workspace
+                )
+            total_steps += steps
+            with instrument.phase("write"):
+                background.submit(out, saved)
+            event_t.append(chunk_event_t[:events].copy())
+            event_kind.append(chunk_event_kind[:events].copy())
+            # leapfrog and wisdom_holman start every chunk with an evaluation of their own
+            instrument.count("steps", steps)
+            instrument.count("rhs_evaluations", steps * FORCE_EVALUATIONS[integrator] + (integrator in ("leapfrog", "verlet", "wisdom_holman")))
+            instrument.count("rows", saved)
+            instrument.count("chunks")
+            instrument.count("events", events)
+            instrument.update(sim_time)
+
+            if checkpoint_every is not None and time.time() - last_checkpoint >= checkpoint_every:
+                with instrument.phase("checkpoint"):
+                    background.sync()
+                    save_checkpoint(output, checkpoint_params, sim_time=sim_time, counter=counter, steps=total_steps,
+                                    positions=positions, velocities=velocities, rows=writer.rows,
+                                    event_t=np.concatenate(event_t), event_kind=np.concatenate(event_kind))
+                instrument.count("checkpoints")
+                last_checkpoint = time.time()
+        instrument.update(sim_time, final=True)
+        with instrument.phase("write"):
+            background.sync()
+
+    with instrument.phase("postprocess"):
+        remove_checkpoint(output)
+
+        # Events in time order, by name
+        event_t = np.concatenate(event_t)
+        event_kind = np.concatenate(event_kind)
+        order = np.argsort(event_t, kind="stable")
+        events = {name: event_t[order][event_kind[order] == kind] for kind, name in EVENT_NAMES.items()}
+        np.savez(os.path.join(output, "events.npz"), **events)
+        if status != STATUS_FINISHED:
+            print(f"Newton method stopped at t = {sim_time}s: {EVENT_NAMES[status]}")
+        if key is not None:
+            cache_store(key, output, {"positions": positions, "velocities": velocities}, {"engine": "newton", "params": params}, cache_dir(cache))
+
+    elapsed = time.time() - start_time
+    print(f"Newton method finished in: {elapsed}s ({total_steps / elapsed:.3e} steps/s)")
+    finish_metrics(metrics, instrument)
+    return positions, velocities, events
+
+
+def simulate_newton_ensemble(mass1, position1, velocity1, mass2, position2, velocity2, target_time: float, dt: float, G: float = 6.67430e-11, integrator: str = "euler", adaptive: bool = False, eta: float = 0.01, capture_radius: float = 0.0, escape_radius: float = np.inf, output: str = "Newton_ensemble.npz", post_newtonian: str = None, c: float = 299792458):
+    # Many two-body runs in one batched kernel call: every argument may be a scalar / (2,)
+    # vector or one value per member ((M,) masses, (M, 2) positions and velocities), they
+    # are broadcast against each other. A member stops on its own once the separation
+    # falls below capture_radius or exceeds escape_radius. Only a compact summary per
+    # member is kept: status (0 reached target_time, 1 captured, 2 escaped), end time,
+    # final positions and velocities, closest approach and the number of steps.
+    # post_newtonian as in simulate_nbody
+    if integrator not in INTEGRATORS:
+        raise ValueError(f"Unknown integrator: {integrator}")
+    check_post_newtonian(post_newtonian, integrator, "direct")
+    if adaptive and integrator == "wisdom_holman":
+        raise ValueError("Adaptive steps are not supported by the wisdom_holman integrator.")
+    start_time = time.time()
+
+    mass1, mass2 = np.broadcast_arrays(np.asarray(mass1, dtype=np.float64), np.asarray(mass2, dtype=np.float64))
+    vectors = np.broadcast_arrays(*[np.asarray(v, dtype=np.float64) for v in (position1, velocity1, position2, velocity2)])
+    members = np.broadcast_shapes(mass1.shape, vectors[0].shape[:-1])
+    members = members[0] if members else 1
+
+    masses = np.array(np.broadcast_to(np.stack((mass1, mass2), axis=-1), (members, 2)), order="C")
+    positions = np.array(np.broadcast_to(np.stack((vectors[0], vectors[2]), axis=-2), (members, 2, 2)), order="C")
+    velocities = np.array(np.broadcast_to(np.stack((vectors[1], vectors[3]), axis=-2), (members, 2, 2)), order="C")
+
+    status = np.empty(members, dtype=np.int64)
+    end_time = np.empty(members)
+    r_min = np.empty(members)
+    t_r_min = np.empty(members)
+    steps = np.empty(members, dtype=np.int64)
+    integrate_two_body_ensemble(
+        float(G), masses, positions, velocities, float(target_time), float(dt), float(c), POST_NEWTONIAN[post_newtonian], INTEGRATORS[integrator],
+        bool(adaptive), float(eta), float(dt) * 1e-9, float(capture_radius), float(escape_radius),
+        status, end_time, r_min, t_r_min, steps
+    )
+
+    results = {
+        "status": status,
+        "time": end_time,
+        "x1": positions[:, 0, 0], "y1": positions[:, 0, 1],
+        "x2": positions[:, 1, 0], "y2": positions[:, 1, 1],
+        "vx1": velocities[:, 0, 0], "vy1": velocities[:, 0, 1],
+        "vx2": velocities[:, 1, 0], "vy2": velocities[:, 1, 1],
+        "r_min": r_min,
+        "t_r_min": t_r_min,
+        "steps": steps,
+    }
+    if output is not None:
+        np.savez(output, **results)
+
+    elapsed = time.time() - start_time
+    print(f"Newton ensemble of {members} members finished in: {elapsed}s ({np.sum(steps) / elapsed:.3e} steps/s)")
+    return results
+
+
+def simulate_newton(mass1: int, position1: list, velocity1: list, mass2: int, position2: list, velocity2: list, target_time: float, dt: float, save_every: int = 100, G: float = 6.67430e-11, mode: str = "kernel", chunk_size: int = 10000, integrator: str = "euler", adaptive: bool = False, eta: float = 0.01, capture_radius: float = 0.0, escape_radius: float = np.inf, output: str = "Newton.traj", buffers: int = 2, backpressure: str = "block", checkpoint_every: float = None, resume: bool = False, apsides: bool = False, post_newtonian: str = None, c: float = 299792458, cache=False, metrics=None, progress=None):
+    # Two-body wrapper around simulate_nbody (mode="kernel"), mode="python" is the
+    # original per-step loop driven from Python. Returns {event name: times}, always
+    # empty in the python mode.
+    # Passing one initial condition per member ((M,) masses or (M, 2) positions /
+    # velocities) runs simulate_newton_ensemble instead and returns its per-member
+    # summary, capture_radius / escape_radius are then the stopping distances of every
+    # member and output the .npz summary, the options it lacks (save_every, mode, the
+    # output chunks and buffers, checkpoints, apsides, cache, metrics, progress) raise a
+    # ValueError. In the kernel mode they, and apsides, are the events of simulate_nbody.
+    # post_newtonian adds the post-Newtonian corrections of simulate_nbody (kernel mode),
+    # "1pn" gives the relativistic perihelion advance at the cost of a Newton run, cache
+    # reuses identical earlier runs (kernel mode), metrics and progress as in
+    # simulate_nbody (the python mode counts its output into the integrate phase)
+    if np.ndim(mass1) > 0 or np.ndim(mass2) > 0 or max(np.ndim(v) for v in (position1, velocity1, position2, velocity2)) > 1:
+        unsupported = [name for name, value in (("checkpoint_every", checkpoint_every), ("metrics", metrics), ("progress", progress)) if value is not None]
+        unsupported += [name for name, value in (("save_every", save_every != 100), ("mode", mode != "kernel"), ("chunk_size", chunk_size != 10000), ("buffers", buffers != 2),
+                                                 ("backpressure", backpressure != "block"), ("resume", resume), ("apsides", apsides), ("cache", cache)) if value]
+        if unsupported:
+            raise ValueError(f"Arrays of initial conditions (simulate_newton_ensemble) do not support: {', '.join(unsupported)}")
+        return simulate_newton_ensemble(mass1, position1, velocity1, mass2, position2, velocity2, target_time, dt, G, integrator, adaptive, eta, capture_radius, escape_radius, output,
+                                        post_newtonian=post_newtonian, c=c)
+    if mode not in ("kernel", "python"):
+        raise ValueError(f"Unknown mode: {mode}")
+    if mode == "python" and (integrator != "euler" or adaptive):
+        raise ValueError("The python mode only implements the fixed-step euler integrator.")
+    if mode == "python" and (checkpoint_every is not None or resume):
+        raise ValueError("Checkpoints are only supported by the kernel mode.")
+    if mode == "python" and (capture_radius > 0 or escape_radius < np.inf or apsides):
+        raise ValueError("Events are only supported by the kernel mode.")
+    if mode == "python" and cache:
+        raise ValueError("The result cache is only supported by the kernel mode.")
+    if mode == "python" and post_newtonian is not None:
+        raise ValueError("Post-Newtonian corrections are only supported by the kernel mode.")
 
     class Body:
         def __init__(self, mass, position, velocity):
-            self.mass = mass
+            self.mass = float(mass)
             self.position = np.array(position, dtype=np.float64)
             self.velocity = np.array(velocity, dtype=np.float64)
             self.force_vector = np.zeros(2, dtype=np.float64)
 
         def calculate_gravitational_force_wrap(self, other):
             self_force_vector, other_force_vector = calculate_gravitational_force(
-                self.mass, self.position, other.mass, other.position
+                G, self.mass, self.position, other.mass, other.position
             )
             other.set_gravitational_force(other_force_vector)
             self.set_gravitational_force(self_force_vector)
@@ -56,7 +314,7 @@ def simulate_newton(mass1: int, position1: list, velocity1: list, mass2: int, po
 
         def export_data(self):
             return self.position, self.velocity
-    
+
     start_time = time.time()
 
     body1 = Body(
@@ -71,12 +329,25 @@ def simulate_newton(mass1: int, position1: list, velocity1: list, mass2: int, po
         velocity=velocity2
     )
 
-    with open("Newton.csv", "w", newline="") as file:
-        writer = csv.writer(file)
-        buffer = []
-        buffer_size = 1e4
+    if mode == "kernel":
+        masses = [mass1, mass2]
+        positions = [position1, position2]
+        velocities = [velocity1, velocity2]
+        _, _, events = simulate_nbody(masses, positions, velocities, target_time, dt, save_every, G, chunk_size, integrator=integrator, adaptive=adaptive, eta=eta, output=output, buffers=buffers, backpressure=backpressure, checkpoint_every=checkpoint_every, resume=resume,
+                       capture_radius=capture_radius, escape_radius=escape_radius, apsides=apsides, post_newtonian=post_newtonian, c=c, cache=cache, metrics=metrics, progress=progress)
+        return events
+
+    instrument = run_metrics(metrics, progress)
+    instrument.start("newton", target_time)
+    total_steps = 0
+    columns = ["time", "x1", "y1", "x2", "y2"]
+    units = {"time": "s", "x1": "m", "y1": "m", "x2": "m", "y2": "m"}
+    params = {"engine": "newton", "bodies": 2, "target_time": target_time, "dt": dt, "save_every": save_every, "G": G, "integrator": "euler"}
+    with TrajectoryWriter(output, columns, units, params) as writer, \
+            BackgroundWriter(writer, (int(chunk_size), len(columns))) as background, instrument.phase("integrate"):
+        buffer = background.acquire()
+        rows = 0
         sim_time = 0.0
-        writer.writerow(["time","x1","y1","x2","y2"])
         counter = 0
 
         while sim_time<target_time:
@@ -90,24 +361,34 @@ def simulate_newton(mass1: int, position1: list, velocity1: list, mass2: int, po
             
             sim_time += dt
             counter +=1
+            total_steps += 1
             body1.update_position_wrap(dt)
             body2.update_position_wrap(dt)
 
             if counter == save_every:
-                data = [sim_time, body1.position[0], body1.position[1], body2.position[0], body2.position[1]]
-                buffer.append(data)
+                buffer[rows] = (sim_time, body1.position[0], body1.position[1], body2.position[0], body2.position[1])
+                rows += 1
                 counter = 0
 
             #print(sim_time)
 
-            if len(buffer) >= buffer_size:
-                writer.writerows(buffer)
-                buffer.clear()
+            if rows == buffer.shape[0]:
+                background.submit(buffer, rows)
+                buffer = background.acquire()
+                rows = 0
+                instrument.counters["steps"] = total_steps
+                instrument.update(sim_time)
 
-        if buffer:
-            writer.writerows(buffer)                    
+        background.submit(buffer, rows)                    
+        instrument.counters["steps"] = total_steps
+        instrument.update(sim_time, final=True)
             
-    print(f"Newton method finished in: {time.time() - start_time}s")
+    elapsed = time.time() - start_time
+    print(f"Newton method finished in: {elapsed}s ({total_steps / elapsed:.3e} steps/s)")
+    instrument.count("rhs_evaluations", total_steps)
+    instrument.count("rows", writer.rows)
+    finish_metrics(metrics, instrument)
+    return {name: np.empty(0) for name in EVENT_NAMES.values()}
 
 
 if __name__ == "__main__":
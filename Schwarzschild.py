@@ -1,19 +1,165 @@
 import numpy as np
-from scipy.integrate import solve_ivp
+from scipy.integrate import DOP853
 import matplotlib.pyplot as plt
-import csv, time
+import time, os
+from trajectory import TrajectoryWriter, open_trajectory, read_events
+from checkpoint import save_checkpoint, load_checkpoint, remove_checkpoint
+from cache import cache_dir, cache_key, cache_lookup, cache_store, engine_version
+from metrics import run_metrics, finish_metrics
+import gr_kernels, orbit, newton_kernels
+from gr_kernels import integrate_ensemble, integrate_dense_chunk, integrate_encke_chunk, evaluate_rhs, select_initial_step, sample_count, sample_time
+from gr_kernels import EQUATIONS_SCHWARZSCHILD, EQUATIONS_EDDINGTON_FINKELSTEIN, EQUATIONS_ENCKE, STATUS_RUNNING, STATUS_FAILED, N_STAGES
+from gr_kernels import EVENT_HORIZON, EVENT_ESCAPE, EVENT_PERIAPSIS, EVENT_APOAPSIS, event_crossed
+from orbit import SchwarzschildOrbit
 
+# Sources whose hash versions the cached GR results
+ENGINE_SOURCES = (os.path.abspath(__file__), gr_kernels.__file__, orbit.__file__, newton_kernels.__file__)
 
+EVENT_NAMES = {EVENT_HORIZON: "horizon", EVENT_ESCAPE: "escape", EVENT_PERIAPSIS: "periapsis", EVENT_APOAPSIS: "apoapsis"}
+# Formulations of the equations of motion, the coordinates argument of simulate_GR
+COORDINATES = {"schwarzschild": EQUATIONS_SCHWARZSCHILD, "eddington_finkelstein": EQUATIONS_EDDINGTON_FINKELSTEIN}
 
-def simulate_GR(m_neutron: int, x0: float, y0: float, vx0: float, vy0: float, Rs: float, target_time: float, resolution: float, save_every: int = 100, c=299792458):
 
-    # Convert Cartesian coordinates to polar coordinates
-    def cartesian_to_polar(x, y, vx, vy, mass):
-        r = np.sqrt(x**2 + y**2)
-        phi = np.arctan2(y, x)
-        pr = mass * (vx * np.cos(phi) + vy * np.sin(phi))
-        pphi = mass * r * (-vx * np.sin(phi) + vy * np.cos(phi))
-        return r, phi, pr, pphi
+# Convert Cartesian coordinates to polar coordinates
+def cartesian_to_polar(x, y, vx, vy, mass):
+    r = np.sqrt(x**2 + y**2)
+    phi = np.arctan2(y, x)
+    pr = mass * (vx * np.cos(phi) + vy * np.sin(phi))
+    pphi = mass * r * (-vx * np.sin(phi) + vy * np.cos(phi))
+    return r, phi, pr, pphi
+
+
+def lorentz_factor(r, pr, pphi, mass, Rs, c):
+    f = 1 - Rs / r  # Schwarzschild metric coefficient
+    # dr/dt is infinite at r = Rs, which the eddington_finkelstein formulation reaches,
+    # the cap below applies there
+    with np.errstate(divide="ignore"):
+        dr_dt = pr / (mass * f)
+    dphi_dt = pphi / (mass * r**2)
+    v = np.sqrt(dr_dt**2 + (r * dphi_dt)**2)
+    v = np.minimum(v, c - 1e-7)
+    return 1 / np.sqrt(1 - v**2 / c**2)
+
+
+def analytic_orbit(m_neutron: float, x0: float, y0: float, vx0: float, vy0: float, Rs: float, c=299792458, coordinates: str = "schwarzschild"):
+    # Semi-analytic evaluator of the orbit simulate_GR integrates from the same initial
+    # conditions, see orbit.py. Bound and scattering orbits only
+    if coordinates not in COORDINATES:
+        raise ValueError(f"Unknown coordinates: {coordinates}")
+    state = cartesian_to_polar(x0, y0, vx0, vy0, m_neutron)
+    return SchwarzschildOrbit(state, Rs, c, coordinates, m_neutron)
+
+
+def simulate_GR_ensemble(m_neutron: float, x0, y0, vx0, vy0, Rs: float, target_time: float, capture_radius: float = None, escape_radius: float = np.inf, c=299792458, output: str = "GR_ensemble.npz", coordinates: str = "schwarzschild"):
+    # Many initial conditions in one batched kernel call: x0, y0, vx0, vy0 are broadcast
+    # against each other and every member is integrated with its own compiled DOP853
+    # steps (same tolerances as simulate_GR) on all cores. A member stops as soon as r
+    # drops to capture_radius (default just outside Rs, where the coordinate-time
+    # equations stop being integrable) or reaches escape_radius. Only a compact summary
+    # per member is kept: status (0 reached target_time, 1 captured, 2 escaped, 3 solver
+    # failure), end time, final position and Lorentz factor, closest approach, step counts.
+    # coordinates as in simulate_GR
+    start_time = time.time()
+    if coordinates not in COORDINATES:
+        raise ValueError(f"Unknown coordinates: {coordinates}")
+    if capture_radius is None:
+        capture_radius = (1.001 if coordinates == "schwarzschild" else 1.0) * Rs
+
+    x0, y0, vx0, vy0 = [np.ravel(a).astype(np.float64) for a in np.broadcast_arrays(x0, y0, vx0, vy0)]
+    state0 = np.ascontiguousarray(np.column_stack(cartesian_to_polar(x0, y0, vx0, vy0, m_neutron)))
+    members = state0.shape[0]
+
+    status = np.empty(members, dtype=np.int64)
+    end_time = np.empty(members)
+    state = np.empty_like(state0)
+    r_min = np.empty(members)
+    t_r_min = np.empty(members)
+    steps = np.empty(members, dtype=np.int64)
+    nfev = np.empty(members, dtype=np.int64)
+    params = np.array([m_neutron, Rs, c], dtype=np.float64)
+    integrate_ensemble(
+        COORDINATES[coordinates], params, state0, float(target_time), 2.220446049250313e-14, 1e-21,
+        float(capture_radius), float(escape_radius), status, end_time, state, r_min, t_r_min, steps, nfev
+    )
+
+    r, phi = state[:, 0], state[:, 1]
+    results = {
+        "status": status,
+        "time": end_time,
+        "x": r * np.cos(phi),
+        "y": r * np.sin(phi),
+        "lorentz_factor": lorentz_factor(state[:, 0], state[:, 2], state[:, 3], m_neutron, Rs, c),
+        "r_min": r_min,
+        "t_r_min": t_r_min,
+        "steps": steps,
+        "nfev": nfev,
+    }
+    if output is not None:
+        np.savez(output, **results)
+
+    print(f"GR ensemble of {members} members finished in: {time.time() - start_time}s")
+    return results
+
+
+def simulate_GR(m_neutron: int, x0: float, y0: float, vx0: float, vy0: float, Rs: float, target_time: float, resolution: float, save_every: int = 100, c=299792458, output: str = "GR.traj", checkpoint_every: float = None, resume: bool = False, chunk_size: int = 100000, backend: str = "compiled", capture_radius: float = None, escape_radius: float = np.inf, apsides: bool = False, coordinates: str = "schwarzschild", encke_rtol: float = 1e-9, rtol: float = None, atol: float = None, cache=False, metrics=None, progress=None):
+    # Arrays of initial conditions run as one batched ensemble, see simulate_GR_ensemble,
+    # with the same capture_radius, escape_radius and output (the .npz summary) and
+    # returning its summary; the options it lacks (backend, tolerances, checkpoints,
+    # apsides, cache, metrics, progress) raise a ValueError there.
+    # backend="compiled" integrates in gr_kernels.integrate_dense_chunk (equations and
+    # DOP853 stepper compiled, no Python call per stage), backend="scipy" takes the
+    # scipy DOP853 steps one by one exactly as solve_ivp would, backend="analytic"
+    # evaluates the samples from the orbit equation instead (analytic_orbit, bound and
+    # scattering orbits that stay clear of capture_radius, no checkpoints) and
+    # backend="encke" integrates, compiled, only the deviation from an osculating Kepler
+    # orbit that is rectified when the deviation grows (gr_kernels.encke_rhs), at
+    # encke_rtol on the deviation instead of 2.2e-14 on the full motion, which suits
+    # weakly relativistic orbits (schwarzschild coordinates only). Either way every
+    # save_every-th of the `resolution` evenly spaced samples is written to output once
+    # chunk_size of them are buffered. The sample grid is generated on the fly and the
+    # Cartesian coordinates and Lorentz factors are only derived for the kept samples, so
+    # peak memory is set by chunk_size, not by resolution.
+    # checkpoint_every (wall-clock seconds) snapshots [r, phi, pr, pphi], the time, the
+    # next step size and the output offset into output/checkpoint.npz, resume=True
+    # continues from it bit-for-bit and appends to output.
+    # Events are located on the dense output to double precision: the run stops when r
+    # falls to capture_radius (default just outside Rs, where the coordinate-time
+    # equations stop being integrable) or rises to escape_radius, apsides=True records
+    # periapsis / apoapsis passages. Returns {event name: times}, also saved to
+    # output/events.npz.
+    # coordinates="eddington_finkelstein" integrates the same equations of motion from the
+    # same initial state with the light-cone time T = t - (r - r0) / c as the independent
+    # variable (gr_kernels.eddington_finkelstein_rhs), in which they stay regular across
+    # r = Rs, so an infall takes a bounded number of steps (the run stops at the horizon
+    # by default, a smaller capture_radius follows the particle inside). Outside the
+    # horizon the orbit is the one of the default formulation, only the time column and
+    # the events hold T, which is coordinate time up to the light-travel time between r0
+    # and r. The exact timelike geodesic is orbit.py's geodesic formulation.
+    # rtol / atol replace the backend's tolerances (2.2e-14 / 1e-21, the encke backend
+    # encke_rtol / 1e-15 on the deviation), tuner.py picks the loosest that is accurate
+    # enough for a scenario.
+    # cache=True (or a cache directory) reuses the result of an identical earlier run,
+    # keyed on all inputs and the engine version, see cache.py
+    # metrics (a metrics.RunMetrics, or a path for its JSON) records phase timings, step,
+    # evaluation and rejected step counters, throughput and peak memory of the run,
+    # progress is called with a metrics.Progress (fraction done, ETA) as it integrates
+    if coordinates not in COORDINATES:
+        raise ValueError(f"Unknown coordinates: {coordinates}")
+    if max(np.ndim(a) for a in (x0, y0, vx0, vy0)) > 0:
+        unsupported = [name for name, value in (("checkpoint_every", checkpoint_every), ("rtol", rtol), ("atol", atol), ("metrics", metrics), ("progress", progress)) if value is not None]
+        unsupported += [name for name, value in (("resume", resume), ("apsides", apsides), ("cache", cache), ("backend", backend != "compiled")) if value]
+        if unsupported:
+            raise ValueError(f"Arrays of initial conditions (simulate_GR_ensemble) do not support: {', '.join(unsupported)}")
+        return simulate_GR_ensemble(m_neutron, x0, y0, vx0, vy0, Rs, target_time, capture_radius, escape_radius, c, output, coordinates)
+    if backend not in ("compiled", "scipy", "analytic", "encke"):
+        raise ValueError(f"Unknown backend: {backend}")
+    if backend == "encke" and coordinates != "schwarzschild":
+        raise ValueError("The encke backend only integrates the schwarzschild formulation.")
+    if backend == "analytic" and (checkpoint_every is not None or resume):
+        raise ValueError("Checkpoints are only supported by the compiled and scipy backends.")
+    if capture_radius is None:
+        capture_radius = (1.001 if coordinates == "schwarzschild" else 1.0) * Rs
+    equations = COORDINATES[coordinates]
 
     # Equations of motion in Schwarzschild spacetime
     def geodesic_equations(t, y, mass, Rs):
@@ -33,61 +179,284 @@ def simulate_GR(m_neutron: int, x0: float, y0: float, vx0: float, vy0: float, Rs
         return [dr_dt, dphi_dt, dpr_dt, dpphi_dt]
 
     start_time = time.time()
-    # Convert to polar coordinates
-    r0, phi0, pr0, pphi0 = cartesian_to_polar(x0, y0, vx0, vy0, m_neutron)
-
-    # Initial state vector
-    y0 = [r0, phi0, pr0, pphi0]
-
-    # Time span for integration
-    t_span = (0, target_time)
-    t_eval = np.linspace(t_span[0], t_span[1], int(resolution))
-
-    # Solve the system using solve_ivp
-    sol = solve_ivp(
-        geodesic_equations,
-        t_span,
-        y0,
-        method='DOP853',
-        t_eval=t_eval,
-        args=(m_neutron, Rs,),
-        rtol=2.220446049250313e-14,
-        atol=1e-21
+    instrument = run_metrics(metrics, progress)
+    instrument.start("schwarzschild", target_time)
+    with instrument.phase("setup"):
+        # Run parameters recorded in the trajectory header
+        params = {
+            "engine": "schwarzschild", "mass": m_neutron, "x0": x0, "y0": y0, "vx0": vx0, "vy0": vy0, "Rs": Rs, "c": c,
+            "target_time": target_time, "resolution": resolution, "save_every": save_every,
+            "method": "DOP853", "rtol": 2.220446049250313e-14, "atol": 1e-21, "backend": backend,
+            "capture_radius": capture_radius, "escape_radius": escape_radius, "apsides": apsides,
+            "coordinates": coordinates,
+        }
+        if backend == "encke":
+            # On the deviation scaled by the initial distance and speed
+            params["rtol"], params["atol"] = encke_rtol, 1e-15
+        if rtol is not None:
+            params["rtol"] = rtol
+        if atol is not None:
+            params["atol"] = atol
+        rtol, atol = params["rtol"], params["atol"]
+        key = None
+        cached = False
+        if cache and not resume:
+            key = cache_key(params, engine_version(*ENGINE_SOURCES))
+            cached = cache_lookup(key, output, cache_dir(cache)) is not None
+    if cached:
+        print(f"GR method loaded from cache: {key[:12]}")
+        finish_metrics(metrics, instrument, cached=True)
+        return read_events(output)
 
-    )
+    with instrument.phase("setup"):
+        # Initial state vector, [r, phi, pr, pphi]
+        y0 = list(cartesian_to_polar(x0, y0, vx0, vy0, m_neutron))
+        t0 = 0.0
+        first_step = None
+        equation_params = np.array([m_neutron, Rs, c], dtype=np.float64)
+        if backend == "encke":
+            # Kepler reference osculating at the start, the deviation starts at zero
+            r0, phi0, pr0, pphi0 = y0
+            r_dot = pr0 / (m_neutron * (1 - Rs / r0))
+            phi_dot = pphi0 / (m_neutron * r0**2)
+            velocity = (r_dot * np.cos(phi0) - r0 * phi_dot * np.sin(phi0), r_dot * np.sin(phi0) + r0 * phi_dot * np.cos(phi0))
+            equation_params = np.array([m_neutron, Rs, c, 0.0, r0 * np.cos(phi0), r0 * np.sin(phi0), velocity[0], velocity[1],
+                                        r0, np.hypot(*velocity)], dtype=np.float64)
+            y0 = [0.0, 0.0, 0.0, 0.0]
 
-    print(f"GR method solved in: {time.time() - start_time}s")
+        # Output times are np.linspace(0, target_time, resolution), never materialised,
+        # sample t_eval_i is kept when t_eval_i % save_every == 0
+        no_t_eval = np.empty(0)
+        n_samples = int(resolution)
+        t_eval_i = 0
+        event_t = []
+        event_kind = []
+        resume_rows = None
+        if resume:
+            state = load_checkpoint(output, params)
+            t0 = float(state["t"])
+            y0 = state["y"]
+            first_step = float(state["h_abs"])
+            t_eval_i = int(state["t_eval_i"])
+            resume_rows = int(state["rows"])
+            event_t = [state["event_t"]]
+            event_kind = [state["event_kind"]]
+            if backend == "encke":
+                equation_params = state["reference"]
 
-    # Extract results
-    r, phi = sol.y[0], sol.y[1]
-    pr, pphi = sol.y[2], sol.y[3]
-    times = sol.t
+    columns = ["time", "x", "y", "lorentz_factor"]
+    units = {"time": "s", "x": "m", "y": "m", "lorentz_factor": ""}
+    times = []
+    states = []
+    buffered = 0
 
-    # Compute Cartesian coordinates
-    x = r * np.cos(phi)
-    y = r * np.sin(phi)
+    def write_samples(writer):
+        # Cartesian coordinates and Lorentz factors of the buffered samples
+        nonlocal buffered
+        if not times:
+            return
+        with instrument.phase("write"):
+            t = np.concatenate(times)
+            state = np.concatenate(states, axis=1)
+            r, phi = state[0], state[1]
+            writer.append_columns(t, r * np.cos(phi), r * np.sin(phi), lorentz_factor(state[0], state[2], state[3], m_neutron, Rs, c))
+            writer.flush()
+        instrument.count("rows", len(t))
+        times.clear()
+        states.clear()
+        buffered = 0
 
-    # Compute Lorentz factor
-    f = 1 - Rs / r  # Schwarzschild metric coefficient
-    dr_dt = pr / (m_neutron * f)
-    dphi_dt = pphi / (m_neutron * r**2)
-    v = np.sqrt(dr_dt**2 + (r * dphi_dt)**2)
-    v = np.minimum(v, c - 1e-7)
-    lorentz_factors = 1 / np.sqrt(1 - v**2 / c**2)
+    with TrajectoryWriter(output, columns, units, params, resume_rows) as writer:
+        last_checkpoint = time.time()
+
+        def checkpoint(t, y, h_abs):
+            nonlocal last_checkpoint
+            if checkpoint_every is None or time.time() - last_checkpoint < checkpoint_every:
+                return
+            write_samples(writer)
+            with instrument.phase("checkpoint"):
+                extra = {"reference": equation_params} if backend == "encke" else {}
+                save_checkpoint(output, params, t=t, y=y, h_abs=h_abs, t_eval_i=t_eval_i, rows=writer.rows, **extra,
+                                event_t=np.concatenate(event_t + [np.empty(0)]), event_kind=np.concatenate(event_kind + [np.empty(0, dtype=np.int64)]))
+            instrument.count("checkpoints")
+            last_checkpoint = time.time()
+
+        if backend in ("compiled", "encke"):
+            if backend == "encke":
+                equations = EQUATIONS_ENCKE
+            with instrument.phase("setup"):
+                t = t0
+                y = np.array(y0, dtype=np.float64)
+                f = np.empty_like(y)
+                evaluate_rhs(equations, t, y, equation_params, f)
+                h_abs = first_step
+                if h_abs is None:
+                    h_abs = select_initial_step(equations, equation_params, t, y, f, float(target_time), rtol, atol)
+            # The initial evaluation and, without a checkpoint, the two of the initial step
+            instrument.count("rhs_evaluations", 1 if first_step is not None else 3)
+
+            status = STATUS_RUNNING
+            rectifications = 0
+            while status == STATUS_RUNNING:
+                with instrument.phase("integrate"):
+                    if backend == "encke":
+                        t, h_abs, t_eval_i, status, steps, nfev, rejected, kept_t, kept_y, chunk_event_t, chunk_event_kind, chunk_rectifications = integrate_encke_chunk(
+                            equation_params, t, y, f, h_abs, float(target_time), rtol, atol,
+                            no_t_eval, n_samples, t_eval_i, int(save_every), int(chunk_size),
+                            float(capture_radius), float(escape_radius), bool(apsides)
+                        )
+                        rectifications += chunk_rectifications
+                    else:
+                        t, h_abs, t_eval_i, status, steps, nfev, rejected, kept_t, kept_y, chunk_event_t, chunk_event_kind = integrate_dense_chunk(
+                            equations, equation_params, t, y, f, h_abs, float(target_time), rtol, atol,
+                            no_t_eval, n_samples, t_eval_i, int(save_every), int(chunk_size),
+                            float(capture_radius), float(escape_radius), bool(apsides)
+                        )
+                instrument.count("steps", steps)
+                instrument.count("rhs_evaluations", nfev)
+                instrument.count("rejected_steps", rejected)
+                instrument.count("chunks")
+                instrument.update(t)
+                event_t.append(chunk_event_t)
+                event_kind.append(chunk_event_kind)
+                times.append(kept_t)
+                states.append(kept_y.T)
+                write_samples(writer)
+                checkpoint(t, y, h_abs)
+            if status == STATUS_FAILED:
+                print(f"GR method stopped at t = {t}s: required step size is less than spacing between numbers.")
+            if backend == "encke":
+                instrument.count("rectifications", rectifications)
+            instrument.update(t, final=True)
+            print(f"GR method took {instrument.counters['steps']} steps" + (f", {rectifications} rectifications" if backend == "encke" else ""))
+
+        elif backend == "analytic":
+            with instrument.phase("integrate"):
+                orbit = SchwarzschildOrbit(y0, Rs, c, coordinates, m_neutron)
+                if orbit.periapsis <= capture_radius:
+                    raise ValueError("The orbit reaches capture_radius, use the compiled or scipy backend.")
+                t_stop = min(orbit.escape_time(escape_radius), float(target_time))
+                if t_stop < target_time:
+                    event_t.append(np.array([t_stop]))
+                    event_kind.append(np.array([EVENT_ESCAPE]))
+                if apsides:
+                    for kind, times_of_kind in zip((EVENT_PERIAPSIS, EVENT_APOAPSIS), orbit.apsis_times(t_stop)):
+                        event_t.append(times_of_kind)
+                        event_kind.append(np.full(len(times_of_kind), kind))
+
+            # Every save_every-th sample up to t_stop, chunk_size at a time
+            step = float(target_time) / (n_samples - 1) if n_samples > 1 else 0.0
+            kept = np.arange(0, sample_count(no_t_eval, n_samples, float(target_time), t_stop), save_every)
+            for start in range(0, len(kept), int(chunk_size)):
+                indices = kept[start:start + int(chunk_size)]
+                kept_t = indices * step
+                kept_t[indices == n_samples - 1] = float(target_time)
+                times.append(kept_t)
+                with instrument.phase("integrate"):
+                    states.append(np.array(orbit.states_at_times(kept_t)))
+                instrument.count("chunks")
+                write_samples(writer)
+                instrument.update(kept_t[-1])
+            instrument.update(t_stop, final=True)
 
-    # Write results to CSV (every 100th value)
-    with open("GR.csv", "w", newline="") as csvfile:
-        writer = csv.writer(csvfile)
-        # Write the header
-        writer.writerow(["Time (s)", "x (m)", "y (m)", "Lorentz Factor"])
-        # Write the data rows, taking every 100th value
-        for t, x_val, y_val, gamma in zip(times[::save_every], x[::save_every], y[::save_every], lorentz_factors[::save_every]):
-            writer.writerow([t, x_val, y_val, gamma])
+        else:
+            def eddington_finkelstein_equations(t, y):
+                dydt = np.empty(4)
+                evaluate_rhs(EQUATIONS_EDDINGTON_FINKELSTEIN, t, np.asarray(y, dtype=np.float64), equation_params, dydt)
+                return dydt
+
+            solver = DOP853(
+                eddington_finkelstein_equations if coordinates == "eddington_finkelstein" else lambda t, y: geodesic_equations(t, y, m_neutron, Rs),
+                t0,
+                y0,
+                target_time,
+                first_step=first_step,
+                rtol=rtol,
+                atol=atol
+            )
+            while solver.status == "running":
+                with instrument.phase("integrate"):
+                    y_old = solver.y
+                    nfev = solver.nfev
+                    message = solver.step()
+                    instrument.count("steps")
+                    # DOP853.step retries until it accepts, N_STAGES evaluations per attempt
+                    instrument.count("rejected_steps", (solver.nfev - nfev) // N_STAGES - 1)
+                    if solver.status == "failed":
+                        print(f"GR method stopped at t = {solver.t}s: {message}")
+                        break
+
+                    # Events inside the step, same bisection as gr_kernels.locate_event
+                    t_stop = solver.t
+                    stopped = False
+                    for kind in EVENT_NAMES:
+                        if kind in (EVENT_PERIAPSIS, EVENT_APOAPSIS) and not apsides:
+                            continue
+                        if event_crossed(kind, y_old, capture_radius, escape_radius) or not event_crossed(kind, solver.y, capture_radius, escape_radius):
+                            continue
+                        sol = solver.dense_output()
+                        lo, hi = solver.t_old, solver.t
+                        while lo < 0.5 * (lo + hi) < hi:
+                            mid = 0.5 * (lo + hi)
+                            if event_crossed(kind, sol(mid), capture_radius, escape_radius):
+                                hi = mid
+                            else:
+                                lo = mid
+                        if hi > t_stop:
+                            continue
+                        event_t.append(np.array([hi]))
+                        event_kind.append(np.array([kind]))
+                        if kind in (EVENT_HORIZON, EVENT_ESCAPE):
+                            t_stop = hi
+                            stopped = True
+
+                    # Samples passed by this step, from the step's dense output
+                    t_eval_i_new = sample_count(no_t_eval, n_samples, float(target_time), t_stop)
+                    first_kept = -(-t_eval_i // save_every) * save_every
+                    if first_kept < t_eval_i_new:
+                        kept = np.array([sample_time(no_t_eval, n_samples, float(target_time), i)
+                                         for i in range(first_kept, t_eval_i_new, save_every)])
+                        times.append(kept)
+                        states.append(solver.dense_output()(kept))
+                        buffered += len(kept)
+                    t_eval_i = t_eval_i_new
+
+                if stopped:
+                    break
+
+                if buffered >= chunk_size:
+                    write_samples(writer)
+                checkpoint(solver.t, solver.y, solver.h_abs)
+                instrument.update(solver.t)
+            instrument.update(solver.t, final=True)
+            instrument.count("rhs_evaluations", solver.nfev)
+
+        print(f"GR method solved in: {time.time() - start_time}s")
+        write_samples(writer)
+
+    with instrument.phase("postprocess"):
+        remove_checkpoint(output)
+
+        # Events in time order, by name
+        event_t = np.concatenate(event_t + [np.empty(0)])
+        event_kind = np.concatenate(event_kind + [np.empty(0, dtype=np.int64)])
+        order = np.argsort(event_t, kind="stable")
+        events = {name: event_t[order][event_kind[order] == kind] for kind, name in EVENT_NAMES.items()}
+        np.savez(os.path.join(output, "events.npz"), **events)
+        instrument.count("events", len(event_t))
+        for name in ("horizon", "escape"):
+            if len(events[name]):
+                print(f"GR method stopped at t = {events[name][0]}s: {name} reached")
+        if key is not None:
+            cache_store(key, output, {}, {"engine": "schwarzschild", "params": params}, cache_dir(cache))
 
     print(f"GR method finished in: {time.time() - start_time}s")
+    finish_metrics(metrics, instrument)
 
     if __name__ == "__main__":
         # Plot the trajectory
+        trajectory = open_trajectory(output)
+        x, y = trajectory["x"], trajectory["y"]
         plt.figure(figsize=(8, 8))
         plt.plot(x, y, label='Neutron Trajectory')
         plt.scatter(0, 0, color='black', label='Black Hole (Rs)')
@@ -103,6 +472,8 @@ def simulate_GR(m_neutron: int, x0: float, y0: float, vx0: float, vy0: float, Rs
         plt.grid()
         plt.show()
 
+    return events
+
 if __name__ == "__main__":
 
     # Constants
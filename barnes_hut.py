@@ -0,0 +1,249 @@
+import numpy as np
+from numba import njit, prange, float64, int64
+import time, sys
+
+# Barnes-Hut quadtree for the N-body engine. The tree is a set of flat arrays that is
+# rebuilt in place every step:
+#   child      (capacity, 4)  child node per quadrant, -1 if empty
+#   node_body  (capacity,)    first body of a leaf, -1 for an empty leaf, INTERNAL otherwise
+#   node_data  (capacity, 6)  mass, centre of mass x/y, cell centre x/y, cell half width
+#   next_body  (N,)           next body in the same leaf, only used below MAX_DEPTH
+# Cells are opened while their width / distance >= theta, theta = 0 gives the exact sum.
+
+INTERNAL = -2
+MAX_DEPTH = 48
+STACK_SIZE = 4 * (MAX_DEPTH + 2)
+
+
+def allocate_quadtree(n):
+    capacity = 4 * n + 64
+    child = np.empty((capacity, 4), dtype=np.int64)
+    node_body = np.empty(capacity, dtype=np.int64)
+    node_data = np.empty((capacity, 6), dtype=np.float64)
+    next_body = np.empty(n, dtype=np.int64)
+    return child, node_body, node_data, next_body
+
+
+@njit(int64(float64[::1], float64[:, ::1], int64[:, ::1], int64[::1], float64[:, ::1], int64[::1]), cache = True)
+def build_quadtree(masses, positions, child, node_body, node_data, next_body):
+    # Inserts every body and accumulates masses / centres of mass, returns the number of
+    # nodes used or -1 when the capacity of the arrays is exceeded
+    n = masses.shape[0]
+    capacity = node_body.shape[0]
+
+    min_x = positions[0, 0]
+    max_x = positions[0, 0]
+    min_y = positions[0, 1]
+    max_y = positions[0, 1]
+    for i in range(1, n):
+        min_x = min(min_x, positions[i, 0])
+        max_x = max(max_x, positions[i, 0])
+        min_y = min(min_y, positions[i, 1])
+        max_y = max(max_y, positions[i, 1])
+    half = 0.5 * max(max_x - min_x, max_y - min_y) * (1.0 + 1e-12) + 1e-300
+
+    count = 1
+    for k in range(4):
+        child[0, k] = -1
+    node_body[0] = -1
+    node_data[0, 3] = 0.5 * (min_x + max_x)
+    node_data[0, 4] = 0.5 * (min_y + max_y)
+    node_data[0, 5] = half
+
+    for i in range(n):
+        next_body[i] = -1
+        x = positions[i, 0]
+        y = positions[i, 1]
+        node = 0
+        depth = 0
+        while True:
+            if node_body[node] == INTERNAL:
+                quadrant = 0
+                if x >= node_data[node, 3]:
+                    quadrant += 1
+                if y >= node_data[node, 4]:
+                    quadrant += 2
+                next_node = child[node, quadrant]
+                if next_node == -1:
+                    if count == capacity:
+                        return -1
+                    next_node = count
+                    count += 1
+                    quarter = 0.5 * node_data[node, 5]
+                    for k in range(4):
+                        child[next_node, k] = -1
+                    node_body[next_node] = i
+                    node_data[next_node, 3] = node_data[node, 3] + (quarter if quadrant & 1 else -quarter)
+                    node_data[next_node, 4] = node_data[node, 4] + (quarter if quadrant & 2 else -quarter)
+                    node_data[next_node, 5] = quarter
+                    child[node, quadrant] = next_node
+                    break
+                node = next_node
+                depth += 1
+            elif node_body[node] == -1:
+                node_body[node] = i
+                break
+            elif depth >= MAX_DEPTH:
+                # (Nearly) coincident bodies, keep them together in one leaf
+                next_body[i] = node_body[node]
+                node_body[node] = i
+                break
+            else:
+                # Split the leaf: push its body one level down and retry from here
+                j = node_body[node]
+                quadrant = 0
+                if positions[j, 0] >= node_data[node, 3]:
+                    quadrant += 1
+                if positions[j, 1] >= node_data[node, 4]:
+                    quadrant += 2
+                if count == capacity:
+                    return -1
+                next_node = count
+                count += 1
+                quarter = 0.5 * node_data[node, 5]
+                for k in range(4):
+                    child[next_node, k] = -1
+                node_body[next_node] = j
+                node_data[next_node, 3] = node_data[node, 3] + (quarter if quadrant & 1 else -quarter)
+                node_data[next_node, 4] = node_data[node, 4] + (quarter if quadrant & 2 else -quarter)
+                node_data[next_node, 5] = quarter
+                child[node, quadrant] = next_node
+                node_body[node] = INTERNAL
+
+    # Children are always created after their parent, so a reverse sweep sees every
+    # child before the node that contains it
+    for node in range(count - 1, -1, -1):
+        mass = 0.0
+        mx = 0.0
+        my = 0.0
+        if node_body[node] == INTERNAL:
+            for k in range(4):
+                c = child[node, k]
+                if c != -1:
+                    mass += node_data[c, 0]
+                    mx += node_data[c, 0] * node_data[c, 1]
+                    my += node_data[c, 0] * node_data[c, 2]
+        else:
+            j = node_body[node]
+            while j != -1:
+                mass += masses[j]
+                mx += masses[j] * positions[j, 0]
+                my += masses[j] * positions[j, 1]
+                j = next_body[j]
+        node_data[node, 0] = mass
+        if mass > 0:
+            node_data[node, 1] = mx / mass
+            node_data[node, 2] = my / mass
+        else:
+            node_data[node, 1] = node_data[node, 3]
+            node_data[node, 2] = node_data[node, 4]
+
+    return count
+
+
+@njit(float64[:, ::1](float64, float64, float64[::1], float64[:, ::1], float64[:, ::1], int64[:, ::1], int64[::1], float64[:, ::1], int64[::1]), cache = True, parallel = True)
+def tree_accelerations(G, theta, masses, positions, acc, child, node_body, node_data, next_body):
+    n = masses.shape[0]
+    theta_squared = theta * theta
+    for i in prange(n):
+        stack = np.empty(STACK_SIZE, dtype=np.int64)
+        stack[0] = 0
+        top = 1
+        xi = positions[i, 0]
+        yi = positions[i, 1]
+        ax = 0.0
+        ay = 0.0
+        while top > 0:
+            top -= 1
+            node = stack[top]
+            if node_data[node, 0] == 0:
+                continue
+            if node_body[node] == INTERNAL:
+                dx = node_data[node, 1] - xi
+                dy = node_data[node, 2] - yi
+                distance_squared = dx * dx + dy * dy
+                width = 2.0 * node_data[node, 5]
+                if width * width < theta_squared * distance_squared:
+                    inv_distance = 1.0 / np.sqrt(distance_squared)
+                    magnitude = G * node_data[node, 0] / distance_squared * inv_distance
+                    ax += magnitude * dx
+                    ay += magnitude * dy
+                else:
+                    for k in range(4):
+                        if child[node, k] != -1:
+                            stack[top] = child[node, k]
+                            top += 1
+            else:
+                j = node_body[node]
+                while j != -1:
+                    if j != i:
+                        dx = positions[j, 0] - xi
+                        dy = positions[j, 1] - yi
+                        distance_squared = dx * dx + dy * dy
+                        inv_distance = 1.0 / np.sqrt(distance_squared)
+                        magnitude = G * masses[j] / distance_squared * inv_distance
+                        ax += magnitude * dx
+                        ay += magnitude * dy
+                    j = next_body[j]
+        acc[i, 0] = ax
+        acc[i, 1] = ay
+    return acc
+
+
+@njit(cache = True)
+def grow_quadtree(child, node_body, node_data):
+    # Arrays of twice the capacity for a tree that did not fit (next_body does not grow)
+    capacity = 2 * node_body.shape[0]
+    return np.empty((capacity, 4), dtype=np.int64), np.empty(capacity, dtype=np.int64), np.empty((capacity, 6), dtype=np.float64)
+
+
+@njit(cache = True)
+def compute_tree_accelerations(G, theta, masses, positions, acc, child, node_body, node_data, next_body):
+    # Rebuilds the tree in the given arrays and evaluates the accelerations. Returns
+    # False, with acc untouched, when the tree does not fit the arrays: the caller grows
+    # them (grow_quadtree) and repeats, the arrays are never reallocated here
+    if build_quadtree(masses, positions, child, node_body, node_data, next_body) < 0:
+        return False
+    tree_accelerations(G, theta, masses, positions, acc, child, node_body, node_data, next_body)
+    if not np.all(np.isfinite(acc)):
+        raise ValueError("Distance between bodies cannot be zero.")
+    return True
+
+
+def check_against_direct(n: int, theta: float = 0.5, G: float = 6.67430e-11, seed: int = 0):
+    # Compares the tree against the direct sum on a random disc of stars, returns the RMS
+    # and maximum acceleration error (relative to the RMS acceleration, per-body relative
+    # errors are meaningless where the pulls nearly cancel) and both timings
+    from newton_kernels import compute_accelerations
+
+    rng = np.random.default_rng(seed)
+    masses = rng.uniform(1e28, 1e30, n)
+    radius = rng.uniform(0, 1e13, n) ** 0.5 * 1e6
+    angle = rng.uniform(0, 2 * np.pi, n)
+    positions = np.ascontiguousarray(np.column_stack((radius * np.cos(angle), radius * np.sin(angle))))
+
+    direct = np.empty((n, 2))
+    tree = np.empty((n, 2))
+    workspace = allocate_quadtree(n)
+
+    start_time = time.time()
+    compute_accelerations(G, masses, positions, direct)
+    direct_time = time.time() - start_time
+
+    start_time = time.time()
+    child, node_body, node_data, next_body = workspace
+    while not compute_tree_accelerations(G, theta, masses, positions, tree, child, node_body, node_data, next_body):
+        child, node_body, node_data = grow_quadtree(child, node_body, node_data)
+    tree_time = time.time() - start_time
+
+    error = np.linalg.norm(tree - direct, axis=1)
+    scale = np.sqrt(np.mean(np.sum(direct**2, axis=1)))
+    return np.sqrt(np.mean(error**2)) / scale, error.max() / scale, direct_time, tree_time
+
+
+if __name__ == "__main__":
+    theta = float(sys.argv[1]) if len(sys.argv) > 1 else 0.5
+    check_against_direct(64, theta)  # compile
+    for n in (1000, 4000, 16000, 64000):
+        rms_error, max_error, direct_time, tree_time = check_against_direct(n, theta)
+        print(f"N={n}: direct {direct_time:.4f}s, tree {tree_time:.4f}s, relative error rms {rms_error:.2e} max {max_error:.2e}")
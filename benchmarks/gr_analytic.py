@@ -0,0 +1,56 @@
+import numpy as np
+import os, sys, time, tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Schwarzschild import simulate_GR
+from trajectory import open_trajectory
+
+# Cross-check of the semi-analytic GR backend (orbit equation, orbit.py) against the
+# compiled DOP853 integration: wall-clock time of both, the largest position difference
+# relative to the orbit size and the largest difference of the periapsis times, for the
+# bound and scattering scenarios in both formulations.
+#   python benchmarks/gr_analytic.py
+
+G = 6.67430e-11
+M_sun = 1.989e30
+c = 299792458
+
+Rs_black_hole = 2 * G * 10 * M_sun / c**2
+Rs_sun = 2 * G * M_sun / c**2
+
+scenarios = {
+    # name: (mass, x0, y0, vx0, vy0, Rs, target_time, resolution, coordinates)
+    "black_hole_orbit": (1.675e-27, 4 * Rs_black_hole, 0.0, 0.0, -0.4 * c, Rs_black_hole, 0.03, 1e7, "schwarzschild"),
+    "black_hole_flyby": (1.675e-27, 3 * Rs_black_hole, 3 * Rs_black_hole, 0.0, -0.565 * c, Rs_black_hole, 1.5e-3, 1e5, "schwarzschild"),
+    "mercury_orbit": (0.33010e24, 46e9, 0.0, 0.0, 58.97e3, Rs_sun, 8e6, 1e6, "schwarzschild"),
+    "mercury_1e9s": (0.33010e24, 46e9, 0.0, 0.0, 58.97e3, Rs_sun, 1e9, 1e8, "schwarzschild"),
+    "mercury_1e9s_ef": (0.33010e24, 46e9, 0.0, 0.0, 58.97e3, Rs_sun, 1e9, 1e8, "eddington_finkelstein"),
+}
+
+
+def run(arguments, backend, output):
+    start_time = time.time()
+    events = simulate_GR(*arguments[:8], output=output, backend=backend, coordinates=arguments[8], apsides=True)
+    return time.time() - start_time, events
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        # compile / load from cache outside the timing
+        run(scenarios["mercury_orbit"][:6] + (1e3, 1e3, "schwarzschild"), "compiled", "warm_up.traj")
+
+        results = []
+        for name, arguments in scenarios.items():
+            compiled_time, compiled_events = run(arguments, "compiled", "compiled.traj")
+            analytic_time, analytic_events = run(arguments, "analytic", "analytic.traj")
+            reference = open_trajectory("compiled.traj")
+            analytic = open_trajectory("analytic.traj")
+            size = np.max(np.hypot(reference["x"], reference["y"]))
+            difference = np.max(np.hypot(reference["x"] - analytic["x"], reference["y"] - analytic["y"])) / size
+            periapsis = np.max(np.abs(compiled_events["periapsis"] - analytic_events["periapsis"]), initial=0.0)
+            results.append((name, compiled_time, analytic_time, difference, periapsis))
+
+    print(f"\n{'scenario':<20}{'compiled (s)':>14}{'analytic (s)':>14}{'difference':>13}{'periapsis (s)':>15}")
+    for name, compiled_time, analytic_time, difference, periapsis in results:
+        print(f"{name:<20}{compiled_time:>14.3f}{analytic_time:>14.3f}{difference:>13.2e}{periapsis:>15.2e}")
@@ -0,0 +1,51 @@
+import numpy as np
+import os, sys, time, tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Schwarzschild import simulate_GR
+from trajectory import open_trajectory
+
+# Wall-clock time of the compiled GR backend against the scipy DOP853 path on the
+# black_hole_orbit and mercury_orbit scenarios, plus the largest difference between the
+# two trajectories relative to the orbit size.
+#   python benchmarks/gr_backends.py
+
+G = 6.67430e-11
+M_sun = 1.989e30
+c = 299792458
+
+Rs_black_hole = 2 * G * 10 * M_sun / c**2
+Rs_sun = 2 * G * M_sun / c**2
+
+scenarios = {
+    # name: (mass, x0, y0, vx0, vy0, Rs, target_time, resolution)
+    "black_hole_orbit": (1.675e-27, 4 * Rs_black_hole, 0.0, 0.0, -0.4 * c, Rs_black_hole, 0.03, 1e7),
+    "mercury_orbit": (0.33010e24, 46e9, 0.0, 0.0, 58.97e3, Rs_sun, 8e6, 1e6),
+}
+
+
+def run(arguments, backend, output):
+    start_time = time.time()
+    simulate_GR(*arguments, output=output, backend=backend)
+    return time.time() - start_time
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        # compile / load from cache outside the timing
+        run(scenarios["mercury_orbit"][:6] + (1e3, 1e3), "compiled", "warm_up.traj")
+
+        results = []
+        for name, arguments in scenarios.items():
+            scipy_time = run(arguments, "scipy", "scipy.traj")
+            compiled_time = run(arguments, "compiled", "compiled.traj")
+            reference = open_trajectory("scipy.traj")
+            compiled = open_trajectory("compiled.traj")
+            size = np.max(np.hypot(reference["x"], reference["y"]))
+            difference = np.max(np.hypot(reference["x"] - compiled["x"], reference["y"] - compiled["y"])) / size
+            results.append((name, scipy_time, compiled_time, difference))
+
+    print(f"\n{'scenario':<20}{'scipy (s)':>12}{'compiled (s)':>14}{'speedup':>10}{'difference':>13}")
+    for name, scipy_time, compiled_time, difference in results:
+        print(f"{name:<20}{scipy_time:>12.3f}{compiled_time:>14.3f}{scipy_time / compiled_time:>10.1f}{difference:>13.2e}")
@@ -0,0 +1,65 @@
+import numpy as np
+import os, sys, time, tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Newton import simulate_nbody
+
+# Wall-clock time and energy error of every Newton integrator on the mercury_orbit
+# scenario. For each integrator the step count is doubled until the relative energy
+# error at the end of the run is below the target, so the times compare equal accuracy.
+#   python benchmarks/integrators.py [target_error]
+
+G = 6.67430e-11
+M_sun = 1.989e30
+
+masses = [1 * M_sun, 0.33010e24]
+positions = [[0, 0], [46e9, 0]]
+velocities = [[0, 0], [0, 58.97e3]]
+target_time = 8e6
+
+
+def total_energy(masses, positions, velocities):
+    masses = np.asarray(masses, dtype=np.float64)
+    positions = np.asarray(positions, dtype=np.float64)
+    velocities = np.asarray(velocities, dtype=np.float64)
+    kinetic = 0.5 * np.sum(masses * np.sum(velocities**2, axis=1))
+    potential = 0.0
+    for i in range(len(masses)):
+        for j in range(i + 1, len(masses)):
+            potential -= G * masses[i] * masses[j] / np.linalg.norm(positions[i] - positions[j])
+    return kinetic + potential
+
+
+def run(integrator, resolution):
+    dt = target_time / resolution
+    start_time = time.time()
+    final_positions, final_velocities, _ = simulate_nbody(masses, positions, velocities, target_time, dt, int(resolution), G, integrator=integrator)
+    elapsed = time.time() - start_time
+    initial_energy = total_energy(masses, positions, velocities)
+    error = abs(total_energy(masses, final_positions, final_velocities) / initial_energy - 1)
+    return elapsed, error
+
+
+if __name__ == "__main__":
+    target_error = float(sys.argv[1]) if len(sys.argv) > 1 else 1e-9
+    names = ["euler", "leapfrog", "yoshida4", "wisdom_holman"]
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        for name in names:
+            run(name, 16)  # compile / load from cache outside the timing
+
+        results = []
+        for name in names:
+            resolution = 16
+            while True:
+                elapsed, error = run(name, resolution)
+                if error <= target_error or resolution >= 2**27:
+                    break
+                resolution *= 2
+            results.append((name, resolution, elapsed, error))
+
+    print(f"\nmercury_orbit, target relative energy error {target_error:.0e}")
+    print(f"{'integrator':<15}{'steps':>12}{'time (s)':>12}{'energy error':>15}")
+    for name, resolution, elapsed, error in results:
+        print(f"{name:<15}{resolution:>12}{elapsed:>12.4f}{error:>15.2e}")
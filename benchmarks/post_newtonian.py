@@ -0,0 +1,76 @@
+import numpy as np
+import os, sys, time, tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Newton import simulate_nbody
+from Schwarzschild import simulate_GR
+from orbit import SchwarzschildOrbit, geodesic_state
+from trajectory import open_trajectory
+
+# Perihelion advance of the post-Newtonian Newton engine against the Schwarzschild
+# geodesic (orbit.py, geodesic formulation): precession per orbit of
+# Newton + 1PN / 2PN (yoshida4) relative to the geodesic value and the wall-clock time
+# next to the compiled GR engine over the same span. The Newton runs start in harmonic
+# coordinates, r = r_schwarzschild - G M / c^2 with the same angular velocity.
+#   python benchmarks/post_newtonian.py
+
+G = 6.67430e-11
+M_sun = 1.989e30
+c = 299792458
+
+scenarios = {
+    # name: (central mass, periapsis (harmonic), speed / circular speed, orbits, steps per orbit)
+    "mercury": (M_sun, 46e9, 1.09817, 20, 8000),
+    "r_p = 200 Rs": (10 * M_sun, 200 * 2 * G * 10 * M_sun / c**2, 1.15, 20, 1000),
+    "r_p = 50 Rs": (10 * M_sun, 50 * 2 * G * 10 * M_sun / c**2, 1.15, 20, 1000),
+}
+
+
+def periapsis_angles(path, times):
+    # Direction of the separation at the periapsis event times, from a polynomial
+    # through the polar angle of the nearest samples
+    trajectory = open_trajectory(path)
+    t = trajectory["time"]
+    angle = np.unwrap(np.arctan2(trajectory["y2"] - trajectory["y1"], trajectory["x2"] - trajectory["x1"]))
+    angles = []
+    for time_p in times:
+        i = np.searchsorted(t, time_p)
+        if i < 3 or i > len(t) - 3:
+            continue
+        window = slice(i - 3, i + 3)
+        scale = t[i] - t[i - 1]
+        angles.append(np.polyval(np.polyfit((t[window] - time_p) / scale, angle[window], 5), 0.0))
+    return np.array(angles)
+
+
+if __name__ == "__main__":
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        for name, (mass, periapsis, boost, orbits, steps) in scenarios.items():
+            Rs = 2 * G * mass / c**2
+            speed = boost * np.sqrt(G * mass / periapsis)
+            r = periapsis + G * mass / c**2
+            state = geodesic_state(r, 0.0, 0.0, r * speed / periapsis / np.sqrt(1 - Rs / r), Rs, c)
+            geodesic = SchwarzschildOrbit(state, Rs, c, "geodesic")
+            period = geodesic.radial_period
+            target_time = orbits * period
+
+            row = [name, geodesic.precession]
+            for post_newtonian in ("1pn", "2pn"):
+                start_time = time.time()
+                _, _, events = simulate_nbody([mass, 1.0], [[0.0, 0.0], [periapsis, 0.0]], [[0.0, 0.0], [0.0, speed]], target_time, period / steps, 1, G,
+                               chunk_size=100000, integrator="yoshida4", post_newtonian=post_newtonian, c=c, output="newton.traj", apsides=True)
+                elapsed = time.time() - start_time
+                angles = periapsis_angles("newton.traj", events["periapsis"])
+                precession = np.polyfit(np.arange(len(angles)), angles, 1)[0] - 2 * np.pi
+                row += [precession / geodesic.precession - 1, elapsed]
+
+            start_time = time.time()
+            simulate_GR(1.0, r, 0.0, 0.0, r * speed / periapsis, Rs, target_time, orbits * steps, 1, c, output="gr.traj")
+            row.append(time.time() - start_time)
+            results.append(row)
+
+    print(f"\n{'scenario':<16}{'precession':>13}{'1PN error':>12}{'1PN (s)':>10}{'2PN error':>12}{'2PN (s)':>10}{'GR (s)':>10}")
+    for name, precession, error_1pn, time_1pn, error_2pn, time_2pn, time_gr in results:
+        print(f"{name:<16}{precession:>13.4e}{error_1pn:>12.2e}{time_1pn:>10.3f}{error_2pn:>12.2e}{time_2pn:>10.3f}{time_gr:>10.3f}")
@@ -0,0 +1,302 @@
+import numpy as np
+import json, os, sys, time, platform, subprocess, tempfile, argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scenarios import load_scenario, find_scenarios
+
+# Performance and accuracy suite over the bundled scenarios. Every scenario is run by both
+# engines (simulate_GR and the simulate_nbody kernel behind simulate_newton), reduced to
+# at most REDUCED_RESOLUTION samples / Newton steps over the full target_time, each case
+# in a fresh process after a short warm-up run, with the result cache off. Recorded per case:
+#   wall_time, steps, steps_per_second, rhs_evaluations  from the engine's metrics
+#   integrate_time, compile_time   phases of the run (see metrics.py)
+#   peak_rss_mb, run_rss_mb     peak resident memory of the process and its growth during the run
+#   energy_drift, angular_momentum_drift   Newton, relative change over the run
+#   kepler_period_error         Newton, worst periapsis passage against the Kepler orbit of
+#                               the initial state, relative to the period
+#   period_error                GR, same against the semi-analytic orbit (orbit.py)
+#   perihelion_advance_error    GR, periapsis direction against the semi-analytic orbit,
+#                               radians per orbit
+# Accuracy metrics only exist where the reference does (bound orbits that stay clear of
+# the horizon). Each run is appended as one JSON line to the history file and compared
+# with the latest earlier run on the same host and reduction: a metric that got worse by
+# more than its tolerance (TOLERANCES) is flagged and the exit status is 1.
+#   python benchmarks/suite.py                   every scenario, reduced
+#   python benchmarks/suite.py mercury_orbit     one scenario
+#   python benchmarks/suite.py --full            the scenarios as they are
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history.jsonl")
+REDUCED_RESOLUTION = 1e6
+WARM_UP_FRACTION = 1e-3
+TOLERANCES = {
+    # metric: (relative tolerance, absolute floor), lower is better for all of them.
+    # Timings only count as worse by more than the floor, accuracy by more than a factor 2
+    # above what double precision resolves
+    "wall_time": (0.2, 0.01),
+    "peak_rss_mb": (0.2, 10.0),
+    "steps": (0.01, 0),
+    "rhs_evaluations": (0.01, 0),
+    "energy_drift": (1.0, 1e-14),
+    "angular_momentum_drift": (1.0, 1e-14),
+    "kepler_period_error": (1.0, 1e-12),
+    "period_error": (1.0, 1e-12),
+    "perihelion_advance_error": (1.0, 1e-12),
+}
+
+
+def reduce_scenario(scenario, full=False):
+    # The scenario over its full target_time with at most REDUCED_RESOLUTION samples, the
+    # Newton step grows by the same factor
+    scenario = dict(scenario)
+    if not full and scenario["resolution"] > REDUCED_RESOLUTION:
+        scenario["dt"] *= scenario["resolution"] / REDUCED_RESOLUTION
+        scenario["resolution"] = REDUCED_RESOLUTION
+    return scenario
+
+
+def finite(value):
+    # JSON has no inf / nan
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def wrap(angle):
+    return (angle + np.pi) % (2 * np.pi) - np.pi
+
+
+def angles_at(t, angle, times):
+    # Polar angle at the given times from a polynomial through the nearest samples
+    angles = []
+    for time_p in times:
+        i = np.searchsorted(t, time_p)
+        i = min(max(i, 3), len(t) - 3)
+        window = slice(i - 3, i + 3)
+        scale = t[i] - t[i - 1]
+        angles.append(np.polyval(np.polyfit((t[window] - time_p) / scale, angle[window], 5), 0.0))
+    return np.array(angles)
+
+
+def paired_errors(measured, first, period):
+    # Offset of every measured passage from the reference passage first + k * period nearest to it
+    k = np.round((measured - first) / period)
+    return measured - (first + k * period), k
+
+
+def kepler_periapsis(G, masses, positions, velocities):
+    # Period and first periapsis time after t = 0 of the Kepler orbit of body 1 around
+    # body 0, None when unbound
+    mu = G * (masses[0] + masses[1])
+    r = positions[1] - positions[0]
+    v = velocities[1] - velocities[0]
+    distance = np.hypot(*r)
+    energy = 0.5 * v @ v - mu / distance
+    if energy >= 0:
+        return None
+    a = -mu / (2 * energy)
+    n = np.sqrt(mu / a**3)
+    e_cos = 1 - distance / a
+    e_sin = (r @ v) / np.sqrt(mu * a)
+    eccentric = np.arctan2(e_sin, e_cos)
+    mean_anomaly = eccentric - e_sin
+    period = 2 * np.pi / n
+    return period, ((2 * np.pi - mean_anomaly) % (2 * np.pi)) / n
+
+
+def newton_case(scenario, output, metrics, warm_up=False):
+    from Newton import simulate_nbody
+
+    target_time = scenario["target_time"] * (WARM_UP_FRACTION if warm_up else 1)
+    masses = np.array([scenario["central_mass"], scenario["mass"]])
+    positions = np.array([scenario["central_position"], scenario["position"]])
+    velocities = np.array([scenario["central_velocity"], scenario["velocity"]])
+    final_positions, final_velocities, events = simulate_nbody(masses, positions, velocities, target_time, scenario["dt"], G=scenario["G"],
+                                                               output=output, apsides=True, metrics=metrics, **scenario["newton"])
+    if warm_up:
+        return {}
+
+    def energy(x, v):
+        return 0.5 * np.sum(masses * np.sum(v**2, axis=1)) - scenario["G"] * masses[0] * masses[1] / np.hypot(*(x[1] - x[0]))
+
+    def angular_momentum(x, v):
+        return np.sum(masses * (x[:, 0] * v[:, 1] - x[:, 1] * v[:, 0]))
+
+    metrics = {
+        "energy_drift": finite(abs(energy(final_positions, final_velocities) / energy(positions, velocities) - 1)),
+        "angular_momentum_drift": finite(abs(angular_momentum(final_positions, final_velocities) / angular_momentum(positions, velocities) - 1)),
+    }
+    kepler = kepler_periapsis(scenario["G"], masses, positions, velocities)
+    if kepler is not None and len(events["periapsis"]):
+        period, first = kepler
+        errors, _ = paired_errors(events["periapsis"], first, period)
+        metrics["kepler_period_error"] = finite(np.max(np.abs(errors)) / period)
+    return metrics
+
+
+def gr_case(scenario, output, metrics, warm_up=False):
+    from Schwarzschild import simulate_GR, analytic_orbit
+    from trajectory import open_trajectory
+
+    x, y = scenario["position"]
+    vx, vy = scenario["velocity"]
+    target_time = scenario["target_time"] * (WARM_UP_FRACTION if warm_up else 1)
+    resolution = max(scenario["resolution"] * (WARM_UP_FRACTION if warm_up else 1), 2)
+    events = simulate_GR(scenario["mass"], x, y, vx, vy, scenario["Rs"], target_time, resolution, c=scenario["c"],
+                         output=output, apsides=True, metrics=metrics, **scenario["gr"])
+    if warm_up or len(events["horizon"]) or len(events["escape"]) or not len(events["periapsis"]):
+        return {}
+    try:
+        orbit = analytic_orbit(scenario["mass"], x, y, vx, vy, scenario["Rs"], scenario["c"], scenario["gr"].get("coordinates", "schwarzschild"))
+    except ValueError:
+        return {}
+    if not orbit.bound:
+        return {}
+
+    first = orbit.first_passage(0.0)
+    errors, k = paired_errors(events["periapsis"], first, orbit.radial_period)
+    trajectory = open_trajectory(output)
+    measured = angles_at(trajectory["time"], np.unwrap(np.arctan2(trajectory["y"], trajectory["x"])), events["periapsis"])
+    expected = orbit.states_at_times(first + k * orbit.radial_period)[1]
+    # Direction error accumulated up to the last passage, per orbit
+    orbits = events["periapsis"][-1] / orbit.radial_period
+    return {
+        "period_error": finite(np.max(np.abs(errors)) / orbit.radial_period),
+        "perihelion_advance_error": finite(abs(wrap(measured[-1] - expected[-1])) / orbits),
+    }
+
+
+def run_case(kind, scenario, directory):
+    # One case in a fresh worker process: a warm-up over WARM_UP_FRACTION of the span
+    # (numba cache loads, first-touch allocations), then the measured run
+    from metrics import RunMetrics
+
+    case = gr_case if kind == "GR" else newton_case
+    case(scenario, os.path.join(directory, f"{scenario['name']}_{kind}_warm_up.traj"), None, warm_up=True)
+    run = RunMetrics()
+    accuracy = case(scenario, os.path.join(directory, f"{scenario['name']}_{kind}.traj"), run)
+    steps = run.counters.get("steps", 0)
+    return dict({
+        "wall_time": run.wall_time,
+        "integrate_time": run.phases.get("integrate", 0.0),
+        "compile_time": run.phases.get("compile", 0.0),
+        "steps": steps,
+        "steps_per_second": steps / run.wall_time if run.wall_time > 0 else None,
+        "rhs_evaluations": run.counters.get("rhs_evaluations", 0),
+        "peak_rss_mb": run.peak_rss_mb,
+        "run_rss_mb": run.rss_growth_mb,
+    }, **accuracy)
+
+
+def run_suite(scenarios, full=False):
+    # {"<scenario>/<engine>": metrics}, one case after the other so that timings do not
+    # compete for the cores
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for scenario in scenarios:
+            scenario = reduce_scenario(scenario, full)
+            for kind in ("GR", "Newton"):
+                # spawn, a fresh process per case for its own peak memory
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                    results[f"{scenario['name']}/{kind}"] = pool.submit(run_case, kind, scenario, directory).result()
+    return results
+
+
+def run_info(full):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    import numba
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "dirty": dirty,
+        "host": platform.node(),
+        "machine": platform.machine(),
+        "cpus": len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "numba": numba.__version__,
+        "full": full,
+    }
+
+
+def read_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def find_baseline(history, run):
+    # Latest earlier run on the same host with the same reduction
+    for record in reversed(history):
+        if record["host"] == run["host"] and record["full"] == run["full"]:
+            return record
+    return None
+
+
+def regressions(baseline, results):
+    # (case, metric, before, after) for every metric worse than its tolerance allows
+    flagged = []
+    for case, metrics in results.items():
+        before = baseline["cases"].get(case, {})
+        for metric, (relative, floor) in TOLERANCES.items():
+            old, new = before.get(metric), metrics.get(metric)
+            if old is None or new is None:
+                continue
+            if new > old * (1 + relative) and new - old > floor:
+                flagged.append((case, metric, old, new))
+    return flagged
+
+
+def print_results(results):
+    print(f"\n{'case':<28}{'time (s)':>10}{'steps':>11}{'steps/s':>11}{'rhs evals':>11}{'peak MB':>9}"
+          f"{'energy':>10}{'period':>10}{'advance':>10}")
+    for case, metrics in results.items():
+        def column(name, width, spec):
+            value = metrics.get(name)
+            return f"{'-':>{width}}" if value is None else f"{value:>{width}{spec}}"
+        print(f"{case:<28}{column('wall_time', 10, '.3f')}{column('steps', 11, 'd')}{column('steps_per_second', 11, '.3e')}"
+              f"{column('rhs_evaluations', 11, 'd')}{column('peak_rss_mb', 9, '.0f')}{column('energy_drift', 10, '.1e')}"
+              f"{column('kepler_period_error', 10, '.1e') if 'kepler_period_error' in metrics else column('period_error', 10, '.1e')}"
+              f"{column('perihelion_advance_error', 10, '.1e')}")
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Benchmark both engines on the bundled scenarios and flag regressions.")
+    parser.add_argument("scenarios", nargs="*", help="scenario directories or names (default: all)")
+    parser.add_argument("--full", action="store_true", help="run the scenarios unreduced")
+    parser.add_argument("--history", default=HISTORY, help="JSON lines history to compare with and append to")
+    parser.add_argument("--no-save", action="store_true", help="compare without appending this run to the history")
+    arguments = parser.parse_args(arguments)
+
+    paths = [path if os.path.exists(path) else os.path.join(ROOT, path) for path in arguments.scenarios] or find_scenarios(ROOT)
+    scenarios = [load_scenario(path) for path in paths]
+    run = run_info(arguments.full)
+    results = run_suite(scenarios, arguments.full)
+    print_results(results)
+
+    history = read_history(arguments.history)
+    baseline = find_baseline(history, run)
+    flagged = regressions(baseline, results) if baseline is not None else []
+    if baseline is None:
+        print(f"\nNo earlier run on {run['host']} to compare with")
+    else:
+        print(f"\nCompared with the run of {baseline['time']} ({(baseline['commit'] or 'unknown')[:12]})")
+        for case, metric, old, new in flagged:
+            print(f"REGRESSION {case} {metric}: {old:.4g} -> {new:.4g}")
+        if not flagged:
+            print("No regressions")
+
+    if not arguments.no_save:
+        with open(arguments.history, "a") as file:
+            file.write(json.dumps(dict(run, cases=results, regressions=[list(entry) for entry in flagged])) + "\n")
+    return 1 if flagged else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
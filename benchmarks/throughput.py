@@ -0,0 +1,111 @@
+import numpy as np
+from numba import njit
+import os, sys, time, tempfile, contextlib, io
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Newton import simulate_nbody
+from metrics import RunMetrics
+
+# Steps per second of the default Newton path (two bodies, direct forces, fixed-step
+# euler) against the hand-inlined two-body loop the engine started from, both on this
+# machine: the engine's integrate phase must reach MIN_RATIO of the reference, the exit
+# status is 1 otherwise. The other integrators are reported alongside.
+#   python benchmarks/throughput.py [steps]
+
+G = 6.67430e-11
+M_sun = 1.989e30
+MIN_RATIO = 0.9
+REPEATS = 3
+SAVE_EVERY = 100
+CHUNK_ROWS = 10000
+
+masses = [M_sun, 0.33010e24]
+positions = [[0, 0], [46e9, 0]]
+velocities = [[0, 0], [0, 58.97e3]]
+target_time = 8e6
+
+
+@njit(cache = True)
+def reference_chunk(mass1, position1, velocity1, mass2, position2, velocity2, sim_time, target_time, dt, save_every, counter, out):
+    # The two-body time loop of the first compiled engine, everything inlined
+    saved = 0
+    steps = 0
+    while sim_time < target_time and saved < out.shape[0]:
+        dx = position2[0] - position1[0]
+        dy = position2[1] - position1[1]
+        distance_squared = dx * dx + dy * dy
+        if distance_squared == 0:
+            raise ValueError("Distance between bodies cannot be zero.")
+        force_magnitude = G * mass1 * mass2 / distance_squared
+        distance = np.sqrt(distance_squared)
+        fx = force_magnitude * (dx / distance)
+        fy = force_magnitude * (dy / distance)
+
+        sim_time += dt
+        counter += 1
+        steps += 1
+
+        velocity1[0] += fx / mass1 * dt
+        velocity1[1] += fy / mass1 * dt
+        position1[0] += velocity1[0] * dt
+        position1[1] += velocity1[1] * dt
+        velocity2[0] += -fx / mass2 * dt
+        velocity2[1] += -fy / mass2 * dt
+        position2[0] += velocity2[0] * dt
+        position2[1] += velocity2[1] * dt
+
+        if counter == save_every:
+            out[saved, 0] = sim_time
+            out[saved, 1] = position1[0]
+            out[saved, 2] = position1[1]
+            out[saved, 3] = position2[0]
+            out[saved, 4] = position2[1]
+            saved += 1
+            counter = 0
+    return sim_time, counter, steps
+
+
+def reference(steps):
+    position1, position2 = (np.array(p, dtype=np.float64) for p in positions)
+    velocity1, velocity2 = (np.array(v, dtype=np.float64) for v in velocities)
+    out = np.empty((CHUNK_ROWS, 5))
+    dt = target_time / steps
+    sim_time, counter, total = 0.0, 0, 0
+    start_time = time.perf_counter()
+    while sim_time < target_time:
+        sim_time, counter, taken = reference_chunk(masses[0], position1, velocity1, masses[1], position2, velocity2,
+                                                   sim_time, target_time, dt, SAVE_EVERY, counter, out)
+        total += taken
+    return total / (time.perf_counter() - start_time)
+
+
+def engine(integrator, steps):
+    # Steps per second of the integrate phase (compilation and output excluded)
+    metrics = RunMetrics()
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulate_nbody(masses, positions, velocities, target_time, target_time / steps, SAVE_EVERY, G,
+                       integrator=integrator, output="Newton.traj", metrics=metrics)
+    return metrics.counters["steps"] / metrics.phases["integrate"]
+
+
+if __name__ == "__main__":
+    steps = int(float(sys.argv[1])) if len(sys.argv) > 1 else 20_000_000
+    integrators = ["euler", "leapfrog", "yoshida4", "wisdom_holman"]
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        reference(1000)
+        for integrator in integrators:
+            engine(integrator, 1000)  # compile / load from cache outside the timing
+        reference_rate = max(reference(steps) for _ in range(REPEATS))
+        rates = {integrator: max(engine(integrator, steps) for _ in range(REPEATS)) for integrator in integrators}
+
+    print(f"\nmercury_orbit, {steps} steps, best of {REPEATS}")
+    print(f"{'path':<25}{'steps/s':>12}{'vs reference':>15}")
+    print(f"{'reference (inlined loop)':<25}{reference_rate:>12.3e}{1.0:>15.2f}")
+    for integrator, rate in rates.items():
+        print(f"{integrator:<25}{rate:>12.3e}{rate / reference_rate:>15.2f}")
+    if rates["euler"] < MIN_RATIO * reference_rate:
+        print(f"euler runs at {rates['euler'] / reference_rate:.2f} of the reference, below {MIN_RATIO}")
+        sys.exit(1)
+    sys.exit(0)
@@ -0,0 +1,172 @@
+import numpy as np
+import json, os, sys, time, shutil, hashlib, argparse
+
+# Content-addressed cache of finished runs. simulate_nbody / simulate_newton and
+# simulate_GR with cache=True (or a cache directory) hash every physical and numerical
+# input together with the engine version (a hash of the engine's source files) and,
+# when that key is cached, copy the stored trajectory to output instead of integrating.
+# An entry is a directory <cache>/<key> holding
+#   trajectory/   copy of the finished output trajectory (header, columns, events.npz)
+#   result.npz    the return values that are not part of the trajectory
+#   entry.json    engine, run parameters, size, creation and last use time
+# entry.json is written last and the entry renamed into place, so a half written entry
+# is never found. Once the cache grows past its size limit (MFY_CACHE_MAX_BYTES, 4 GiB by
+# default) the least recently used entries are evicted.
+#   python cache.py list            entries, newest use first
+#   python cache.py purge [KEY...]  remove the given entries (all without keys)
+#   python cache.py evict SIZE      shrink to SIZE bytes
+
+CACHE_ENV = "MFY_CACHE_DIR"
+MAX_SIZE_ENV = "MFY_CACHE_MAX_BYTES"
+DEFAULT_MAX_SIZE = 4 * 1024**3
+ENTRY_NAME = "entry.json"
+RESULT_NAME = "result.npz"
+TRAJECTORY_NAME = "trajectory"
+
+
+def cache_dir(cache=True):
+    # cache=True -> $MFY_CACHE_DIR, else mfy in $XDG_CACHE_HOME (~/.cache by default), a
+    # string is the directory itself
+    if isinstance(cache, str):
+        return cache
+    if os.environ.get(CACHE_ENV):
+        return os.environ[CACHE_ENV]
+    return os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "mfy")
+
+
+def max_cache_size():
+    return int(os.environ.get(MAX_SIZE_ENV, DEFAULT_MAX_SIZE))
+
+
+def engine_version(*paths):
+    # Hash of the engine's source files, any code change invalidates its entries
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def cache_key(params, version):
+    return hashlib.sha256(json.dumps({"params": params, "version": version}, sort_keys=True, default=float).encode()).hexdigest()
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def write_entry(path, entry):
+    temporary = os.path.join(path, ENTRY_NAME + ".tmp")
+    with open(temporary, "w") as file:
+        json.dump(entry, file, indent=2, default=float)
+    os.replace(temporary, os.path.join(path, ENTRY_NAME))
+
+
+def read_entry(path):
+    with open(os.path.join(path, ENTRY_NAME)) as file:
+        return json.load(file)
+
+
+def cache_lookup(key, output, directory):
+    # Copies the cached trajectory of key to output (replacing it) and returns the stored
+    # results, None when key is not cached
+    path = os.path.join(directory, key)
+    try:
+        entry = read_entry(path)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if os.path.exists(output):
+        shutil.rmtree(output)
+    shutil.copytree(os.path.join(path, TRAJECTORY_NAME), output)
+    with np.load(os.path.join(path, RESULT_NAME)) as results:
+        results = {name: results[name] for name in results.files}
+    entry["last_used"] = time.time()
+    write_entry(path, entry)
+    return results
+
+
+def cache_store(key, output, results, info, directory, max_size=None):
+    # Adds the finished trajectory at output and the results (name -> array) under key,
+    # info (engine, params) goes to entry.json. Evicts down to max_size afterwards
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, key)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    shutil.copytree(output, os.path.join(temporary, TRAJECTORY_NAME))
+    np.savez(os.path.join(temporary, RESULT_NAME), **results)
+    now = time.time()
+    write_entry(temporary, dict(info, key=key, size=directory_size(temporary), created=now, last_used=now))
+    try:
+        os.replace(temporary, path)
+    except OSError:
+        # Stored meanwhile by another process
+        shutil.rmtree(temporary)
+    evict_cache(max_cache_size() if max_size is None else max_size, directory, keep=key)
+
+
+def cache_entries(directory):
+    # entry.json of every complete entry, most recently used first
+    if not os.path.isdir(directory):
+        return []
+    entries = []
+    for name in os.listdir(directory):
+        try:
+            entries.append(read_entry(os.path.join(directory, name)))
+        except (FileNotFoundError, NotADirectoryError, json.JSONDecodeError):
+            continue
+    return sorted(entries, key=lambda entry: -entry["last_used"])
+
+
+def purge_cache(directory, keys=None):
+    # Removes the given entries, or the whole cache, returns the number of bytes freed
+    freed = 0
+    for entry in cache_entries(directory):
+        if keys is None or entry["key"] in keys:
+            shutil.rmtree(os.path.join(directory, entry["key"]), ignore_errors=True)
+            freed += entry["size"]
+    return freed
+
+
+def evict_cache(max_size, directory, keep=None):
+    # Drops least recently used entries until the cache holds at most max_size bytes
+    entries = cache_entries(directory)
+    total = sum(entry["size"] for entry in entries)
+    evicted = []
+    for entry in reversed(entries):
+        if total <= max_size:
+            break
+        if entry["key"] == keep:
+            continue
+        shutil.rmtree(os.path.join(directory, entry["key"]), ignore_errors=True)
+        total -= entry["size"]
+        evicted.append(entry["key"])
+    return evicted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect and purge the simulation result cache.")
+    parser.add_argument("--dir", default=None, help=f"cache directory (default: ${CACHE_ENV}, else $XDG_CACHE_HOME/mfy or ~/.cache/mfy)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list")
+    purge = commands.add_parser("purge")
+    purge.add_argument("keys", nargs="*", help="entries to remove, all without keys")
+    evict = commands.add_parser("evict")
+    evict.add_argument("size", type=int, help="size in bytes to shrink the cache to")
+    arguments = parser.parse_args()
+
+    directory = arguments.dir or cache_dir()
+    if arguments.command == "list":
+        entries = cache_entries(directory)
+        print(f"{'key':<14}{'engine':<15}{'size (MB)':>11}  {'last used':<21}{'target_time':>13}")
+        for entry in entries:
+            last_used = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["last_used"]))
+            print(f"{entry['key'][:12]:<14}{entry['engine']:<15}{entry['size'] / 1e6:>11.2f}  {last_used:<21}{entry['params'].get('target_time', np.nan):>13.4g}")
+        print(f"{len(entries)} entries, {sum(entry['size'] for entry in entries) / 1e6:.2f} MB in {directory}")
+    elif arguments.command == "purge":
+        # Keys may be abbreviated to any unique prefix, as printed by list
+        keys = None
+        if arguments.keys:
+            keys = [entry["key"] for entry in cache_entries(directory) if any(entry["key"].startswith(prefix) for prefix in arguments.keys)]
+        print(f"Freed {purge_cache(directory, keys) / 1e6:.2f} MB")
+    else:
+        print(f"Evicted {len(evict_cache(arguments.size, directory))} entries")
+    sys.exit(0)
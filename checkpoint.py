@@ -0,0 +1,44 @@
+import numpy as np
+import json, os
+
+# Checkpoints of long integrations. A checkpoint is an .npz next to the trajectory data
+# (checkpoint.npz inside Newton.traj / GR.traj) holding the integrator state arrays and
+# the run parameters it belongs to. It is written to a temporary file and renamed, so a
+# process killed mid-write leaves the previous checkpoint intact.
+
+CHECKPOINT_NAME = "checkpoint.npz"
+
+
+def checkpoint_path(output):
+    return os.path.join(output, CHECKPOINT_NAME)
+
+
+def params_key(params):
+    return json.dumps(params, sort_keys=True, default=float)
+
+
+def save_checkpoint(output, params, **state):
+    path = checkpoint_path(output)
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        np.savez(file, params=np.array(params_key(params)), **state)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+def load_checkpoint(output, params):
+    # Returns the saved state arrays, refusing checkpoints of a run with other parameters
+    path = checkpoint_path(output)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No checkpoint to resume from: {path}")
+    with np.load(path) as checkpoint:
+        if str(checkpoint["params"]) != params_key(params):
+            raise ValueError("The checkpoint belongs to a run with different parameters.")
+        return {name: checkpoint[name] for name in checkpoint.files if name != "params"}
+
+
+def remove_checkpoint(output):
+    path = checkpoint_path(output)
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,938 @@
+import numpy as np
+from numba import njit, prange
+from scipy.optimize import OptimizeResult
+import time, sys
+from newton_kernels import kepler_drift
+
+# Compiled kernels of the Schwarzschild engine: the equations of motion and a DOP853
+# stepper with the same coefficients, error norm and step-size control as scipy's
+# solve_ivp(method='DOP853'), so a member integrated here follows the same steps as the
+# Python path without a Python call per stage. Run `python gr_kernels.py` to warm the
+# on-disk cache.
+
+# DOP853 tableau of Dormand & Prince with the dense output of Hairer, Norsett & Wanner
+# (Solving Ordinary Differential Equations I), the values scipy's solve_ivp uses
+# (scipy.integrate._ivp.dop853_coefficients, a private module, hence the copy here)
+N_STAGES = 12
+N_STAGES_EXTENDED = 16
+INTERPOLATOR_POWER = 7
+
+TABLEAU_C = np.array([0.0,
+                      0.526001519587677318785587544488e-01,
+                      0.789002279381515978178381316732e-01,
+                      0.118350341907227396726757197510,
+                      0.281649658092772603273242802490,
+                      0.333333333333333333333333333333,
+                      0.25,
+                      0.307692307692307692307692307692,
+                      0.651282051282051282051282051282,
+                      0.6,
+                      0.857142857142857142857142857142,
+                      1.0,
+                      1.0,
+                      0.1,
+                      0.2,
+                      0.777777777777777777777777777778])
+
+TABLEAU_A = np.zeros((N_STAGES_EXTENDED, N_STAGES_EXTENDED))
+TABLEAU_A[1, 0] = 5.26001519587677318785587544488e-2
+
+TABLEAU_A[2, 0] = 1.97250569845378994544595329183e-2
+TABLEAU_A[2, 1] = 5.91751709536136983633785987549e-2
+
+TABLEAU_A[3, 0] = 2.95875854768068491816892993775e-2
+TABLEAU_A[3, 2] = 8.87627564304205475450678981324e-2
+
+TABLEAU_A[4, 0] = 2.41365134159266685502369798665e-1
+TABLEAU_A[4, 2] = -8.84549479328286085344864962717e-1
+TABLEAU_A[4, 3] = 9.24834003261792003115737966543e-1
+
+TABLEAU_A[5, 0] = 3.7037037037037037037037037037e-2
+TABLEAU_A[5, 3] = 1.70828608729473871279604482173e-1
+TABLEAU_A[5, 4] = 1.25467687566822425016691814123e-1
+
+TABLEAU_A[6, 0] = 3.7109375e-2
+TABLEAU_A[6, 3] = 1.70252211019544039314978060272e-1
+TABLEAU_A[6, 4] = 6.02165389804559606850219397283e-2
+TABLEAU_A[6, 5] = -1.7578125e-2
+
+TABLEAU_A[7, 0] = 3.70920001185047927108779319836e-2
+TABLEAU_A[7, 3] = 1.70383925712239993810214054705e-1
+TABLEAU_A[7, 4] = 1.07262030446373284651809199168e-1
+TABLEAU_A[7, 5] = -1.53194377486244017527936158236e-2
+TABLEAU_A[7, 6] = 8.27378916381402288758473766002e-3
+
+TABLEAU_A[8, 0] = 6.24110958716075717114429577812e-1
+TABLEAU_A[8, 3] = -3.36089262944694129406857109825
+TABLEAU_A[8, 4] = -8.68219346841726006818189891453e-1
+TABLEAU_A[8, 5] = 2.75920996994467083049415600797e1
+TABLEAU_A[8, 6] = 2.01540675504778934086186788979e1
+TABLEAU_A[8, 7] = -4.34898841810699588477366255144e1
+
+TABLEAU_A[9, 0] = 4.77662536438264365890433908527e-1
+TABLEAU_A[9, 3] = -2.48811461997166764192642586468
+TABLEAU_A[9, 4] = -5.90290826836842996371446475743e-1
+TABLEAU_A[9, 5] = 2.12300514481811942347288949897e1
+TABLEAU_A[9, 6] = 1.52792336328824235832596922938e1
+TABLEAU_A[9, 7] = -3.32882109689848629194453265587e1
+TABLEAU_A[9, 8] = -2.03312017085086261358222928593e-2
+
+TABLEAU_A[10, 0] = -9.3714243008598732571704021658e-1
+TABLEAU_A[10, 3] = 5.18637242884406370830023853209
+TABLEAU_A[10, 4] = 1.09143734899672957818500254654
+TABLEAU_A[10, 5] = -8.14978701074692612513997267357
+TABLEAU_A[10, 6] = -1.85200656599969598641566180701e1
+TABLEAU_A[10, 7] = 2.27394870993505042818970056734e1
+TABLEAU_A[10, 8] = 2.49360555267965238987089396762
+TABLEAU_A[10, 9] = -3.0467644718982195003823669022
+
+TABLEAU_A[11, 0] = 2.27331014751653820792359768449
+TABLEAU_A[11, 3] = -1.05344954667372501984066689879e1
+TABLEAU_A[11, 4] = -2.00087205822486249909675718444
+TABLEAU_A[11, 5] = -1.79589318631187989172765950534e1
+TABLEAU_A[11, 6] = 2.79488845294199600508499808837e1
+TABLEAU_A[11, 7] = -2.85899827713502369474065508674
+TABLEAU_A[11, 8] = -8.87285693353062954433549289258
+TABLEAU_A[11, 9] = 1.23605671757943030647266201528e1
+TABLEAU_A[11, 10] = 6.43392746015763530355970484046e-1
+
+TABLEAU_A[12, 0] = 5.42937341165687622380535766363e-2
+TABLEAU_A[12, 5] = 4.45031289275240888144113950566
+TABLEAU_A[12, 6] = 1.89151789931450038304281599044
+TABLEAU_A[12, 7] = -5.8012039600105847814672114227
+TABLEAU_A[12, 8] = 3.1116436695781989440891606237e-1
+TABLEAU_A[12, 9] = -1.52160949662516078556178806805e-1
+TABLEAU_A[12, 10] = 2.01365400804030348374776537501e-1
+TABLEAU_A[12, 11] = 4.47106157277725905176885569043e-2
+
+TABLEAU_A[13, 0] = 5.61675022830479523392909219681e-2
+TABLEAU_A[13, 6] = 2.53500210216624811088794765333e-1
+TABLEAU_A[13, 7] = -2.46239037470802489917441475441e-1
+TABLEAU_A[13, 8] = -1.24191423263816360469010140626e-1
+TABLEAU_A[13, 9] = 1.5329179827876569731206322685e-1
+TABLEAU_A[13, 10] = 8.20105229563468988491666602057e-3
+TABLEAU_A[13, 11] = 7.56789766054569976138603589584e-3
+TABLEAU_A[13, 12] = -8.298e-3
+
+TABLEAU_A[14, 0] = 3.18346481635021405060768473261e-2
+TABLEAU_A[14, 5] = 2.83009096723667755288322961402e-2
+TABLEAU_A[14, 6] = 5.35419883074385676223797384372e-2
+TABLEAU_A[14, 7] = -5.49237485713909884646569340306e-2
+TABLEAU_A[14, 10] = -1.08347328697249322858509316994e-4
+TABLEAU_A[14, 11] = 3.82571090835658412954920192323e-4
+TABLEAU_A[14, 12] = -3.40465008687404560802977114492e-4
+TABLEAU_A[14, 13] = 1.41312443674632500278074618366e-1
+
+TABLEAU_A[15, 0] = -4.28896301583791923408573538692e-1
+TABLEAU_A[15, 5] = -4.69762141536116384314449447206
+TABLEAU_A[15, 6] = 7.68342119606259904184240953878
+TABLEAU_A[15, 7] = 4.06898981839711007970213554331
+TABLEAU_A[15, 8] = 3.56727187455281109270669543021e-1
+TABLEAU_A[15, 12] = -1.39902416515901462129418009734e-3
+TABLEAU_A[15, 13] = 2.9475147891527723389556272149
+TABLEAU_A[15, 14] = -9.15095847217987001081870187138
+
+
+B = TABLEAU_A[N_STAGES, :N_STAGES].copy()
+
+E3 = np.zeros(N_STAGES + 1)
+E3[:-1] = B
+E3[0] -= 0.244094488188976377952755905512
+E3[8] -= 0.733846688281611857341361741547
+E3[11] -= 0.220588235294117647058823529412e-1
+
+E5 = np.zeros(N_STAGES + 1)
+E5[0] = 0.1312004499419488073250102996e-1
+E5[5] = -0.1225156446376204440720569753e+1
+E5[6] = -0.4957589496572501915214079952
+E5[7] = 0.1664377182454986536961530415e+1
+E5[8] = -0.3503288487499736816886487290
+E5[9] = 0.3341791187130174790297318841
+E5[10] = 0.8192320648511571246570742613e-1
+E5[11] = -0.2235530786388629525884427845e-1
+
+# Dense output, the first 3 coefficients are computed separately (dop853_dense_output)
+D = np.zeros((INTERPOLATOR_POWER - 3, N_STAGES_EXTENDED))
+D[0, 0] = -0.84289382761090128651353491142e+1
+D[0, 5] = 0.56671495351937776962531783590
+D[0, 6] = -0.30689499459498916912797304727e+1
+D[0, 7] = 0.23846676565120698287728149680e+1
+D[0, 8] = 0.21170345824450282767155149946e+1
+D[0, 9] = -0.87139158377797299206789907490
+D[0, 10] = 0.22404374302607882758541771650e+1
+D[0, 11] = 0.63157877876946881815570249290
+D[0, 12] = -0.88990336451333310820698117400e-1
+D[0, 13] = 0.18148505520854727256656404962e+2
+D[0, 14] = -0.91946323924783554000451984436e+1
+D[0, 15] = -0.44360363875948939664310572000e+1
+
+D[1, 0] = 0.10427508642579134603413151009e+2
+D[1, 5] = 0.24228349177525818288430175319e+3
+D[1, 6] = 0.16520045171727028198505394887e+3
+D[1, 7] = -0.37454675472269020279518312152e+3
+D[1, 8] = -0.22113666853125306036270938578e+2
+D[1, 9] = 0.77334326684722638389603898808e+1
+D[1, 10] = -0.30674084731089398182061213626e+2
+D[1, 11] = -0.93321305264302278729567221706e+1
+D[1, 12] = 0.15697238121770843886131091075e+2
+D[1, 13] = -0.31139403219565177677282850411e+2
+D[1, 14] = -0.93529243588444783865713862664e+1
+D[1, 15] = 0.35816841486394083752465898540e+2
+
+D[2, 0] = 0.19985053242002433820987653617e+2
+D[2, 5] = -0.38703730874935176555105901742e+3
+D[2, 6] = -0.18917813819516756882830838328e+3
+D[2, 7] = 0.52780815920542364900561016686e+3
+D[2, 8] = -0.11573902539959630126141871134e+2
+D[2, 9] = 0.68812326946963000169666922661e+1
+D[2, 10] = -0.10006050966910838403183860980e+1
+D[2, 11] = 0.77771377980534432092869265740
+D[2, 12] = -0.27782057523535084065932004339e+1
+D[2, 13] = -0.60196695231264120758267380846e+2
+D[2, 14] = 0.84320405506677161018159903784e+2
+D[2, 15] = 0.11992291136182789328035130030e+2
+
+D[3, 0] = -0.25693933462703749003312586129e+2
+D[3, 5] = -0.15418974869023643374053993627e+3
+D[3, 6] = -0.23152937917604549567536039109e+3
+D[3, 7] = 0.35763911791061412378285349910e+3
+D[3, 8] = 0.93405324183624310003907691704e+2
+D[3, 9] = -0.37458323136451633156875139351e+2
+D[3, 10] = 0.10409964950896230045147246184e+3
+D[3, 11] = 0.29840293426660503123344363579e+2
+D[3, 12] = -0.43533456590011143754432175058e+2
+D[3, 13] = 0.96324553959188282948394950600e+2
+D[3, 14] = -0.39177261675615439165231486172e+2
+D[3, 15] = -0.14972683625798562581422125276e+3
+
+# Stages of the step proper
+A = TABLEAU_A[:N_STAGES, :N_STAGES].copy()
+C = TABLEAU_C[:N_STAGES].copy()
+# Extra stages of the 7th order dense output
+A_EXTRA = TABLEAU_A[N_STAGES + 1:].copy()
+C_EXTRA = TABLEAU_C[N_STAGES + 1:].copy()
+
+SAFETY = 0.9
+MIN_FACTOR = 0.2
+MAX_FACTOR = 10.0
+ERROR_EXPONENT = -1.0 / 8.0  # error estimator of order 7
+
+# Equations of motion understood by evaluate_rhs, params holds their constants
+EQUATIONS_SCHWARZSCHILD = 0  # y = [r, phi, pr, pphi] in coordinate time, params = [mass, Rs, c]
+EQUATIONS_EDDINGTON_FINKELSTEIN = 1  # same y in the light-cone time T = t - (r - r0) / c, same params
+EQUATIONS_ENCKE = 2  # y = deviation from a Kepler reference orbit, see encke_rhs
+
+# Encke mode: the reference orbit is rectified (rebased on the full state) once the
+# position deviation exceeds this fraction of the distance
+ENCKE_RECTIFY = 1e-6
+
+# Member status returned by the ensemble integrator (STATUS_RUNNING only by
+# integrate_dense_chunk, for a run that has more chunks to go)
+STATUS_RUNNING = -1
+STATUS_FINISHED = 0
+STATUS_CAPTURED = 1
+STATUS_ESCAPED = 2
+STATUS_FAILED = 3
+
+# Events located by integrate_dense_chunk on the dense output, y[0] is the radius and
+# y[2] the radial momentum. Horizon and escape stop the integration (same codes as the
+# member status), periapsis and apoapsis are only recorded
+EVENT_HORIZON = STATUS_CAPTURED  # r falls to capture_radius
+EVENT_ESCAPE = STATUS_ESCAPED  # r rises to escape_radius
+EVENT_PERIAPSIS = 4  # pr changes sign from - to +
+EVENT_APOAPSIS = 5  # pr changes sign from + to -
+
+
+@njit(cache = True)
+def eddington_finkelstein_rhs(y, params, dydt):
+    # Same equations of motion as EQUATIONS_SCHWARZSCHILD with the light-cone time
+    # T = t - (r - r0) / c as the independent variable (an Eddington-Finkelstein type
+    # time, exact for these equations, whose particle reaches r = Rs at a finite t).
+    # Written in ds = dt / f they have no singular term, dt/ds = f, dr/ds = pr / mass,
+    # and each is divided by dT/ds = f - pr / (mass c), which stays positive through
+    # r = Rs for infalling motion and outside it for anything slower than light
+    mass = params[0]
+    Rs = params[1]
+    c = params[2]
+    r = y[0]
+    pr = y[2]
+    pphi = y[3]
+
+    f = 1 - Rs / r
+    dT_ds = f - pr / (mass * c)
+    dydt[0] = pr / (mass * dT_ds)
+    dydt[1] = pphi * f / (mass * r**2 * dT_ds)
+    dydt[2] = (-mass * c**2 * Rs / (2 * r**2) + pphi**2 * f / (mass * r**3)) / dT_ds
+    dydt[3] = 0.0
+
+
+@njit(cache = True)
+def encke_reference(params, t, position, velocity):
+    # Kepler reference orbit at t, params = [mass, Rs, c, t_ref, x, y, vx, vy,
+    # r_scale, v_scale] with the reference state at t_ref
+    position[0] = params[4]
+    position[1] = params[5]
+    velocity[0] = params[6]
+    velocity[1] = params[7]
+    kepler_drift(0.5 * params[2]**2 * params[1], position, velocity, t - params[3])
+
+
+@njit(cache = True)
+def encke_rhs(t, y, params, dydt):
+    # Same motion as EQUATIONS_SCHWARZSCHILD written as a central acceleration in
+    # Cartesian coordinates, integrated as the deviation y = [dx / r_scale, dy / r_scale,
+    # dvx / v_scale, dvy / v_scale] from a Kepler orbit of mu = G M = c^2 Rs / 2. The
+    # Kepler difference uses Battin's f(q) and the relativistic excess is written in
+    # powers of Rs / r, so nothing cancels and loose tolerances on the small deviation
+    # still give the full-motion accuracy
+    Rs = params[1]
+    c = params[2]
+    r_scale = params[8]
+    v_scale = params[9]
+    mu = 0.5 * c**2 * Rs
+    reference = np.empty(2)
+    reference_velocity = np.empty(2)
+    encke_reference(params, t, reference, reference_velocity)
+    dx = y[0] * r_scale
+    dy = y[1] * r_scale
+    x = reference[0] + dx
+    yy = reference[1] + dy
+    vx = reference_velocity[0] + y[2] * v_scale
+    vy = reference_velocity[1] + y[3] * v_scale
+
+    rho2 = reference[0]**2 + reference[1]**2
+    q = (dx * (dx + 2 * reference[0]) + dy * (dy + 2 * reference[1])) / rho2
+    fq = q * (3 + 3 * q + q * q) / (1 + (1 + q)**1.5)
+    kepler = mu / (rho2 * np.sqrt(rho2))
+    excess = fq / (1 + q)**1.5
+
+    r = np.sqrt(x * x + yy * yy)
+    eps = Rs / r
+    f = 1 - eps
+    l = x * vy - yy * vx
+    r_dot = (x * vx + yy * vy) / r
+    radial = (-c**2 * Rs / (2 * r**2) * eps * (2 - eps) / f**2 + l**2 / r**3 * eps / f
+              - Rs * r_dot**2 / (r**2 * f)) / r
+
+    dydt[0] = y[2] * v_scale / r_scale
+    dydt[1] = y[3] * v_scale / r_scale
+    dydt[2] = (kepler * (-dx + excess * x) + radial * x) / v_scale
+    dydt[3] = (kepler * (-dy + excess * yy) + radial * yy) / v_scale
+
+
+@njit(cache = True)
+def encke_state(params, t, y, state):
+    # [r, phi, pr, pphi] of the Schwarzschild formulation from the Encke deviation y at t
+    mass = params[0]
+    Rs = params[1]
+    reference = np.empty(2)
+    reference_velocity = np.empty(2)
+    encke_reference(params, t, reference, reference_velocity)
+    x = reference[0] + y[0] * params[8]
+    yy = reference[1] + y[1] * params[8]
+    vx = reference_velocity[0] + y[2] * params[9]
+    vy = reference_velocity[1] + y[3] * params[9]
+    r = np.sqrt(x * x + yy * yy)
+    state[0] = r
+    state[1] = np.arctan2(yy, x)
+    state[2] = mass * (1 - Rs / r) * (x * vx + yy * vy) / r
+    state[3] = mass * (x * vy - yy * vx)
+
+
+@njit(cache = True)
+def encke_rectify(params, t, y):
+    # Rebases the reference orbit on the full state at t and zeroes the deviation
+    reference = np.empty(2)
+    reference_velocity = np.empty(2)
+    encke_reference(params, t, reference, reference_velocity)
+    params[3] = t
+    params[4] = reference[0] + y[0] * params[8]
+    params[5] = reference[1] + y[1] * params[8]
+    params[6] = reference_velocity[0] + y[2] * params[9]
+    params[7] = reference_velocity[1] + y[3] * params[9]
+    y[:] = 0.0
+
+
+@njit(cache = True)
+def evaluate_rhs(equations, t, y, params, dydt):
+    if equations == EQUATIONS_EDDINGTON_FINKELSTEIN:
+        eddington_finkelstein_rhs(y, params, dydt)
+        return
+    if equations == EQUATIONS_ENCKE:
+        encke_rhs(t, y, params, dydt)
+        return
+
+    # Same operations as geodesic_equations in Schwarzschild.py
+    mass = params[0]
+    Rs = params[1]
+    c = params[2]
+    r = y[0]
+    pr = y[2]
+    pphi = y[3]
+
+    f = 1 - Rs / r
+    dydt[0] = pr / (mass * f)
+    dydt[1] = pphi / (mass * r**2)
+    dydt[2] = -mass * c**2 * Rs / (2 * r**2 * f) + pphi**2 / (mass * r**3)
+    dydt[3] = 0.0
+
+
+@njit(cache = True)
+def rms_norm(x):
+    return np.sqrt(np.sum(x * x) / x.shape[0])
+
+
+@njit(cache = True)
+def select_initial_step(equations, params, t0, y0, f0, t_bound, rtol, atol):
+    # Hairer's starting step, as scipy.integrate._ivp.common.select_initial_step
+    interval_length = abs(t_bound - t0)
+    if interval_length == 0.0:
+        return 0.0
+    scale = atol + np.abs(y0) * rtol
+    d0 = rms_norm(y0 / scale)
+    d1 = rms_norm(f0 / scale)
+    if d0 < 1e-5 or d1 < 1e-5:
+        h0 = 1e-6
+    else:
+        h0 = 0.01 * d0 / d1
+    h0 = min(h0, interval_length)
+    f1 = np.empty_like(y0)
+    evaluate_rhs(equations, t0 + h0, y0 + h0 * f0, params, f1)
+    d2 = rms_norm((f1 - f0) / scale) / h0
+    if d1 <= 1e-15 and d2 <= 1e-15:
+        h1 = max(1e-6, h0 * 1e-3)
+    else:
+        h1 = (0.01 / max(d1, d2)) ** (1.0 / 8.0)
+    return min(100 * h0, h1, interval_length)
+
+
+@njit(cache = True)
+def dop853_step(equations, params, t, y, f, h, K, y_new):
+    # One DOP853 step: fills the stages K[0..12] (K[12] = f(t + h, y_new)) and y_new
+    n = y.shape[0]
+    K[0] = f
+    stage_y = np.empty(n)
+    for s in range(1, N_STAGES):
+        for k in range(n):
+            dy = 0.0
+            for j in range(s):
+                dy += K[j, k] * A[s, j]
+            stage_y[k] = y[k] + dy * h
+        evaluate_rhs(equations, t + C[s] * h, stage_y, params, K[s])
+    for k in range(n):
+        dy = 0.0
+        for j in range(N_STAGES):
+            dy += K[j, k] * B[j]
+        y_new[k] = y[k] + h * dy
+    evaluate_rhs(equations, t + h, y_new, params, K[N_STAGES])
+
+
+@njit(cache = True)
+def dop853_error_norm(K, h, y, y_new, rtol, atol):
+    n = y.shape[0]
+    err5_norm_2 = 0.0
+    err3_norm_2 = 0.0
+    for k in range(n):
+        scale = atol + max(abs(y[k]), abs(y_new[k])) * rtol
+        err5 = 0.0
+        err3 = 0.0
+        for j in range(N_STAGES + 1):
+            err5 += K[j, k] * E5[j]
+            err3 += K[j, k] * E3[j]
+        err5_norm_2 += (err5 / scale) ** 2
+        err3_norm_2 += (err3 / scale) ** 2
+    if err5_norm_2 == 0 and err3_norm_2 == 0:
+        return 0.0
+    denom = err5_norm_2 + 0.01 * err3_norm_2
+    return abs(h) * err5_norm_2 / np.sqrt(denom * n)
+
+
+@njit(cache = True)
+def dop853_attempt(equations, params, t, y, f, h_abs, t_bound, rtol, atol, K, y_new):
+    # Retries the step from (t, y) until the error estimate is accepted, returns the
+    # new time, the step length taken, the proposed next step (negative on failure)
+    # and the number of right-hand side evaluations
+    min_step = 10 * abs(np.nextafter(t, np.inf) - t)
+    h_abs = max(h_abs, min_step)
+    nfev = 0
+    step_rejected = False
+    while True:
+        if h_abs < min_step:
+            return t, 0.0, -1.0, nfev
+        t_new = min(t + h_abs, t_bound)
+        h = t_new - t
+        h_abs = abs(h)
+        dop853_step(equations, params, t, y, f, h, K, y_new)
+        nfev += N_STAGES
+        error_norm = dop853_error_norm(K, h, y, y_new, rtol, atol)
+        if error_norm < 1:
+            if error_norm == 0:
+                factor = MAX_FACTOR
+            else:
+                factor = min(MAX_FACTOR, SAFETY * error_norm ** ERROR_EXPONENT)
+            if step_rejected:
+                factor = min(1.0, factor)
+            return t_new, h, h_abs * factor, nfev
+        if not np.isfinite(error_norm):
+            error_norm = 1e10
+        h_abs *= max(MIN_FACTOR, SAFETY * error_norm ** ERROR_EXPONENT)
+        step_rejected = True
+
+
+@njit(cache = True)
+def integrate_member(equations, params, y0, t_end, rtol, atol, capture_radius, escape_radius, y_out):
+    # Integrates one ensemble member to t_end or until r = y[0] drops below
+    # capture_radius / exceeds escape_radius (crossing located on the step's dense
+    # output as in integrate_dense_chunk, the member ends on the crossing state).
+    # Returns status, end time, minimum r and its time, number of steps and evaluations
+    n = y0.shape[0]
+    K = np.empty((N_STAGES_EXTENDED, n))
+    F = np.empty((INTERPOLATOR_POWER, n))
+    y = y0.copy()
+    y_new = np.empty(n)
+    f = np.empty(n)
+    evaluate_rhs(equations, 0.0, y, params, f)
+    nfev = 1
+    t = 0.0
+    h_abs = select_initial_step(equations, params, t, y, f, t_end, rtol, atol)
+    nfev += 1
+    r_min = y[0]
+    t_r_min = 0.0
+    steps = 0
+    status = STATUS_FINISHED
+
+    while t < t_end:
+        t_new, h, h_abs, evaluations = dop853_attempt(equations, params, t, y, f, h_abs, t_end, rtol, atol, K, y_new)
+        nfev += evaluations
+        if h_abs < 0 or not np.all(np.isfinite(y_new)):
+            status = STATUS_FAILED
+            break
+        steps += 1
+
+        if y_new[0] <= capture_radius or y_new[0] >= escape_radius:
+            status = STATUS_CAPTURED if y_new[0] <= capture_radius else STATUS_ESCAPED
+            if not event_crossed(status, y, capture_radius, escape_radius):
+                dop853_dense_output(equations, params, t, h, y, y_new, K[N_STAGES], K, F)
+                nfev += N_STAGES_EXTENDED - N_STAGES - 1
+                # y_new becomes the state at the crossing
+                t_new = locate_event(status, t, h, y, F, capture_radius, escape_radius, y_new)
+        if y_new[0] < r_min:
+            r_min = y_new[0]
+            t_r_min = t_new
+        t = t_new
+        y[:] = y_new
+        if status != STATUS_FINISHED:
+            break
+        f[:] = K[N_STAGES]
+
+    y_out[:] = y
+    return status, t, r_min, t_r_min, steps, nfev
+
+
+@njit(cache = True)
+def dop853_dense_output(equations, params, t_old, h, y_old, y, f, K, F):
+    # Interpolant of the step just taken from (t_old, y_old) to (t_old + h, y), as
+    # scipy's DOP853._dense_output_impl: K holds the 13 stages of the step, the 3 extra
+    # stages are added to it and the coefficients written to F
+    n = y.shape[0]
+    stage_y = np.empty(n)
+    for e in range(N_STAGES_EXTENDED - N_STAGES - 1):
+        s = N_STAGES + 1 + e
+        for k in range(n):
+            dy = 0.0
+            for j in range(s):
+                dy += K[j, k] * A_EXTRA[e, j]
+            stage_y[k] = y_old[k] + dy * h
+        evaluate_rhs(equations, t_old + C_EXTRA[e] * h, stage_y, params, K[s])
+    for k in range(n):
+        delta_y = y[k] - y_old[k]
+        F[0, k] = delta_y
+        F[1, k] = h * K[0, k] - delta_y
+        F[2, k] = 2 * delta_y - h * (f[k] + K[0, k])
+        for i in range(INTERPOLATOR_POWER - 3):
+            dy = 0.0
+            for j in range(N_STAGES_EXTENDED):
+                dy += D[i, j] * K[j, k]
+            F[3 + i, k] = h * dy
+
+
+@njit(cache = True)
+def dop853_interpolate(t_old, h, y_old, F, t, y_out):
+    # Evaluates the dense output at t, same Horner scheme as Dop853DenseOutput
+    x = (t - t_old) / h
+    for k in range(y_old.shape[0]):
+        value = 0.0
+        for i in range(INTERPOLATOR_POWER):
+            value += F[INTERPOLATOR_POWER - 1 - i, k]
+            if i % 2 == 0:
+                value *= x
+            else:
+                value *= 1 - x
+        y_out[k] = value + y_old[k]
+
+
+@njit(cache = True)
+def sample_time(t_eval, n_samples, t_end, i):
+    # Output time i: t_eval[i], or with an empty t_eval sample i of
+    # np.linspace(0, t_end, n_samples) computed on the fly (same rounding), so a run
+    # with 1e8 samples never holds the whole grid
+    if t_eval.shape[0] > 0:
+        return t_eval[i]
+    if n_samples < 2:
+        return 0.0
+    if i == n_samples - 1:
+        return t_end
+    return i * (t_end / (n_samples - 1))
+
+
+@njit(cache = True)
+def sample_count(t_eval, n_samples, t_end, t):
+    # Number of output times <= t, as np.searchsorted(t_eval, t, side="right")
+    if t_eval.shape[0] > 0:
+        return np.searchsorted(t_eval, t, side="right")
+    if n_samples < 2:
+        return n_samples if t >= 0 else 0
+    i = min(max(int(t / (t_end / (n_samples - 1))) + 1, 0), n_samples)
+    while i < n_samples and sample_time(t_eval, n_samples, t_end, i) <= t:
+        i += 1
+    while i > 0 and sample_time(t_eval, n_samples, t_end, i - 1) > t:
+        i -= 1
+    return i
+
+
+@njit(cache = True)
+def event_crossed(kind, y, capture_radius, escape_radius):
+    # True once the state y is on the far side of the event surface
+    if kind == EVENT_HORIZON:
+        return y[0] <= capture_radius
+    if kind == EVENT_ESCAPE:
+        return y[0] >= escape_radius
+    if kind == EVENT_PERIAPSIS:
+        return y[2] >= 0
+    return y[2] <= 0
+
+
+@njit(cache = True)
+def locate_event(kind, t, h, y_old, F, capture_radius, escape_radius, y_event):
+    # Bisection on the dense output of the step (t, t + h) down to adjacent doubles,
+    # returns the first time on the far side of the event surface and its state in y_event
+    lo = t
+    hi = t + h
+    while True:
+        mid = 0.5 * (lo + hi)
+        if mid <= lo or mid >= hi:
+            break
+        dop853_interpolate(t, h, y_old, F, mid, y_event)
+        if event_crossed(kind, y_event, capture_radius, escape_radius):
+            hi = mid
+        else:
+            lo = mid
+    dop853_interpolate(t, h, y_old, F, hi, y_event)
+    return hi
+
+
+@njit(cache = True, nogil = True)
+def integrate_dense_chunk(equations, params, t, y, f, h_abs, t_end, rtol, atol, t_eval, n_samples, t_eval_i, save_every, chunk_size, capture_radius, escape_radius, detect_apsides):
+    # Adaptive DOP853 steps from (t, y) with f = rhs(t, y) until t_end or until at least
+    # chunk_size samples are kept, y and f are updated in place. Every output sample
+    # passed by a step whose index is a multiple of save_every is interpolated from the
+    # step's dense output, as solve_ivp(t_eval=...) followed by [::save_every]. The
+    # samples are t_eval, or n_samples evenly spaced over [0, t_end] if t_eval is empty.
+    # The run stops at the horizon / escape events (located to double precision, t and y
+    # are then the event state), apsides are recorded when detect_apsides is set.
+    # Returns t, the next step size, the next t_eval index, status, steps, evaluations,
+    # rejected steps, the kept times (rows,) and states (rows, n) and the event times and
+    # kinds
+    n = y.shape[0]
+    K = np.empty((N_STAGES_EXTENDED, n))
+    F = np.empty((INTERPOLATOR_POWER, n))
+    y_old = np.empty(n)
+    y_new = np.empty(n)
+    y_event = np.empty(n)
+    out_t = np.empty(chunk_size)
+    out_y = np.empty((chunk_size, n))
+    event_t = np.empty(16)
+    event_kind = np.empty(16, dtype=np.int64)
+    saved = 0
+    events = 0
+    steps = 0
+    nfev = 0
+    rejected = 0
+    status = STATUS_RUNNING
+
+    while saved < chunk_size:
+        if t >= t_end:
+            status = STATUS_FINISHED
+            break
+        t_new, h, h_abs, evaluations = dop853_attempt(equations, params, t, y, f, h_abs, t_end, rtol, atol, K, y_new)
+        nfev += evaluations
+        # Every attempt but the accepted one was rejected
+        rejected += evaluations // N_STAGES - (1 if h_abs >= 0 else 0)
+        if h_abs < 0 or not np.all(np.isfinite(y_new)):
+            status = STATUS_FAILED
+            break
+        steps += 1
+        y_old[:] = y
+        y[:] = y_new
+        dense = False
+
+        # Events inside the step, the terminal ones cut the step short at their time
+        t_stop = t_new
+        for kind in (EVENT_HORIZON, EVENT_ESCAPE, EVENT_PERIAPSIS, EVENT_APOAPSIS):
+            if (kind == EVENT_PERIAPSIS or kind == EVENT_APOAPSIS) and not detect_apsides:
+                continue
+            if event_crossed(kind, y_old, capture_radius, escape_radius) or not event_crossed(kind, y, capture_radius, escape_radius):
+                continue
+            if not dense:
+                dop853_dense_output(equations, params, t, h, y_old, y, K[N_STAGES], K, F)
+                nfev += N_STAGES_EXTENDED - N_STAGES - 1
+                dense = True
+            t_event = locate_event(kind, t, h, y_old, F, capture_radius, escape_radius, y_event)
+            if t_event > t_stop:
+                continue
+            if events == event_t.shape[0]:
+                event_t = np.concatenate((event_t, np.empty(events)))
+                event_kind = np.concatenate((event_kind, np.empty(events, dtype=np.int64)))
+            event_t[events] = t_event
+            event_kind[events] = kind
+            events += 1
+            if kind == EVENT_HORIZON or kind == EVENT_ESCAPE:
+                t_stop = t_event
+                status = kind
+                y_new[:] = y_event
+
+        # Samples in (t, t_stop] (t_eval[0] = t at the very start)
+        t_eval_i_new = sample_count(t_eval, n_samples, t_end, t_stop)
+        first_kept = -(-t_eval_i // save_every) * save_every
+        if first_kept < t_eval_i_new:
+            if not dense:
+                dop853_dense_output(equations, params, t, h, y_old, y, K[N_STAGES], K, F)
+                nfev += N_STAGES_EXTENDED - N_STAGES - 1
+                dense = True
+            for i in range(first_kept, t_eval_i_new, save_every):
+                if saved == out_t.shape[0]:
+                    out_t = np.concatenate((out_t, np.empty(out_t.shape[0])))
+                    out_y = np.concatenate((out_y, np.empty((out_y.shape[0], n))))
+                out_t[saved] = sample_time(t_eval, n_samples, t_end, i)
+                dop853_interpolate(t, h, y_old, F, out_t[saved], out_y[saved])
+                saved += 1
+        t_eval_i = t_eval_i_new
+
+        if status != STATUS_RUNNING:
+            # Terminal event, the run ends on the event state
+            t = t_stop
+            y[:] = y_new
+            evaluate_rhs(equations, t, y, params, f)
+            break
+        f[:] = K[N_STAGES]
+        t = t_new
+
+    if status == STATUS_RUNNING and t >= t_end:
+        status = STATUS_FINISHED
+    return t, h_abs, t_eval_i, status, steps, nfev, rejected, out_t[:saved], out_y[:saved], event_t[:events], event_kind[:events]
+
+
+@njit(cache = True)
+def locate_encke_event(kind, t, h, y_old, F, params, capture_radius, escape_radius, state):
+    # locate_event on the Schwarzschild state of the interpolated Encke deviation
+    n = y_old.shape[0]
+    y_event = np.empty(n)
+    lo = t
+    hi = t + h
+    while True:
+        mid = 0.5 * (lo + hi)
+        if mid <= lo or mid >= hi:
+            break
+        dop853_interpolate(t, h, y_old, F, mid, y_event)
+        encke_state(params, mid, y_event, state)
+        if event_crossed(kind, state, capture_radius, escape_radius):
+            hi = mid
+        else:
+            lo = mid
+    dop853_interpolate(t, h, y_old, F, hi, y_event)
+    encke_state(params, hi, y_event, state)
+    return hi
+
+
+@njit(cache = True, nogil = True)
+def integrate_encke_chunk(params, t, y, f, h_abs, t_end, rtol, atol, t_eval, n_samples, t_eval_i, save_every, chunk_size, capture_radius, escape_radius, detect_apsides):
+    # integrate_dense_chunk for EQUATIONS_ENCKE: y is the deviation from the Kepler
+    # reference in params, which is rectified in place after any step that leaves the
+    # position deviation above ENCKE_RECTIFY of the distance. Samples and events are
+    # taken on the Schwarzschild state [r, phi, pr, pphi], so the kept states are in the
+    # same variables as integrate_dense_chunk's. Returns the same values plus the
+    # number of rectifications
+    n = y.shape[0]
+    K = np.empty((N_STAGES_EXTENDED, n))
+    F = np.empty((INTERPOLATOR_POWER, n))
+    y_old = np.empty(n)
+    y_new = np.empty(n)
+    y_sample = np.empty(n)
+    state_old = np.empty(4)
+    state_new = np.empty(4)
+    state_event = np.empty(4)
+    reference = np.empty(2)
+    reference_velocity = np.empty(2)
+    out_t = np.empty(chunk_size)
+    out_y = np.empty((chunk_size, 4))
+    event_t = np.empty(16)
+    event_kind = np.empty(16, dtype=np.int64)
+    saved = 0
+    events = 0
+    steps = 0
+    nfev = 0
+    rejected = 0
+    rectifications = 0
+    status = STATUS_RUNNING
+
+    while saved < chunk_size:
+        if t >= t_end:
+            status = STATUS_FINISHED
+            break
+        t_new, h, h_abs, evaluations = dop853_attempt(EQUATIONS_ENCKE, params, t, y, f, h_abs, t_end, rtol, atol, K, y_new)
+        nfev += evaluations
+        rejected += evaluations // N_STAGES - (1 if h_abs >= 0 else 0)
+        if h_abs < 0 or not np.all(np.isfinite(y_new)):
+            status = STATUS_FAILED
+            break
+        steps += 1
+        y_old[:] = y
+        y[:] = y_new
+        dense = False
+        encke_state(params, t, y_old, state_old)
+        encke_state(params, t_new, y, state_new)
+
+        # Events inside the step, the terminal ones cut the step short at their time
+        t_stop = t_new
+        for kind in (EVENT_HORIZON, EVENT_ESCAPE, EVENT_PERIAPSIS, EVENT_APOAPSIS):
+            if (kind == EVENT_PERIAPSIS or kind == EVENT_APOAPSIS) and not detect_apsides:
+                continue
+            if event_crossed(kind, state_old, capture_radius, escape_radius) or not event_crossed(kind, state_new, capture_radius, escape_radius):
+                continue
+            if not dense:
+                dop853_dense_output(EQUATIONS_ENCKE, params, t, h, y_old, y, K[N_STAGES], K, F)
+                nfev += N_STAGES_EXTENDED - N_STAGES - 1
+                dense = True
+            t_event = locate_encke_event(kind, t, h, y_old, F, params, capture_radius, escape_radius, state_event)
+            if t_event > t_stop:
+                continue
+            if events == event_t.shape[0]:
+                event_t = np.concatenate((event_t, np.empty(events)))
+                event_kind = np.concatenate((event_kind, np.empty(events, dtype=np.int64)))
+            event_t[events] = t_event
+            event_kind[events] = kind
+            events += 1
+            if kind == EVENT_HORIZON or kind == EVENT_ESCAPE:
+                t_stop = t_event
+                status = kind
+                dop853_interpolate(t, h, y_old, F, t_event, y_new)
+
+        # Samples in (t, t_stop]
+        t_eval_i_new = sample_count(t_eval, n_samples, t_end, t_stop)
+        first_kept = -(-t_eval_i // save_every) * save_every
+        if first_kept < t_eval_i_new:
+            if not dense:
+                dop853_dense_output(EQUATIONS_ENCKE, params, t, h, y_old, y, K[N_STAGES], K, F)
+                nfev += N_STAGES_EXTENDED - N_STAGES - 1
+                dense = True
+            for i in range(first_kept, t_eval_i_new, save_every):
+                if saved == out_t.shape[0]:
+                    out_t = np.concatenate((out_t, np.empty(out_t.shape[0])))
+                    out_y = np.concatenate((out_y, np.empty((out_y.shape[0], 4))))
+                out_t[saved] = sample_time(t_eval, n_samples, t_end, i)
+                dop853_interpolate(t, h, y_old, F, out_t[saved], y_sample)
+                encke_state(params, out_t[saved], y_sample, out_y[saved])
+                saved += 1
+        t_eval_i = t_eval_i_new
+
+        if status != STATUS_RUNNING:
+            # Terminal event, the run ends on the event state
+            t = t_stop
+            y[:] = y_new
+            evaluate_rhs(EQUATIONS_ENCKE, t, y, params, f)
+            break
+        t = t_new
+
+        encke_reference(params, t, reference, reference_velocity)
+        deviation = (y[0]**2 + y[1]**2) * params[8]**2
+        if deviation > ENCKE_RECTIFY**2 * (reference[0]**2 + reference[1]**2):
+            encke_rectify(params, t, y)
+            evaluate_rhs(EQUATIONS_ENCKE, t, y, params, f)
+            nfev += 1
+            rectifications += 1
+        else:
+            f[:] = K[N_STAGES]
+
+    if status == STATUS_RUNNING and t >= t_end:
+        status = STATUS_FINISHED
+    return t, h_abs, t_eval_i, status, steps, nfev, rejected, out_t[:saved], out_y[:saved], event_t[:events], event_kind[:events], rectifications
+
+
+def solve_dop853(equations, params, y0, t_span, t_eval, rtol, atol, chunk_size = 100000):
+    # Drop-in for solve_ivp(method='DOP853', t_eval=t_eval) on the compiled equations,
+    # returns an OptimizeResult with the same t, y (n, len(t)), nfev, status and success
+    params = np.ascontiguousarray(params, dtype=np.float64)
+    t_eval = np.ascontiguousarray(t_eval, dtype=np.float64)
+    t, t_end = float(t_span[0]), float(t_span[1])
+    y = np.array(y0, dtype=np.float64)
+    f = np.empty_like(y)
+    evaluate_rhs(equations, t, y, params, f)
+    h_abs = select_initial_step(equations, params, t, y, f, t_end, rtol, atol)
+    nfev = 2
+    t_eval_i = 0
+    times = []
+    states = []
+    status = STATUS_RUNNING
+    while status == STATUS_RUNNING:
+        t, h_abs, t_eval_i, status, steps, evaluations, _, out_t, out_y, event_t, event_kind = integrate_dense_chunk(
+            equations, params, t, y, f, h_abs, t_end, rtol, atol, t_eval, t_eval.shape[0], t_eval_i, 1, chunk_size, 0.0, np.inf, False
+        )
+        nfev += evaluations
+        times.append(out_t)
+        states.append(out_y)
+    success = status == STATUS_FINISHED
+    return OptimizeResult(
+        t=np.concatenate(times), y=np.concatenate(states).T, nfev=nfev, njev=0, nlu=0,
+        status=0 if success else -1, success=success,
+        message="The solver successfully reached the end of the integration interval." if success else "Required step size is less than spacing between numbers."
+    )
+
+
+@njit(cache = True, parallel = True)
+def integrate_ensemble(equations, params, y0, t_end, rtol, atol, capture_radius, escape_radius, status, end_time, y_end, r_min, t_r_min, steps, nfev):
+    # Every member (row of y0) gets its own adaptive steps and its own termination,
+    # the members are spread over all cores
+    for m in prange(y0.shape[0]):
+        member_status, t, member_r_min, member_t_r_min, member_steps, member_nfev = integrate_member(
+            equations, params, y0[m], t_end, rtol, atol, capture_radius, escape_radius, y_end[m]
+        )
+        status[m] = member_status
+        end_time[m] = t
+        r_min[m] = member_r_min
+        t_r_min[m] = member_t_r_min
+        steps[m] = member_steps
+        nfev[m] = member_nfev
+
+
+def warm_up():
+    start_time = time.time()
+    params = np.array([1.0, 1.0, 1.0])
+    y0 = np.array([[10.0, 0.0, 0.0, 3.0]])
+    m = y0.shape[0]
+    integrate_ensemble(EQUATIONS_SCHWARZSCHILD, params, y0, 1.0, 1e-10, 1e-12, 1.5, 100.0,
+                       np.empty(m, dtype=np.int64), np.empty(m), np.empty_like(y0), np.empty(m), np.empty(m),
+                       np.empty(m, dtype=np.int64), np.empty(m, dtype=np.int64))
+    solve_dop853(EQUATIONS_SCHWARZSCHILD, params, y0[0], (0.0, 1.0), np.linspace(0.0, 1.0, 16), 1e-10, 1e-12)
+    solve_dop853(EQUATIONS_EDDINGTON_FINKELSTEIN, params, y0[0], (0.0, 1.0), np.linspace(0.0, 1.0, 16), 1e-10, 1e-12)
+    encke_params = np.array([1.0, 1.0, 1.0, 0.0, 10.0, 0.0, 0.0, 0.3, 10.0, 0.3])
+    y = np.zeros(4)
+    f = np.empty(4)
+    evaluate_rhs(EQUATIONS_ENCKE, 0.0, y, encke_params, f)
+    integrate_encke_chunk(encke_params, 0.0, y, f, 0.1, 1.0, 1e-9, 1e-15, np.empty(0), 16, 0, 1, 16, 1.5, 100.0, True)
+    return time.time() - start_time
+
+
+if __name__ == "__main__":
+    elapsed = warm_up()
+    print(f"GR kernels ready in: {elapsed}s")
+    sys.exit(0)
@@ -0,0 +1,207 @@
+import numpy as np
+import os
+
+# Level-of-detail rendering of long 2D paths (x(i), y(i) sampled along a trajectory).
+# A PathPyramid splits the samples into blocks of `base` samples and keeps, per block,
+# the index and value of its smallest and largest x and y (M4 decimation extended to a
+# path); every further level merges pairs of blocks, so level k has blocks of base * 2**k
+# samples. Drawing a block as its first sample, its four extremes in index order and its
+# last sample covers the same pixels as the samples themselves once the block spans no
+# more than a pixel. An LODLine picks, for the current view, the coarsest level whose
+# visible blocks are that small (the raw samples below level 0) within a budget of
+# VERTICES_PER_PIXEL vertices per pixel of the longer side of the axes, and redraws when
+# the view is zoomed, panned or resized.
+# The samples are only read through their (memory-mapped) arrays: once per block to
+# build level 0, and for the handful of vertices drawn.
+
+# Level 0 holds at most this many blocks, with at least MIN_BLOCK samples each
+MAX_BLOCKS = 2**20
+MIN_BLOCK = 16
+# Samples read at a time while building level 0
+BUILD_ROWS = 2**20
+# Pyramids of trajectories with at least this many rows are stored next to the columns
+SAVE_ROWS = 10**6
+# Largest on-screen extent (pixels) of a drawn block
+BLOCK_PIXELS = 1.0
+# Vertices drawn per pixel of the longer side of the axes, a min / max pair per pixel
+# column as in M4 decimation
+VERTICES_PER_PIXEL = 2
+
+
+class PathPyramid:
+    def __init__(self, rows, base, levels):
+        # levels[k] = (values, indices), both (blocks, 4) in the order min x, max x,
+        # min y, max y
+        self.rows = rows
+        self.base = base
+        self.levels = levels
+
+    @classmethod
+    def build(cls, x, y, base=None):
+        rows = len(x)
+        if base is None:
+            base = MIN_BLOCK
+            while rows > base * MAX_BLOCKS:
+                base *= 2
+        blocks = -(-rows // base)
+        values = np.empty((blocks, 4))
+        indices = np.empty((blocks, 4), dtype=np.int64)
+        step = max(BUILD_ROWS // base, 1) * base
+        for start in range(0, rows, step):
+            stop = min(start + step, rows)
+            full = (stop - start) // base * base
+            first = start // base
+            for column, data in ((0, x), (2, y)):
+                chunk = np.asarray(data[start:stop])
+                if full:
+                    block = chunk[:full].reshape(-1, base)
+                    offsets = np.arange(start, start + full, base)
+                    for k, reduce in ((column, np.argmin), (column + 1, np.argmax)):
+                        at = reduce(block, axis=1)
+                        indices[first:first + len(at), k] = offsets + at
+                        values[first:first + len(at), k] = block[np.arange(len(at)), at]
+                if full < len(chunk):
+                    # The last, partial block
+                    tail = chunk[full:]
+                    for k, reduce in ((column, np.argmin), (column + 1, np.argmax)):
+                        at = reduce(tail)
+                        indices[blocks - 1, k] = start + full + at
+                        values[blocks - 1, k] = tail[at]
+
+        levels = [(values, indices)]
+        while len(values) > 1:
+            if len(values) % 2:
+                values = np.vstack([values, values[-1:]])
+                indices = np.vstack([indices, indices[-1:]])
+            left, right = values[0::2], values[1::2]
+            # Columns 0 and 2 keep the smaller value, 1 and 3 the larger
+            take_right = np.where([True, False, True, False], right < left, right > left)
+            values = np.where(take_right, right, left)
+            indices = np.where(take_right, indices[1::2], indices[0::2])
+            levels.append((values, indices))
+        return cls(rows, base, levels)
+
+    def block_size(self, level):
+        return self.base << level
+
+    def save(self, path):
+        arrays = {"rows": self.rows, "base": self.base}
+        for k, (values, indices) in enumerate(self.levels):
+            arrays[f"values_{k}"] = values
+            arrays[f"indices_{k}"] = indices
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            levels = [(data[f"values_{k}"], data[f"indices_{k}"]) for k in range(sum(name.startswith("values_") for name in data.files))]
+            return cls(int(data["rows"]), int(data["base"]), levels)
+
+
+def trajectory_pyramid(trajectory, x_column, y_column):
+    # The pyramid of two columns of a trajectory, read from / stored in the trajectory
+    # directory (lod_<x>_<y>.npz) when it is large; a stored pyramid older than the
+    # columns or of another length is rebuilt
+    from trajectory import column_path
+
+    x, y = trajectory[x_column], trajectory[y_column]
+    if len(trajectory) < SAVE_ROWS:
+        return PathPyramid.build(x, y)
+    path = os.path.join(trajectory.path, f"lod_{x_column}_{y_column}.npz")
+    newest = max(os.path.getmtime(column_path(trajectory.path, column)) for column in (x_column, y_column))
+    if os.path.exists(path) and os.path.getmtime(path) >= newest:
+        pyramid = PathPyramid.load(path)
+        if pyramid.rows == len(trajectory):
+            return pyramid
+    pyramid = PathPyramid.build(x, y)
+    try:
+        pyramid.save(path)
+    except OSError:
+        pass
+    return pyramid
+
+
+def path_vertices(x, y, pyramid, view, pixels):
+    # Vertices of the path drawn in view = (x0, x1, y0, y1) on an area of pixels = (width,
+    # height), runs of the path that leave the view are separated by NaN
+    x0, x1, y0, y1 = view
+    scale_x = pixels[0] / max(x1 - x0, np.finfo(float).tiny)
+    scale_y = pixels[1] / max(y1 - y0, np.finfo(float).tiny)
+    budget = max(int(VERTICES_PER_PIXEL * max(pixels)), 64)
+
+    chosen = None
+    for level in range(len(pyramid.levels) - 1, -1, -1):
+        values, _ = pyramid.levels[level]
+        visible = (values[:, 1] >= x0) & (values[:, 0] <= x1) & (values[:, 3] >= y0) & (values[:, 2] <= y1)
+        # One block more on either side, so the path runs on to the edge of the view
+        visible[1:] |= visible[:-1].copy()
+        visible[:-1] |= visible[1:].copy()
+        blocks = np.flatnonzero(visible)
+        if chosen is not None and 6 * len(blocks) > budget:
+            break
+        chosen = level, blocks
+        extent = np.maximum((values[blocks, 1] - values[blocks, 0]) * scale_x, (values[blocks, 3] - values[blocks, 2]) * scale_y)
+        if len(blocks) == 0 or extent.max() <= BLOCK_PIXELS:
+            break
+    level, blocks = chosen
+    if len(blocks) == 0:
+        return np.empty(0), np.empty(0)
+
+    size = pyramid.block_size(level)
+    # Consecutive visible blocks form runs of the path
+    breaks = np.flatnonzero(np.diff(blocks) > 1) + 1
+    run_starts = blocks[np.r_[0, breaks]] * size
+    run_stops = np.minimum((blocks[np.r_[breaks - 1, -1]] + 1) * size, pyramid.rows)
+    if level == 0 and extent.max() > BLOCK_PIXELS and np.sum(run_stops - run_starts) + len(run_starts) <= budget:
+        # Zoomed in below level 0, every sample of the visible runs
+        pieces = []
+        for start, stop in zip(run_starts, run_stops):
+            pieces.append(np.arange(start, stop))
+            pieces.append([-1])
+        order = np.concatenate(pieces[:-1]).astype(np.int64)
+    else:
+        starts = blocks * size
+        stops = np.minimum(starts + size, pyramid.rows) - 1
+        order = np.sort(np.column_stack([starts, pyramid.levels[level][1][blocks], stops]), axis=1)
+        # -1 after the last block of every run but the last
+        gap = np.full((len(blocks), 1), -1, dtype=np.int64)
+        order = np.hstack([order, gap]).ravel()
+        keep = np.ones(len(order), dtype=bool)
+        keep[6::7] = False
+        keep[np.r_[breaks - 1] * 7 + 6] = True
+        order = order[keep]
+
+    missing = order < 0
+    at = np.where(missing, 0, order)
+    vertices_x = np.asarray(x[at], dtype=float)
+    vertices_y = np.asarray(y[at], dtype=float)
+    vertices_x[missing] = np.nan
+    vertices_y[missing] = np.nan
+    return vertices_x, vertices_y
+
+
+class LODLine:
+    def __init__(self, ax, x, y, *args, pyramid=None, **kwargs):
+        # ax.plot(x, y, *args, **kwargs) drawing only the vertices the view needs, x and y
+        # may be memory-mapped columns
+        self.ax = ax
+        self.x = x
+        self.y = y
+        self.pyramid = pyramid if pyramid is not None else PathPyramid.build(x, y)
+        self.line, = ax.plot([], [], *args, **kwargs)
+        self.view = None
+        ax.callbacks.connect("xlim_changed", self.refresh)
+        ax.callbacks.connect("ylim_changed", self.refresh)
+        ax.figure.canvas.mpl_connect("resize_event", self.refresh)
+        self.refresh()
+
+    def refresh(self, *_):
+        x0, x1 = sorted(self.ax.get_xlim())
+        y0, y1 = sorted(self.ax.get_ylim())
+        pixels = (max(self.ax.bbox.width, 1.0), max(self.ax.bbox.height, 1.0))
+        view = (x0, x1, y0, y1, *pixels)
+        if view == self.view:
+            return
+        self.view = view
+        self.line.set_data(*path_vertices(self.x, self.y, self.pyramid, (x0, x1, y0, y1), pixels))
+        self.ax.figure.canvas.draw_idle()
@@ -0,0 +1,153 @@
+import json, time, resource
+from collections import namedtuple
+from numba.core import event
+
+# Instrumentation of one engine run. simulate_newton / simulate_nbody and simulate_GR
+# take metrics= (a RunMetrics, or a path the metrics are written to as JSON) and
+# progress= (a callback, see Progress). A run records
+#   phases      wall-clock seconds per phase: setup, compile (numba compilation and
+#               cache loading, taken out of the phase it happened in), integrate, write
+#               (trajectory output), checkpoint and postprocess (events, result cache)
+#   counters    steps, rhs_evaluations, rejected_steps, rows, chunks, events, ...
+#   throughput  steps, evaluations and rows per second of the integrate phase
+#   memory      peak resident set size of the process and its growth during the run
+# The engines only touch their metrics once per chunk (per step for the scipy
+# backend), so a run costs the same with or without them.
+
+# fraction of target_time done, simulated time, target_time, wall-clock seconds since the
+# integration started, estimated seconds left (None until there is a rate) and steps so far
+Progress = namedtuple("Progress", ["fraction", "sim_time", "target_time", "elapsed", "eta", "steps"])
+
+THROUGHPUT = ("steps", "rhs_evaluations", "rows")
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class RunMetrics:
+    def __init__(self, progress=None, progress_interval=1.0):
+        # progress is called with a Progress at most every progress_interval wall-clock
+        # seconds while the run integrates, and once at the end
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.engine = None
+        self.cached = False
+        self.wall_time = 0.0
+        self.phases = {}
+        self.counters = {}
+        self.peak_rss_mb = 0.0
+        self.rss_growth_mb = 0.0
+
+    def start(self, engine, target_time):
+        # A RunMetrics passed to a second run starts over
+        self.phases = {}
+        self.counters = {}
+        self.compile_listener = event.TimingListener()
+        self.listening = 0
+        self.engine = engine
+        self.target_time = target_time
+        self.start_time = time.perf_counter()
+        self.integrate_start = None
+        self.last_progress = -float("inf")
+        self.start_rss = peak_rss_mb()
+
+    def listen(self, on):
+        # The compile listener is only registered while a phase is open, so a run that
+        # raises (out of a phase) leaves none behind
+        if on and self.listening == 0:
+            event.register("numba:compile", self.compile_listener)
+        self.listening += 1 if on else -1
+        if not on and self.listening == 0:
+            event.unregister("numba:compile", self.compile_listener)
+
+    def compile_time(self):
+        return self.compile_listener.duration if self.compile_listener.done else 0.0
+
+    def phase(self, name):
+        return Phase(self, name)
+
+    def add_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    def update(self, sim_time, final=False):
+        # Progress callback after a chunk, rate limited to progress_interval
+        now = time.perf_counter()
+        if self.integrate_start is None:
+            self.integrate_start = (now, sim_time)
+        if self.progress is None or (not final and now - self.last_progress < self.progress_interval):
+            return
+        self.last_progress = now
+        start, start_time = self.integrate_start
+        elapsed = now - start
+        done = sim_time - start_time
+        eta = elapsed * max(self.target_time - sim_time, 0.0) / done if done > 0 else None
+        fraction = min(sim_time / self.target_time, 1.0) if self.target_time > 0 else 1.0
+        self.progress(Progress(fraction, sim_time, self.target_time, elapsed, eta, self.counters.get("steps", 0)))
+
+    def finish(self, cached=False):
+        self.cached = cached
+        self.wall_time = time.perf_counter() - self.start_time
+        self.peak_rss_mb = peak_rss_mb()
+        self.rss_growth_mb = self.peak_rss_mb - self.start_rss
+
+    def throughput(self):
+        seconds = self.phases.get("integrate", 0.0)
+        if seconds <= 0:
+            return {}
+        return {f"{name}_per_second": self.counters[name] / seconds for name in THROUGHPUT if name in self.counters}
+
+    def to_dict(self):
+        return {
+            "engine": self.engine,
+            "cached": self.cached,
+            "wall_time": self.wall_time,
+            "phases": dict(self.phases),
+            "counters": dict(self.counters),
+            "throughput": self.throughput(),
+            "memory": {"peak_rss_mb": self.peak_rss_mb, "rss_growth_mb": self.rss_growth_mb},
+        }
+
+    def save(self, path):
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+
+class Phase:
+    # with metrics.phase("integrate"): ... adds the block's wall-clock time to the phase,
+    # numba compilation inside the block goes to "compile" instead
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.metrics.listen(True)
+        self.start = time.perf_counter()
+        self.compile_start = self.metrics.compile_time()
+
+    def __exit__(self, *exc):
+        compiling = self.metrics.compile_time() - self.compile_start
+        self.metrics.listen(False)
+        self.metrics.add_phase(self.name, time.perf_counter() - self.start - compiling)
+        if compiling > 0:
+            self.metrics.add_phase("compile", compiling)
+
+
+def run_metrics(metrics, progress):
+    # The engines' metrics= / progress= arguments as a RunMetrics
+    if isinstance(metrics, RunMetrics):
+        if progress is not None:
+            metrics.progress = progress
+        return metrics
+    return RunMetrics(progress)
+
+
+def finish_metrics(metrics, instrument, cached=False):
+    # Ends the run, metrics= given as a path gets the JSON file
+    instrument.finish(cached)
+    if isinstance(metrics, str):
+        instrument.save(metrics)
@@ -0,0 +1,973 @@
+import numpy as np
+from numba import njit, prange, float64, int64, boolean, void
+from numba.types import Tuple
+from numba.core.registry import CPUDispatcher
+import time
+
+# Wall-clock time the module started loading, the kernels with explicit signatures are
+# compiled (or loaded from the cache) from here on, as they are defined
+LOAD_START = time.time()
+
+from barnes_hut import compute_tree_accelerations, grow_quadtree, allocate_quadtree
+
+# Compiled kernels of the Newton engine. They live at module level with explicit
+# signatures and G passed in as an argument, so they are compiled once, written to the
+# on-disk numba cache (__pycache__ next to this file, or NUMBA_CACHE_DIR) and loaded from
+# there by every later process instead of being re-JITed per simulate_newton call.
+# Run `python newton_kernels.py` once after install to warm the cache ahead of time, it
+# reports the compile (or load) and warm-up times and checks that a new process then
+# loads every kernel from the cache (exit status 1 otherwise).
+
+
+@njit(Tuple((float64[::1], float64[::1]))(float64, float64, float64[::1], float64, float64[::1]), cache = True)
+def calculate_gravitational_force(G, mass1, position1, mass2, position2):
+    # Calculate distance vector and squared distance
+    DPosition = position2 - position1
+    distance_squared = np.dot(DPosition, DPosition)
+
+    # Collision check
+    if distance_squared == 0:
+        raise ValueError("Distance between bodies cannot be zero.")
+
+    # Calculate force magnitude and vector
+    force_magnitude = G * mass1 * mass2 / distance_squared
+    force_vector = force_magnitude * (DPosition / np.sqrt(distance_squared))
+
+    return force_vector, -force_vector
+
+
+@njit(Tuple((float64[::1], float64[::1]))(float64, float64[::1], float64[::1], float64[::1], float64), cache = True)
+def update_position(mass, position, velocity, force_vector, dt):
+    # Calculate acceleration
+    acceleration = force_vector / mass
+    # Update velocity and position
+    velocity += acceleration * dt
+    position += velocity * dt
+
+    return position, velocity
+
+
+# Force evaluation modes of integrate_nbody_chunk
+FORCE_DIRECT = 0
+FORCE_TREE = 1
+
+# Below this many bodies the thread start-up of the parallel force loop costs more
+# than the pairwise sum itself
+PARALLEL_THRESHOLD = 64
+
+
+@njit(void(float64, float64[::1], float64[:, ::1], float64[:, ::1]), cache = True)
+def compute_accelerations_serial(G, masses, positions, acc):
+    # Every pair once, both bodies get their share of it. A leaf function that returns
+    # nothing, so numba drops the reference counting of its arguments: a call that hands
+    # the arrays on or returns one costs about as much as a two-body step
+    n = masses.shape[0]
+    for i in range(n):
+        acc[i, 0] = 0.0
+        acc[i, 1] = 0.0
+    for i in range(n):
+        for j in range(i + 1, n):
+            dx = positions[j, 0] - positions[i, 0]
+            dy = positions[j, 1] - positions[i, 1]
+            distance_squared = dx * dx + dy * dy
+            if distance_squared == 0:
+                raise ValueError("Distance between bodies cannot be zero.")
+            inv_distance = 1.0 / np.sqrt(distance_squared)
+            scale = 1.0 / distance_squared * inv_distance
+            acc[i, 0] += G * masses[j] * scale * dx
+            acc[i, 1] += G * masses[j] * scale * dy
+            acc[j, 0] -= G * masses[i] * scale * dx
+            acc[j, 1] -= G * masses[i] * scale * dy
+
+
+@njit(void(float64, float64[::1], float64[:, ::1], float64[:, ::1]), cache = True, parallel = True)
+def compute_accelerations_parallel(G, masses, positions, acc):
+    # Every body sums its own row of the pairwise interaction matrix, so the threads
+    # never write to the same element and no reduction is needed. The loop body must
+    # not raise, a collision shows up as a non-finite acceleration checked afterwards
+    n = masses.shape[0]
+    for i in prange(n):
+        ax = 0.0
+        ay = 0.0
+        xi = positions[i, 0]
+        yi = positions[i, 1]
+        for j in range(n):
+            if j != i:
+                dx = positions[j, 0] - xi
+                dy = positions[j, 1] - yi
+                distance_squared = dx * dx + dy * dy
+                inv_distance = 1.0 / np.sqrt(distance_squared)
+                magnitude = G * masses[j] / distance_squared * inv_distance
+                ax += magnitude * dx
+                ay += magnitude * dy
+        acc[i, 0] = ax
+        acc[i, 1] = ay
+
+
+@njit(void(float64, float64[::1], float64[:, ::1], float64[:, ::1]), cache = True)
+def compute_accelerations(G, masses, positions, acc):
+    if masses.shape[0] >= PARALLEL_THRESHOLD:
+        compute_accelerations_parallel(G, masses, positions, acc)
+        if not np.all(np.isfinite(acc)):
+            raise ValueError("Distance between bodies cannot be zero.")
+        return
+    compute_accelerations_serial(G, masses, positions, acc)
+
+
+# Post-Newtonian corrections added on top of the Newtonian accelerations (harmonic
+# coordinates, barycentric frame). Each order includes the ones below it
+POST_NEWTONIAN_NONE = 0
+POST_NEWTONIAN_1PN = 1  # Einstein-Infeld-Hoffmann N-body equations
+POST_NEWTONIAN_2PN = 2  # + 2PN two-body terms of every pair
+POST_NEWTONIAN_2_5PN = 3  # + 2.5PN radiation reaction of every pair
+
+
+@njit(Tuple((float64, float64))(float64, float64, float64[::1], float64[:, ::1], float64[:, ::1], float64[:, ::1], float64[:, ::1], int64, int64), cache = True)
+def post_newtonian_row(G, c, masses, positions, velocities, acc, work, order, i):
+    # Correction to the acceleration of body i. acc holds the Newtonian accelerations and
+    # work[:, 0] the Newtonian potentials sum_j G mj / rij of every body.
+    # 1PN is the EIH sum, 2PN and 2.5PN are the relative accelerations of each pair
+    # (Blanchet, Living Rev. Relativity 17, 2 (2014), eq. 219) shared by the mass ratio,
+    # which leaves out the genuine three-body terms beyond 1PN
+    n = masses.shape[0]
+    xi = positions[i, 0]
+    yi = positions[i, 1]
+    vxi = velocities[i, 0]
+    vyi = velocities[i, 1]
+    vi2 = vxi * vxi + vyi * vyi
+    c2 = c * c
+    ax = 0.0
+    ay = 0.0
+    for j in range(n):
+        if j == i:
+            continue
+        dx = positions[j, 0] - xi
+        dy = positions[j, 1] - yi
+        distance = np.sqrt(dx * dx + dy * dy)
+        nx = dx / distance
+        ny = dy / distance
+        vxj = velocities[j, 0]
+        vyj = velocities[j, 1]
+        gm_r = G * masses[j] / distance
+        gm_r2 = gm_r / distance
+
+        # EIH, n points from i to j
+        nvj = nx * vxj + ny * vyj
+        bracket = (vi2 + 2.0 * (vxj * vxj + vyj * vyj) - 4.0 * (vxi * vxj + vyi * vyj) - 1.5 * nvj * nvj
+                   - 4.0 * work[i, 0] - work[j, 0] + 0.5 * (dx * acc[j, 0] + dy * acc[j, 1]))
+        projection = -(nx * (4.0 * vxi - 3.0 * vxj) + ny * (4.0 * vyi - 3.0 * vyj))
+        ax += (gm_r2 * (bracket * nx + projection * (vxi - vxj)) + 3.5 * gm_r * acc[j, 0]) / c2
+        ay += (gm_r2 * (bracket * ny + projection * (vyi - vyj)) + 3.5 * gm_r * acc[j, 1]) / c2
+
+        if order >= POST_NEWTONIAN_2PN:
+            # Relative motion of the pair, a = -G M / r^2 ((1 + A) n + B v) with n from j to i
+            total_mass = masses[i] + masses[j]
+            nu = masses[i] * masses[j] / (total_mass * total_mass)
+            gm = G * total_mass / (distance * c2)
+            vx = (vxi - vxj) / c
+            vy = (vyi - vyj) / c
+            v2 = vx * vx + vy * vy
+            rdot = -(nx * vx + ny * vy)
+            rdot2 = rdot * rdot
+            a_term = (15.0 / 8.0 * rdot2 * rdot2 * nu - 45.0 / 8.0 * rdot2 * rdot2 * nu * nu - 4.5 * rdot2 * nu * v2
+                      + 6.0 * rdot2 * nu * nu * v2 + 3.0 * nu * v2 * v2 - 4.0 * nu * nu * v2 * v2
+                      + gm * (-2.0 * rdot2 - 25.0 * rdot2 * nu - 2.0 * rdot2 * nu * nu - 6.5 * nu * v2 + 2.0 * nu * nu * v2)
+                      + gm * gm * (9.0 + 87.0 / 4.0 * nu))
+            b_term = (4.5 * rdot2 * rdot * nu + 3.0 * rdot2 * rdot * nu * nu - 7.5 * rdot * nu * v2 - 2.0 * rdot * nu * nu * v2
+                      + gm * (2.0 * rdot + 20.5 * rdot * nu + 4.0 * rdot * nu * nu))
+            if order >= POST_NEWTONIAN_2_5PN:
+                a_term += -1.6 * nu * gm * rdot * (3.0 * v2 + 17.0 / 3.0 * gm)
+                b_term += 1.6 * nu * gm * (v2 + 3.0 * gm)
+            # Body i takes mj / M of the relative acceleration
+            scale = -G * masses[j] / (distance * distance)
+            ax += scale * (-a_term * nx + b_term * vx)
+            ay += scale * (-a_term * ny + b_term * vy)
+    return ax, ay
+
+
+@njit(float64[:, ::1](float64, float64, float64[::1], float64[:, ::1], float64[:, ::1], float64[:, ::1], float64[:, ::1], int64), cache = True)
+def post_newtonian_serial(G, c, masses, positions, velocities, acc, work, order):
+    n = masses.shape[0]
+    for i in range(n):
+        potential = 0.0
+        for j in range(n):
+            if j != i:
+                potential += G * masses[j] / np.sqrt((positions[j, 0] - positions[i, 0]) ** 2 + (positions[j, 1] - positions[i, 1]) ** 2)
+        work[i, 0] = potential
+    for i in range(n):
+        work[i, 1], work[i, 2] = post_newtonian_row(G, c, masses, positions, velocities, acc, work, order, i)
+    return work
+
+
+@njit(float64[:, ::1](float64, float64, float64[::1], float64[:, ::1], float64[:, ::1], float64[:, ::1], float64[:, ::1], int64), cache = True, parallel = True)
+def post_newtonian_parallel(G, c, masses, positions, velocities, acc, work, order):
+    # Same as the serial version with both passes split over the bodies, each thread
+    # only writes its own rows of work
+    n = masses.shape[0]
+    for i in prange(n):
+        potential = 0.0
+        for j in range(n):
+            if j != i:
+                potential += G * masses[j] / np.sqrt((positions[j, 0] - positions[i, 0]) ** 2 + (positions[j, 1] - positions[i, 1]) ** 2)
+        work[i, 0] = potential
+    for i in prange(n):
+        work[i, 1], work[i, 2] = post_newtonian_row(G, c, masses, positions, velocities, acc, work, order, i)
+    return work
+
+
+@njit(float64[:, ::1](float64, float64, float64[::1], float64[:, ::1], float64[:, ::1], float64[:, ::1], float64[:, ::1], int64), cache = True)
+def post_newtonian_accelerations(G, c, masses, positions, velocities, acc, work, order):
+    # Post-Newtonian corrections of the given order into work[:, 1:3], acc holds the
+    # Newtonian accelerations and work is (N, 5) scratch space
+    if masses.shape[0] >= PARALLEL_THRESHOLD:
+        return post_newtonian_parallel(G, c, masses, positions, velocities, acc, work, order)
+    return post_newtonian_serial(G, c, masses, positions, velocities, acc, work, order)
+
+
+@njit(cache = True)
+def kick(G, c, masses, positions, velocities, acc, work, post_newtonian, h):
+    # velocities += h * acceleration with the Newtonian part in acc. The post-Newtonian
+    # part depends on the velocities and is taken at the midpoint (v + v_new) / 2 of the
+    # kick (two fixed point passes, the second is already exact to far below the PN
+    # size), which keeps the kick time-symmetric so leapfrog and yoshida4 keep their order
+    n = masses.shape[0]
+    if post_newtonian == POST_NEWTONIAN_NONE:
+        for i in range(n):
+            velocities[i, 0] += h * acc[i, 0]
+            velocities[i, 1] += h * acc[i, 1]
+        return
+    work[:, 3:5] = velocities
+    for iteration in range(2):
+        post_newtonian_accelerations(G, c, masses, positions, velocities, acc, work, post_newtonian)
+        scale = h if iteration == 1 else 0.5 * h
+        for i in range(n):
+            velocities[i, 0] = work[i, 3] + scale * (acc[i, 0] + work[i, 1])
+            velocities[i, 1] = work[i, 4] + scale * (acc[i, 1] + work[i, 2])
+
+
+# Integrators of integrate_nbody_chunk
+INTEGRATOR_EULER = 0  # semi-implicit (symplectic) Euler, the original update_position
+INTEGRATOR_LEAPFROG = 1  # kick-drift-kick leapfrog / velocity Verlet, 2nd order
+INTEGRATOR_YOSHIDA4 = 2  # Yoshida's 4th order composition of leapfrog
+INTEGRATOR_WISDOM_HOLMAN = 3  # Kepler drift around body 0 + interaction kicks, democratic heliocentric
+
+YOSHIDA_W1 = 1.0 / (2.0 - 2.0 ** (1.0 / 3.0))
+YOSHIDA_W0 = -(2.0 ** (1.0 / 3.0)) * YOSHIDA_W1
+YOSHIDA_C = (0.5 * YOSHIDA_W1, 0.5 * (YOSHIDA_W0 + YOSHIDA_W1), 0.5 * (YOSHIDA_W0 + YOSHIDA_W1), 0.5 * YOSHIDA_W1)
+YOSHIDA_D = (YOSHIDA_W1, YOSHIDA_W0, YOSHIDA_W1)
+
+
+@njit(cache = True)
+def evaluate_accelerations(G, masses, positions, acc, force_mode, theta, child, node_body, node_data, next_body):
+    # Direct or tree forces into acc, False when the tree did not fit its arrays
+    if force_mode == FORCE_TREE:
+        return compute_tree_accelerations(G, theta, masses, positions, acc, child, node_body, node_data, next_body)
+    compute_accelerations(G, masses, positions, acc)
+    return True
+
+
+@njit(Tuple((float64, float64))(float64), cache = True)
+def stumpff(psi):
+    # Stumpff functions c2(psi), c3(psi) of the universal-variable Kepler solution
+    if psi > 1e-6:
+        sqrt_psi = np.sqrt(psi)
+        return (1.0 - np.cos(sqrt_psi)) / psi, (sqrt_psi - np.sin(sqrt_psi)) / (psi * sqrt_psi)
+    if psi < -1e-6:
+        sqrt_psi = np.sqrt(-psi)
+        return (1.0 - np.cosh(sqrt_psi)) / psi, (np.sinh(sqrt_psi) - sqrt_psi) / (-psi * sqrt_psi)
+    return 0.5 - psi / 24.0 + psi * psi / 720.0, 1.0 / 6.0 - psi / 120.0 + psi * psi / 5040.0
+
+
+@njit(cache = True)
+def kepler_drift(mu, position, velocity, dt):
+    # Advances one body on its exact two-body orbit around a fixed mass mu = G * M
+    # (elliptic, parabolic or hyperbolic) with Lagrange f and g coefficients, in place
+    x = position[0]
+    y = position[1]
+    vx = velocity[0]
+    vy = velocity[1]
+    r0 = np.sqrt(x * x + y * y)
+    sqrt_mu = np.sqrt(mu)
+    alpha = 2.0 / r0 - (vx * vx + vy * vy) / mu
+    sigma0 = (x * vx + y * vy) / sqrt_mu
+
+    chi = sqrt_mu * dt * alpha if alpha > 0 else sqrt_mu * dt / r0
+    r = r0
+    c2 = 0.5
+    c3 = 1.0 / 6.0
+    psi = 0.0
+    for _ in range(100):
+        psi = chi * chi * alpha
+        c2, c3 = stumpff(psi)
+        r = chi * chi * c2 + sigma0 * chi * (1.0 - psi * c3) + r0 * (1.0 - psi * c2)
+        residual = chi ** 3 * c3 + sigma0 * chi * chi * c2 + r0 * chi * (1.0 - psi * c3) - sqrt_mu * dt
+        chi -= residual / r
+        if abs(residual) <= 1e-15 * (abs(sqrt_mu * dt) + 1e-300):
+            break
+    psi = chi * chi * alpha
+    c2, c3 = stumpff(psi)
+    r = chi * chi * c2 + sigma0 * chi * (1.0 - psi * c3) + r0 * (1.0 - psi * c2)
+
+    f = 1.0 - chi * chi * c2 / r0
+    g = dt - chi ** 3 * c3 / sqrt_mu
+    f_dot = sqrt_mu / (r * r0) * chi * (psi * c3 - 1.0)
+    g_dot = 1.0 - chi * chi * c2 / r
+
+    position[0] = f * x + g * vx
+    position[1] = f * y + g * vy
+    velocity[0] = f_dot * x + g_dot * vx
+    velocity[1] = f_dot * y + g_dot * vy
+
+
+@njit(cache = True)
+def to_democratic_heliocentric(masses, positions, velocities, Q, V):
+    # Heliocentric positions and barycentric velocities relative to body 0,
+    # returns the barycentre position and velocity
+    total_mass = np.sum(masses)
+    cm = np.zeros(2)
+    cm_velocity = np.zeros(2)
+    for i in range(masses.shape[0]):
+        cm += masses[i] * positions[i]
+        cm_velocity += masses[i] * velocities[i]
+    cm /= total_mass
+    cm_velocity /= total_mass
+    for i in range(masses.shape[0]):
+        Q[i] = positions[i] - positions[0]
+        V[i] = velocities[i] - cm_velocity
+    return cm, cm_velocity
+
+
+@njit(cache = True)
+def from_democratic_heliocentric(masses, Q, V, cm, cm_velocity, positions, velocities):
+    total_mass = np.sum(masses)
+    shift = np.zeros(2)
+    momentum = np.zeros(2)
+    for i in range(1, masses.shape[0]):
+        shift += masses[i] * Q[i]
+        momentum += masses[i] * V[i]
+    positions[0] = cm - shift / total_mass
+    velocities[0] = cm_velocity - momentum / masses[0]
+    for i in range(1, masses.shape[0]):
+        positions[i] = Q[i] + positions[0]
+        velocities[i] = V[i] + cm_velocity
+
+
+@njit(cache = True)
+def advance(G, masses, positions, velocities, acc, dt, force_mode, theta, c, post_newtonian, work, integrator, child, node_body, node_data, next_body):
+    # One euler / leapfrog / yoshida4 step of length dt in place. Returns False, with the
+    # state half way through the step, when the tree did not fit its arrays.
+    # For leapfrog acc must hold the Newtonian accelerations at the current positions on
+    # entry and does so again on exit, the post-Newtonian part is added by every kick
+    n = masses.shape[0]
+    if integrator == INTEGRATOR_EULER:
+        if not evaluate_accelerations(G, masses, positions, acc, force_mode, theta, child, node_body, node_data, next_body):
+            return False
+        kick(G, c, masses, positions, velocities, acc, work, post_newtonian, dt)
+        for i in range(n):
+            positions[i, 0] += velocities[i, 0] * dt
+            positions[i, 1] += velocities[i, 1] * dt
+
+    elif integrator == INTEGRATOR_LEAPFROG:
+        kick(G, c, masses, positions, velocities, acc, work, post_newtonian, 0.5 * dt)
+        for i in range(n):
+            positions[i, 0] += velocities[i, 0] * dt
+            positions[i, 1] += velocities[i, 1] * dt
+        if not evaluate_accelerations(G, masses, positions, acc, force_mode, theta, child, node_body, node_data, next_body):
+            return False
+        kick(G, c, masses, positions, velocities, acc, work, post_newtonian, 0.5 * dt)
+
+    else:
+        for stage in range(4):
+            for i in range(n):
+                positions[i, 0] += YOSHIDA_C[stage] * dt * velocities[i, 0]
+                positions[i, 1] += YOSHIDA_C[stage] * dt * velocities[i, 1]
+            if stage < 3:
+                if not evaluate_accelerations(G, masses, positions, acc, force_mode, theta, child, node_body, node_data, next_body):
+                    return False
+                kick(G, c, masses, positions, velocities, acc, work, post_newtonian, YOSHIDA_D[stage] * dt)
+
+    return True
+
+
+@njit(cache = True)
+def wisdom_holman_step(G, masses, interaction_masses, Q, V, acc, dt, force_mode, theta, child, node_body, node_data, next_body):
+    # kick(dt/2) jump(dt/2) kepler(dt) jump(dt/2) kick(dt/2) in democratic heliocentric
+    # coordinates, acc holds the interaction accelerations at the current Q. False as
+    # for advance
+    n = masses.shape[0]
+    mu = G * masses[0]
+    momentum = np.zeros(2)
+    for i in range(1, n):
+        V[i, 0] += 0.5 * dt * acc[i, 0]
+        V[i, 1] += 0.5 * dt * acc[i, 1]
+        momentum[0] += masses[i] * V[i, 0]
+        momentum[1] += masses[i] * V[i, 1]
+    for i in range(1, n):
+        Q[i, 0] += 0.5 * dt * momentum[0] / masses[0]
+        Q[i, 1] += 0.5 * dt * momentum[1] / masses[0]
+        kepler_drift(mu, Q[i], V[i], dt)
+    momentum[:] = 0.0
+    for i in range(1, n):
+        momentum[0] += masses[i] * V[i, 0]
+        momentum[1] += masses[i] * V[i, 1]
+    for i in range(1, n):
+        Q[i, 0] += 0.5 * dt * momentum[0] / masses[0]
+        Q[i, 1] += 0.5 * dt * momentum[1] / masses[0]
+    if not evaluate_accelerations(G, interaction_masses, Q, acc, force_mode, theta, child, node_body, node_data, next_body):
+        return False
+    for i in range(1, n):
+        V[i, 0] += 0.5 * dt * acc[i, 0]
+        V[i, 1] += 0.5 * dt * acc[i, 1]
+    return True
+
+
+@njit(float64(float64, float64[::1], float64[:, ::1], float64[:, ::1], int64), cache = True)
+def pair_timescale(G, masses, positions, velocities, i):
+    # Shortest free-fall time sqrt(r^3 / G(mi + mj)) or crossing time r / |vi - vj|
+    # between body i and any later body
+    timescale = np.inf
+    for j in range(i + 1, masses.shape[0]):
+        dx = positions[j, 0] - positions[i, 0]
+        dy = positions[j, 1] - positions[i, 1]
+        dvx = velocities[j, 0] - velocities[i, 0]
+        dvy = velocities[j, 1] - velocities[i, 1]
+        distance_squared = dx * dx + dy * dy
+        distance = np.sqrt(distance_squared)
+        free_fall = np.sqrt(distance_squared * distance / (G * (masses[i] + masses[j])))
+        speed_squared = dvx * dvx + dvy * dvy
+        crossing = distance / np.sqrt(speed_squared) if speed_squared > 0 else np.inf
+        timescale = min(timescale, free_fall, crossing)
+    return timescale
+
+
+@njit(float64(float64, float64[::1], float64[:, ::1], float64[:, ::1]), cache = True, parallel = True)
+def dynamical_timescale_parallel(G, masses, positions, velocities):
+    n = masses.shape[0]
+    timescales = np.empty(n)
+    for i in prange(n):
+        timescales[i] = pair_timescale(G, masses, positions, velocities, i)
+    return np.min(timescales)
+
+
+@njit(float64(float64, float64[::1], float64[:, ::1], float64[:, ::1]), cache = True)
+def dynamical_timescale(G, masses, positions, velocities):
+    n = masses.shape[0]
+    if n >= PARALLEL_THRESHOLD:
+        return dynamical_timescale_parallel(G, masses, positions, velocities)
+    timescale = np.inf
+    for i in range(n):
+        timescale = min(timescale, pair_timescale(G, masses, positions, velocities, i))
+    return timescale
+
+
+# Run / member status returned by integrate_nbody_chunk and the ensemble integrator
+# (same codes as gr_kernels)
+STATUS_FINISHED = 0
+STATUS_CAPTURED = 1
+STATUS_ESCAPED = 2
+
+# Events of the pair of bodies 0 and 1, located on the cubic Hermite interpolant of the
+# step. Capture and escape stop the integration (same codes as the status), periapsis
+# and apoapsis are only recorded
+EVENT_CAPTURE = STATUS_CAPTURED  # separation falls to capture_radius
+EVENT_ESCAPE = STATUS_ESCAPED  # separation rises to escape_radius
+EVENT_PERIAPSIS = 4  # radial velocity changes sign from - to +
+EVENT_APOAPSIS = 5  # radial velocity changes sign from + to -
+
+
+@njit(cache = True)
+def hermite_state(previous_positions, previous_velocities, positions, velocities, h, s, body, state):
+    # Position and velocity of body at the fraction s of a step of length h
+    h00 = (1 + 2 * s) * (1 - s) ** 2
+    h10 = s * (1 - s) ** 2
+    h01 = s * s * (3 - 2 * s)
+    h11 = s * s * (s - 1)
+    d00 = 6 * s * s - 6 * s
+    d10 = 3 * s * s - 4 * s + 1
+    d01 = -6 * s * s + 6 * s
+    d11 = 3 * s * s - 2 * s
+    for k in range(2):
+        state[k] = (h00 * previous_positions[body, k] + h10 * h * previous_velocities[body, k]
+                    + h01 * positions[body, k] + h11 * h * velocities[body, k])
+        state[2 + k] = (d00 * previous_positions[body, k] / h + d10 * previous_velocities[body, k]
+                        + d01 * positions[body, k] / h + d11 * velocities[body, k])
+
+
+@njit(cache = True)
+def pair_event_crossed(kind, previous_positions, previous_velocities, positions, velocities, h, s, capture_radius, escape_radius):
+    # True once the pair is on the far side of the event surface at the fraction s
+    first = np.empty(4)
+    second = np.empty(4)
+    hermite_state(previous_positions, previous_velocities, positions, velocities, h, s, 0, first)
+    hermite_state(previous_positions, previous_velocities, positions, velocities, h, s, 1, second)
+    dx = second[0] - first[0]
+    dy = second[1] - first[1]
+    if kind == EVENT_CAPTURE:
+        return dx * dx + dy * dy <= capture_radius * capture_radius
+    if kind == EVENT_ESCAPE:
+        return dx * dx + dy * dy >= escape_radius * escape_radius
+    radial = dx * (second[2] - first[2]) + dy * (second[3] - first[3])
+    if kind == EVENT_PERIAPSIS:
+        return radial >= 0
+    return radial <= 0
+
+
+@njit(cache = True)
+def detect_pair_events(previous_positions, previous_velocities, positions, velocities, previous_time, h, capture_radius, escape_radius, detect_apsides, event_t, event_kind, events):
+    # Events of bodies 0 and 1 inside the step (previous_time, previous_time + h), each
+    # bisected down to adjacent doubles. Returns the number of events stored, the status
+    # and the time the run has to stop at (the step end without a terminal event)
+    status = STATUS_FINISHED
+    t_stop = previous_time + h
+    for kind in (EVENT_CAPTURE, EVENT_ESCAPE, EVENT_PERIAPSIS, EVENT_APOAPSIS):
+        if kind == EVENT_CAPTURE and capture_radius <= 0:
+            continue
+        if kind == EVENT_ESCAPE and escape_radius == np.inf:
+            continue
+        if (kind == EVENT_PERIAPSIS or kind == EVENT_APOAPSIS) and not detect_apsides:
+            continue
+        if (pair_event_crossed(kind, previous_positions, previous_velocities, positions, velocities, h, 0.0, capture_radius, escape_radius)
+                or not pair_event_crossed(kind, previous_positions, previous_velocities, positions, velocities, h, 1.0, capture_radius, escape_radius)):
+            continue
+        lo = previous_time
+        hi = previous_time + h
+        while True:
+            mid = 0.5 * (lo + hi)
+            if mid <= lo or mid >= hi:
+                break
+            if pair_event_crossed(kind, previous_positions, previous_velocities, positions, velocities, h, (mid - previous_time) / h, capture_radius, escape_radius):
+                hi = mid
+            else:
+                lo = mid
+        if hi > t_stop:
+            continue
+        event_t[events] = hi
+        event_kind[events] = kind
+        events += 1
+        if kind == EVENT_CAPTURE or kind == EVENT_ESCAPE:
+            status = kind
+            t_stop = hi
+    return events, status, t_stop
+
+
+@njit(cache = True)
+def stop_at(previous_positions, previous_velocities, positions, velocities, h, s):
+    # Moves every body to the fraction s of the step just taken, in place
+    state = np.empty(4)
+    end_positions = positions.copy()
+    end_velocities = velocities.copy()
+    for i in range(positions.shape[0]):
+        hermite_state(previous_positions, previous_velocities, end_positions, end_velocities, h, s, i, state)
+        positions[i, 0] = state[0]
+        positions[i, 1] = state[1]
+        velocities[i, 0] = state[2]
+        velocities[i, 1] = state[3]
+
+
+@njit(cache = True)
+def integrate_direct_chunk(G, masses, positions, velocities, acc, sim_time, target_time, dt, save_every, counter, out, integrator, capture_radius, escape_radius, detect_apsides, event_t, event_kind):
+    # integrate_nbody_chunk for its common case: direct forces, fixed steps, no
+    # post-Newtonian terms and euler / leapfrog / yoshida4. Same arguments and results,
+    # but no tree arrays and no force mode / post-Newtonian dispatch per step, and below
+    # PARALLEL_THRESHOLD the pairwise sum is called straight from the loop (see
+    # compute_accelerations_serial)
+    n = masses.shape[0]
+    serial = n < PARALLEL_THRESHOLD
+    saved = 0
+    steps = 0
+    events = 0
+    status = STATUS_FINISHED
+    detect_events = n >= 2 and (capture_radius > 0 or escape_radius < np.inf or detect_apsides)
+    if integrator == INTEGRATOR_LEAPFROG:
+        compute_accelerations(G, masses, positions, acc)
+    previous_positions = np.empty((n, 2))
+    previous_velocities = np.empty((n, 2))
+
+    while sim_time < target_time and saved < out.shape[0] and events + 4 <= event_t.shape[0]:
+        if detect_events:
+            previous_positions[:] = positions
+            previous_velocities[:] = velocities
+
+        # The step as in advance, written out here: every call level between this loop
+        # and the pairwise sum costs about as much as a two-body step
+        if integrator == INTEGRATOR_EULER:
+            if serial:
+                compute_accelerations_serial(G, masses, positions, acc)
+            else:
+                compute_accelerations(G, masses, positions, acc)
+            for i in range(n):
+                velocities[i, 0] += dt * acc[i, 0]
+                velocities[i, 1] += dt * acc[i, 1]
+                positions[i, 0] += velocities[i, 0] * dt
+                positions[i, 1] += velocities[i, 1] * dt
+
+        elif integrator == INTEGRATOR_LEAPFROG:
+            for i in range(n):
+                velocities[i, 0] += 0.5 * dt * acc[i, 0]
+                velocities[i, 1] += 0.5 * dt * acc[i, 1]
+                positions[i, 0] += velocities[i, 0] * dt
+                positions[i, 1] += velocities[i, 1] * dt
+            if serial:
+                compute_accelerations_serial(G, masses, positions, acc)
+            else:
+                compute_accelerations(G, masses, positions, acc)
+            for i in range(n):
+                velocities[i, 0] += 0.5 * dt * acc[i, 0]
+                velocities[i, 1] += 0.5 * dt * acc[i, 1]
+
+        else:
+            for stage in range(4):
+                for i in range(n):
+                    positions[i, 0] += YOSHIDA_C[stage] * dt * velocities[i, 0]
+                    positions[i, 1] += YOSHIDA_C[stage] * dt * velocities[i, 1]
+                if stage < 3:
+                    if serial:
+                        compute_accelerations_serial(G, masses, positions, acc)
+                    else:
+                        compute_accelerations(G, masses, positions, acc)
+                    for i in range(n):
+                        velocities[i, 0] += YOSHIDA_D[stage] * dt * acc[i, 0]
+                        velocities[i, 1] += YOSHIDA_D[stage] * dt * acc[i, 1]
+
+        previous_time = sim_time
+        sim_time += dt
+        counter += 1
+        steps += 1
+
+        if detect_events:
+            events, status, t_stop = detect_pair_events(previous_positions, previous_velocities, positions, velocities, previous_time, dt,
+                                                        capture_radius, escape_radius, detect_apsides, event_t, event_kind, events)
+            if status != STATUS_FINISHED:
+                # Final row at the event, the decimation restarts there
+                stop_at(previous_positions, previous_velocities, positions, velocities, dt, (t_stop - previous_time) / dt)
+                sim_time = t_stop
+                out[saved, 0] = sim_time
+                for i in range(n):
+                    out[saved, 1 + 2 * i] = positions[i, 0]
+                    out[saved, 2 + 2 * i] = positions[i, 1]
+                saved += 1
+                counter = 0
+                break
+
+        if counter == save_every:
+            out[saved, 0] = sim_time
+            for i in range(n):
+                out[saved, 1 + 2 * i] = positions[i, 0]
+                out[saved, 2 + 2 * i] = positions[i, 1]
+            saved += 1
+            counter = 0
+
+    return sim_time, counter, saved, steps, events, status
+
+
+@njit(cache = True)
+def swap_step_start(step_start, positions, velocities, acc, Q, V, save):
+    # Saves the state a step starts from into step_start (save) or restores it from there
+    for k, state in enumerate((positions, velocities, acc, Q, V)):
+        if save:
+            step_start[k] = state
+        else:
+            state[:] = step_start[k]
+
+
+@njit(Tuple((float64, int64, int64, int64, int64, int64))(float64, float64[::1], float64[:, ::1], float64[:, ::1], float64[:, ::1], float64, float64, float64, int64, int64, float64[:, ::1], int64, float64, float64, int64, int64, boolean, float64, float64, float64, float64, boolean, float64[::1], int64[::1], int64[:, ::1], int64[::1], float64[:, ::1], int64[::1]), cache = True, nogil = True)
+def integrate_nbody_chunk(G, masses, positions, velocities, acc, sim_time, target_time, dt, save_every, counter, out, force_mode, theta, c, post_newtonian, integrator, adaptive, eta, dt_min, capture_radius, escape_radius, detect_apsides, event_t, event_kind, child, node_body, node_data, next_body):
+    # Whole time loop in one call on the struct-of-arrays state (masses (N,), positions
+    # and velocities (N, 2)) with save_every decimation straight into the preallocated
+    # out rows [time, x1, y1, ..., xN, yN].
+    # With adaptive the step is eta times the shortest dynamical time of any pair,
+    # clipped to [dt_min, dt], and rows are interpolated (cubic Hermite) onto the regular
+    # grid k * dt * save_every; counter then holds the number of grid rows written so far.
+    # Runs without the GIL so the background writer drains the previous chunk meanwhile.
+    # Events of bodies 0 and 1 (see detect_pair_events) go to event_t / event_kind, a
+    # capture or escape ends the run at the event time with a final row there.
+    # post_newtonian (POST_NEWTONIAN_*) adds the corrections of that order, c is the
+    # speed of light they use.
+    # child, node_body, node_data and next_body are the quadtree arrays of FORCE_TREE
+    # (barnes_hut.allocate_quadtree), allocated once by the caller. A step whose tree does
+    # not fit them is taken again from its start with arrays of twice the size, which
+    # last until the end of the chunk.
+    # Returns the time, counter, rows and events written, steps and the status
+    if force_mode == FORCE_DIRECT and not adaptive and post_newtonian == POST_NEWTONIAN_NONE and integrator != INTEGRATOR_WISDOM_HOLMAN:
+        return integrate_direct_chunk(G, masses, positions, velocities, acc, sim_time, target_time, dt, save_every, counter, out, integrator,
+                                      capture_radius, escape_radius, detect_apsides, event_t, event_kind)
+    n = masses.shape[0]
+    work = np.empty((n, 5))
+    saved = 0
+    steps = 0
+    events = 0
+    status = STATUS_FINISHED
+    detect_events = n >= 2 and (capture_radius > 0 or escape_radius < np.inf or detect_apsides)
+
+    # State at the start of the step, kept with the tree to retry a step that overflowed
+    tree = force_mode == FORCE_TREE
+    step_start = np.empty((5, n, 2) if tree else (5, 0, 2))
+
+    # Wisdom-Holman state: body 0 is the dominant mass, the other bodies follow Kepler
+    # orbits around it and only feel each other through the interaction kicks
+    Q = np.empty((n, 2))
+    V = np.empty((n, 2))
+    cm = np.zeros(2)
+    cm_velocity = np.zeros(2)
+    interaction_masses = masses.copy()
+    interaction_masses[0] = 0.0
+    if integrator == INTEGRATOR_WISDOM_HOLMAN:
+        cm, cm_velocity = to_democratic_heliocentric(masses, positions, velocities, Q, V)
+        while not evaluate_accelerations(G, interaction_masses, Q, acc, force_mode, theta, child, node_body, node_data, next_body):
+            child, node_body, node_data = grow_quadtree(child, node_body, node_data)
+    elif integrator == INTEGRATOR_LEAPFROG:
+        while not evaluate_accelerations(G, masses, positions, acc, force_mode, theta, child, node_body, node_data, next_body):
+            child, node_body, node_data = grow_quadtree(child, node_body, node_data)
+
+    previous_positions = np.empty((n, 2))
+    previous_velocities = np.empty((n, 2))
+    output_interval = dt * save_every
+
+    while sim_time < target_time and saved < out.shape[0] and events + 4 <= event_t.shape[0]:
+        if adaptive:
+            h = eta * dynamical_timescale(G, masses, positions, velocities)
+            h = min(max(h, dt_min), dt, target_time - sim_time)
+            # Never pass more grid times than there are free rows left in out
+            h = min(h, (counter + out.shape[0] - saved) * output_interval - sim_time)
+            previous_positions[:] = positions
+            previous_velocities[:] = velocities
+            previous_time = sim_time
+            if tree:
+                swap_step_start(step_start, positions, velocities, acc, Q, V, True)
+            if not advance(G, masses, positions, velocities, acc, h, force_mode, theta, c, post_newtonian, work, integrator, child, node_body, node_data, next_body):
+                swap_step_start(step_start, positions, velocities, acc, Q, V, False)
+                child, node_body, node_data = grow_quadtree(child, node_body, node_data)
+                continue
+            sim_time += h
+            steps += 1
+            t_stop = sim_time
+            if detect_events:
+                events, status, t_stop = detect_pair_events(previous_positions, previous_velocities, positions, velocities, previous_time, h,
+                                                            capture_radius, escape_radius, detect_apsides, event_t, event_kind, events)
+
+            # Every grid time passed by this step, cubic Hermite through both ends
+            while saved < out.shape[0]:
+                output_time = (counter + 1) * output_interval
+                if output_time > t_stop or output_time > target_time:
+                    break
+                s = (output_time - previous_time) / h
+                h00 = (1 + 2 * s) * (1 - s) ** 2
+                h10 = s * (1 - s) ** 2
+                h01 = s * s * (3 - 2 * s)
+                h11 = s * s * (s - 1)
+                out[saved, 0] = output_time
+                for i in range(n):
+                    for k in range(2):
+                        out[saved, 1 + 2 * i + k] = (h00 * previous_positions[i, k] + h10 * h * previous_velocities[i, k]
+                                                     + h01 * positions[i, k] + h11 * h * velocities[i, k])
+                saved += 1
+                counter += 1
+            if status != STATUS_FINISHED:
+                stop_at(previous_positions, previous_velocities, positions, velocities, h, (t_stop - previous_time) / h)
+                sim_time = t_stop
+                break
+            continue
+
+        if tree:
+            swap_step_start(step_start, positions, velocities, acc, Q, V, True)
+        if integrator == INTEGRATOR_WISDOM_HOLMAN:
+            fitted = wisdom_holman_step(G, masses, interaction_masses, Q, V, acc, dt, force_mode, theta, child, node_body, node_data, next_body)
+        else:
+            if detect_events:
+                previous_positions[:] = positions
+                previous_velocities[:] = velocities
+            fitted = advance(G, masses, positions, velocities, acc, dt, force_mode, theta, c, post_newtonian, work, integrator, child, node_body, node_data, next_body)
+        if not fitted:
+            swap_step_start(step_start, positions, velocities, acc, Q, V, False)
+            child, node_body, node_data = grow_quadtree(child, node_body, node_data)
+            continue
+        if integrator == INTEGRATOR_WISDOM_HOLMAN:
+            cm += cm_velocity * dt
+
+        previous_time = sim_time
+        sim_time += dt
+        counter += 1
+        steps += 1
+
+        if detect_events:
+            events, status, t_stop = detect_pair_events(previous_positions, previous_velocities, positions, velocities, previous_time, dt,
+                                                        capture_radius, escape_radius, detect_apsides, event_t, event_kind, events)
+            if status != STATUS_FINISHED:
+                # Final row at the event, the decimation restarts there
+                stop_at(previous_positions, previous_velocities, positions, velocities, dt, (t_stop - previous_time) / dt)
+                sim_time = t_stop
+                out[saved, 0] = sim_time
+                for i in range(n):
+                    out[saved, 1 + 2 * i] = positions[i, 0]
+                    out[saved, 2 + 2 * i] = positions[i, 1]
+                saved += 1
+                counter = 0
+                break
+
+        if counter == save_every:
+            if integrator == INTEGRATOR_WISDOM_HOLMAN:
+                from_democratic_heliocentric(masses, Q, V, cm, cm_velocity, positions, velocities)
+            out[saved, 0] = sim_time
+            for i in range(n):
+                out[saved, 1 + 2 * i] = positions[i, 0]
+                out[saved, 2 + 2 * i] = positions[i, 1]
+            saved += 1
+            counter = 0
+
+    if integrator == INTEGRATOR_WISDOM_HOLMAN:
+        from_democratic_heliocentric(masses, Q, V, cm, cm_velocity, positions, velocities)
+
+    return sim_time, counter, saved, steps, events, status
+
+
+@njit(cache = True)
+def integrate_two_body_member(G, masses, positions, velocities, target_time, dt, c, post_newtonian, integrator, adaptive, eta, dt_min, capture_radius, escape_radius):
+    # One ensemble member (two bodies) integrated in place until target_time or until
+    # their separation drops below capture_radius / exceeds escape_radius (crossing
+    # located as in integrate_nbody_chunk, the member ends on the state there). Returns
+    # status, end time, minimum separation and its time and the number of steps
+    n = masses.shape[0]
+    acc = np.empty((n, 2))
+    work = np.empty((n, 5))
+    child = np.empty((1, 4), dtype=np.int64)
+    node_body = np.empty(1, dtype=np.int64)
+    node_data = np.empty((1, 6))
+    next_body = np.empty(n, dtype=np.int64)
+    Q = np.empty((n, 2))
+    V = np.empty((n, 2))
+    cm = np.zeros(2)
+    cm_velocity = np.zeros(2)
+    interaction_masses = masses.copy()
+    interaction_masses[0] = 0.0
+    if integrator == INTEGRATOR_WISDOM_HOLMAN:
+        cm, cm_velocity = to_democratic_heliocentric(masses, positions, velocities, Q, V)
+        compute_accelerations(G, interaction_masses, Q, acc)
+    elif integrator == INTEGRATOR_LEAPFROG:
+        compute_accelerations(G, masses, positions, acc)
+
+    # Start of the step, kept to locate a crossing (wisdom_holman keeps its own variables)
+    detect_events = capture_radius > 0 or escape_radius < np.inf
+    previous_positions = np.empty((n, 2))
+    previous_velocities = np.empty((n, 2))
+    previous_Q = np.empty((n, 2))
+    previous_V = np.empty((n, 2))
+    previous_cm = np.zeros(2)
+    event_t = np.empty(2)
+    event_kind = np.empty(2, dtype=np.int64)
+
+    r_min = np.sqrt((positions[1, 0] - positions[0, 0]) ** 2 + (positions[1, 1] - positions[0, 1]) ** 2)
+    t_r_min = 0.0
+    sim_time = 0.0
+    steps = 0
+    status = STATUS_FINISHED
+
+    while sim_time < target_time:
+        h = dt
+        if adaptive:
+            h = min(max(eta * dynamical_timescale(G, masses, positions, velocities), dt_min), dt)
+
+        if integrator == INTEGRATOR_WISDOM_HOLMAN:
+            if detect_events:
+                previous_Q[:] = Q
+                previous_V[:] = V
+                previous_cm[:] = cm
+            wisdom_holman_step(G, masses, interaction_masses, Q, V, acc, h, FORCE_DIRECT, 0.0, child, node_body, node_data, next_body)
+            cm += cm_velocity * h
+            separation = np.sqrt(Q[1, 0] ** 2 + Q[1, 1] ** 2)
+        else:
+            if detect_events:
+                previous_positions[:] = positions
+                previous_velocities[:] = velocities
+            advance(G, masses, positions, velocities, acc, h, FORCE_DIRECT, 0.0, c, post_newtonian, work, integrator, child, node_body, node_data, next_body)
+            separation = np.sqrt((positions[1, 0] - positions[0, 0]) ** 2 + (positions[1, 1] - positions[0, 1]) ** 2)
+        steps += 1
+        step_end = sim_time + h
+
+        if separation <= capture_radius or separation >= escape_radius:
+            status = STATUS_CAPTURED if separation <= capture_radius else STATUS_ESCAPED
+            if integrator == INTEGRATOR_WISDOM_HOLMAN:
+                from_democratic_heliocentric(masses, previous_Q, previous_V, previous_cm, cm_velocity, previous_positions, previous_velocities)
+                from_democratic_heliocentric(masses, Q, V, cm, cm_velocity, positions, velocities)
+            _, crossed, t_stop = detect_pair_events(previous_positions, previous_velocities, positions, velocities, sim_time, h,
+                                                    capture_radius, escape_radius, False, event_t, event_kind, 0)
+            # Not crossed inside the step when the member started across, it then ends
+            # at the end of its first step
+            if crossed != STATUS_FINISHED:
+                stop_at(previous_positions, previous_velocities, positions, velocities, h, (t_stop - sim_time) / h)
+                status = crossed
+                step_end = t_stop
+                separation = np.sqrt((positions[1, 0] - positions[0, 0]) ** 2 + (positions[1, 1] - positions[0, 1]) ** 2)
+
+        if separation < r_min:
+            r_min = separation
+            t_r_min = step_end
+        sim_time = step_end
+        if status != STATUS_FINISHED:
+            break
+
+    if integrator == INTEGRATOR_WISDOM_HOLMAN and status == STATUS_FINISHED:
+        from_democratic_heliocentric(masses, Q, V, cm, cm_velocity, positions, velocities)
+
+    return status, sim_time, r_min, t_r_min, steps
+
+
+@njit(cache = True, parallel = True)
+def integrate_two_body_ensemble(G, masses, positions, velocities, target_time, dt, c, post_newtonian, integrator, adaptive, eta, dt_min, capture_radius, escape_radius, status, end_time, r_min, t_r_min, steps):
+    # masses (M, 2), positions and velocities (M, 2, 2), one independent two-body system
+    # per member spread over all cores, the final states are written back in place
+    for m in prange(masses.shape[0]):
+        member_status, t, member_r_min, member_t_r_min, member_steps = integrate_two_body_member(
+            G, masses[m], positions[m], velocities[m], target_time, dt, c, post_newtonian, integrator, adaptive, eta, dt_min, capture_radius, escape_radius
+        )
+        status[m] = member_status
+        end_time[m] = t
+        r_min[m] = member_r_min
+        t_r_min[m] = member_t_r_min
+        steps[m] = member_steps
+
+
+def warm_up():
+    # Run every kernel once on a tiny problem so the cache is populated and any
+    # first-call overhead is paid here rather than in a simulation
+    start_time = time.time()
+    position1 = np.zeros(2)
+    velocity1 = np.zeros(2)
+    position2 = np.array([1.0, 0.0])
+    force1, force2 = calculate_gravitational_force(1.0, 1.0, position1, 1.0, position2)
+    update_position(1.0, position1.copy(), velocity1.copy(), force1, 1e-3)
+
+    n = PARALLEL_THRESHOLD
+    masses = np.ones(n)
+    positions = np.ascontiguousarray(np.column_stack((np.arange(n, dtype=np.float64), np.zeros(n))))
+    velocities = np.zeros((n, 2))
+    for force_mode in (FORCE_DIRECT, FORCE_TREE):
+        for integrator in (INTEGRATOR_EULER, INTEGRATOR_LEAPFROG, INTEGRATOR_YOSHIDA4, INTEGRATOR_WISDOM_HOLMAN):
+            for adaptive in (False, True) if integrator != INTEGRATOR_WISDOM_HOLMAN else (False,):
+                integrate_nbody_chunk(1.0, masses, positions.copy(), velocities.copy(), np.empty((n, 2)), 0.0, 1e-2, 1e-3, 1, 0, np.empty((16, 1 + 2 * n)), force_mode, 0.5, 1e3,
+                                      POST_NEWTONIAN_2_5PN if force_mode == FORCE_DIRECT and integrator != INTEGRATOR_WISDOM_HOLMAN else POST_NEWTONIAN_NONE, integrator, adaptive, 0.01, 1e-9,
+                                      0.5 if integrator != INTEGRATOR_WISDOM_HOLMAN else 0.0, np.inf, integrator != INTEGRATOR_WISDOM_HOLMAN, np.empty(64), np.empty(64, dtype=np.int64),
+                                      *allocate_quadtree(n))
+    return time.time() - start_time
+
+
+def compiled_kernels():
+    # Kernels this process compiled instead of loading them from the on-disk cache
+    return [name for name, kernel in globals().items() if isinstance(kernel, CPUDispatcher) and kernel.stats.cache_misses]
+
+
+if __name__ == "__main__":
+    import sys, os, subprocess
+
+    loaded = time.time() - LOAD_START
+    elapsed = warm_up()
+    print(f"Newton kernels compiled / loaded in: {loaded}s, warm-up run in: {elapsed}s")
+
+    # A new process has to find every kernel in the cache
+    check = subprocess.run([sys.executable, "-c", "import newton_kernels; newton_kernels.warm_up(); print(*newton_kernels.compiled_kernels())"],
+                           cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True)
+    recompiled = check.stdout.split()
+    if recompiled:
+        print(f"Compiled again by a new process instead of loaded from the cache: {', '.join(recompiled)}")
+        sys.exit(1)
+    print("A new process loads every kernel from the cache")
+    sys.exit(0)
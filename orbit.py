@@ -0,0 +1,268 @@
+import numpy as np
+
+# Semi-analytic Schwarzschild orbits. Instead of stepping the equations of motion in
+# time, the orbit equation for u = 1/r is reduced once, from the initial state, to
+#     (du/dphi)^2 = P(u) / w(u)^2,    P(u) = A u^3 - u^2 + B u + C
+# with, for the two formulations of simulate_GR and the exact geodesic,
+#     schwarzschild          A = 2/3 Rs, B = c^2 Rs / l^2, w = 1 - Rs u, dt/dphi = 1 / (l u^2)
+#     eddington_finkelstein  the same orbit, timed in T = t - (r - r0) / c,
+#                            dT/dphi = dt/dphi - (dr/dphi) / c
+#     geodesic               A = Rs, B = c^2 Rs / L^2, C = (E^2/c^2 - c^2) / L^2, w = 1,
+#                            dv/dphi = (c^2 + L^2 u^2) / (c (E/c - dr/dtau) L u^2)
+# (l = pphi / mass, C of the first from the initial state). The geodesic is the timelike
+# geodesic, timed in the ingoing Eddington-Finkelstein time v = t + r*/c, which
+# simulate_GR does not integrate (benchmarks/post_newtonian.py measures against it),
+# its state comes from geodesic_state. With the roots u1 <= u2 <= u3
+# of P and the anomaly chi, u = (u2 + u1) / 2 + (u2 - u1) / 2 cos(chi), the square root
+# singularities at the turning points cancel:
+#     dphi/dchi = w(u) / sqrt(A (u3 - u)),    dt/dchi = dphi/dchi * dt/dphi
+# are smooth, chi = 0 is periapsis and chi = pi apoapsis. phi(chi) and t(chi) are
+# tabulated once with Gauss-Legendre panels and read back through cubic Hermite
+# interpolation with the exact derivatives. A bound orbit repeats every radial period
+# (chi -> chi + 2 pi, t -> t + radial_period, phi -> phi + angle_per_period), so any
+# time or angle maps into one period of the table. A scattering orbit (u1 <= 0, it
+# reaches r = infinity at chi = +-chi_inf) is tabulated in s, chi = chi_inf tanh(s),
+# which keeps the 1 / u^2 growth of dt/dchi smooth towards infinity.
+# Orbits that plunge into the black hole have no periapsis and are left to simulate_GR.
+
+GAUSS_NODES, GAUSS_WEIGHTS = np.polynomial.legendre.leggauss(8)
+SCATTERING_END = 14.0  # last tabulated s, chi_inf - chi ~ 1e-12 chi_inf
+
+
+# Initial state of the geodesic formulation, (vx, vy) is the velocity measured by a static
+# observer at (x, y)
+def geodesic_state(x, y, vx, vy, Rs, c):
+    r = np.sqrt(x**2 + y**2)
+    if np.any(r <= Rs):
+        raise ValueError("A static observer only exists outside Rs, start the particle at r > Rs.")
+    phi = np.arctan2(y, x)
+    v_r = vx * np.cos(phi) + vy * np.sin(phi)
+    v_phi = -vx * np.sin(phi) + vy * np.cos(phi)
+    gamma = 1 / np.sqrt(1 - (v_r**2 + v_phi**2) / c**2)
+    u = gamma * v_r * np.sqrt(1 - Rs / r)  # dr/dtau
+    L = gamma * r * v_phi  # r^2 dphi/dtau
+    return r, phi, u, L
+
+
+class SchwarzschildOrbit:
+    def __init__(self, state, Rs, c=299792458, coordinates="schwarzschild", mass=1.0, panels=32768):
+        # state is the initial state of the formulation, [r, phi, pr, pphi] or, for the
+        # geodesic, [r, phi, dr/dtau, L] (see geodesic_state), mass only enters the momenta
+        if coordinates not in ("schwarzschild", "eddington_finkelstein", "geodesic"):
+            raise ValueError(f"Unknown coordinates: {coordinates}")
+        r0, phi0, radial, angular = (float(value) for value in state)
+        if angular == 0:
+            raise ValueError("A radial orbit has no orbit equation, use simulate_GR.")
+        self.Rs = Rs
+        self.c = c
+        self.coordinates = coordinates
+        self.geodesic = coordinates == "geodesic"
+        self.mass = mass
+        self.phi0 = phi0
+        self.direction = 1.0 if angular > 0 else -1.0
+        self.angular = abs(angular) if self.geodesic else abs(angular) / mass
+
+        u0 = 1 / r0
+        f0 = 1 - Rs * u0
+        if not self.geodesic:
+            A = 2 / 3 * Rs
+            B = c**2 * Rs / self.angular**2
+            slope = radial / (mass * f0 * self.angular)  # -du/dphi
+            C = f0**2 * slope**2 + u0**2 - A * u0**3 - B * u0
+        else:
+            self.energy = np.sqrt(radial**2 + f0 * (c**2 + self.angular**2 * u0**2))  # E / c
+            A = Rs
+            B = c**2 * Rs / self.angular**2
+            # (E^2/c^2 - c^2) without cancelling c^2 against E^2/c^2
+            C = (radial**2 - Rs * u0 * c**2 + f0 * self.angular**2 * u0**2) / self.angular**2
+        self.A = A
+        u1, u2, u3 = self.roots(A, B, C, u0, radial)
+        if u2 >= 1 / Rs:
+            raise ValueError("The orbit reaches the horizon, use simulate_GR.")
+        self.u3 = u3
+        self.u_mean = 0.5 * (u1 + u2)
+        self.u_amplitude = 0.5 * (u2 - u1)
+        self.periapsis = 1 / u2
+        self.apoapsis = 1 / u1 if u1 > 0 else np.inf
+        self.bound = u1 > 0
+
+        # Anomaly of the initial state from both its cosine and its sine (the radial
+        # velocity), arccos alone loses half the digits next to the turning points.
+        # Outward motion is 0 < chi < pi
+        if self.u_amplitude == 0:
+            chi0 = 0.0
+        else:
+            radial_velocity = radial if self.geodesic else radial / (mass * f0)
+            angle_rate = (1.0 if self.geodesic else f0) / np.sqrt(A * (u3 - u0))
+            chi0 = np.arctan2(radial_velocity * angle_rate / (self.angular * self.u_amplitude), (u0 - self.u_mean) / self.u_amplitude)
+
+        if self.bound:
+            lo, hi = 0.0, 2 * np.pi
+        else:
+            self.chi_inf = np.arccos(-self.u_mean / self.u_amplitude)
+            lo, hi = np.arctanh(chi0 / self.chi_inf), SCATTERING_END
+        self.nodes = np.linspace(lo, hi, panels + 1)
+        self.h = (hi - lo) / panels
+        points = self.nodes[:-1, None] + 0.5 * self.h * (1 + GAUSS_NODES)
+        angle_rate, time_rate = self.parameter_rates(points)
+        self.angle_table = np.concatenate(([0.0], np.cumsum(0.5 * self.h * (angle_rate @ GAUSS_WEIGHTS))))
+        self.time_table = np.concatenate(([0.0], np.cumsum(0.5 * self.h * (time_rate @ GAUSS_WEIGHTS))))
+        self.angle_slopes, self.time_slopes = self.parameter_rates(self.nodes)
+
+        if self.bound:
+            self.radial_period = self.time_table[-1]
+            self.angle_per_period = self.angle_table[-1]
+            self.precession = self.angle_per_period - 2 * np.pi
+            chi0 %= 2 * np.pi
+            self.start_time = self.interpolate(self.time_table, self.time_slopes, chi0)
+            self.start_angle = self.interpolate(self.angle_table, self.angle_slopes, chi0)
+        else:
+            self.radial_period = np.inf
+            self.angle_per_period = np.inf
+            self.precession = np.nan
+            self.start_time = 0.0
+            self.start_angle = 0.0
+        self.chi0 = chi0
+
+    @staticmethod
+    def roots(A, B, C, u0, radial):
+        # Roots u1 <= u2 <= u3 of P around u0, polished by Newton as the companion matrix
+        # is far from well scaled (u3 ~ 1 / Rs, u1 and u2 ~ 1 / r)
+        roots = np.roots([A, -1.0, B, C])
+        real = np.abs(roots.imag) <= 1e-6 * np.abs(roots.real)
+        if not np.all(real):
+            pair = roots[~real]
+            if np.sum(real) != 1 or abs(pair[0].real - u0) > 1e-6 * u0:
+                raise ValueError("The orbit plunges into the black hole, use simulate_GR.")
+            # Circular to the precision of the roots
+            return u0, u0, float(roots[real][0].real)
+        roots = np.sort(roots.real)
+        for _ in range(4):
+            slope = 3 * A * roots**2 - 2 * roots + B
+            step = np.where(slope != 0, (((A * roots - 1) * roots + B) * roots + C) / np.where(slope != 0, slope, 1), 0)
+            roots = roots - step
+        u1, u2, u3 = np.sort(roots)
+        if u0 > 0.5 * (u2 + u3):
+            raise ValueError("The orbit plunges into the black hole, use simulate_GR.")
+        if radial == 0:
+            # The initial state is a turning point, exactly
+            if u0 - u1 < u2 - u0:
+                u1 = u0
+            else:
+                u2 = u0
+        return u1, u2, u3
+
+    def anomaly(self, x):
+        # chi and dchi/dx of the table parameter x
+        if self.bound:
+            return x, np.ones_like(x)
+        t = np.tanh(x)
+        return self.chi_inf * t, self.chi_inf * (1 - t * t)
+
+    def rates(self, chi):
+        # dphi/dchi and dt/dchi (dT/dchi, dv/dchi)
+        u = self.u_mean + self.u_amplitude * np.cos(chi)
+        w = 1.0 if self.geodesic else 1 - self.Rs * u
+        angle_rate = w / np.sqrt(self.A * (self.u3 - u))
+        if self.coordinates == "schwarzschild":
+            return angle_rate, angle_rate / (self.angular * u**2)
+        if self.coordinates == "eddington_finkelstein":
+            return angle_rate, angle_rate / (self.angular * u**2) - self.u_amplitude * np.sin(chi) / (self.c * u**2)
+        radial = self.angular * self.u_amplitude * np.sin(chi) / angle_rate  # dr/dtau
+        return angle_rate, angle_rate * (self.c**2 + self.angular**2 * u**2) / (self.c * (self.energy - radial) * self.angular * u**2)
+
+    def parameter_rates(self, x):
+        chi, chi_rate = self.anomaly(x)
+        angle_rate, time_rate = self.rates(chi)
+        return angle_rate * chi_rate, time_rate * chi_rate
+
+    def interpolate(self, values, slopes, x):
+        x = np.asarray(x, dtype=np.float64)
+        k = np.clip(np.floor((x - self.nodes[0]) / self.h).astype(np.int64), 0, len(self.nodes) - 2)
+        s = (x - self.nodes[k]) / self.h
+        return ((1 + 2 * s) * (1 - s)**2 * values[k] + s * (1 - s)**2 * self.h * slopes[k]
+                + s * s * (3 - 2 * s) * values[k + 1] + s * s * (s - 1) * self.h * slopes[k + 1])
+
+    def invert(self, values, slopes, target):
+        # Table parameter x where the increasing tabulated function reaches target,
+        # Newton on the Hermite cubic of the bracketing panel
+        k = np.clip(np.searchsorted(values, target, side="right") - 1, 0, len(self.nodes) - 2)
+        v0, v1 = values[k], values[k + 1]
+        d0, d1 = self.h * slopes[k], self.h * slopes[k + 1]
+        s = np.clip((target - v0) / (v1 - v0), 0.0, 1.0)
+        for _ in range(4):
+            value = (1 + 2 * s) * (1 - s)**2 * v0 + s * (1 - s)**2 * d0 + s * s * (3 - 2 * s) * v1 + s * s * (s - 1) * d1
+            slope = (6 * s * s - 6 * s) * (v0 - v1) + (3 * s * s - 4 * s + 1) * d0 + (3 * s * s - 2 * s) * d1
+            s = np.clip(s - (value - target) / slope, 0.0, 1.0)
+        return self.nodes[k] + s * self.h
+
+    def locate(self, values, slopes, since_start, start, period):
+        # Table parameter and number of whole periods at since_start (time or swept
+        # angle) after the initial state
+        since_start = np.asarray(since_start, dtype=np.float64)
+        if not self.bound:
+            if np.any(since_start > values[-1]):
+                raise ValueError("Beyond the tabulated part of the scattering orbit.")
+            return self.invert(values, slopes, since_start), np.zeros_like(since_start)
+        total = since_start + start
+        periods = np.floor(total / period)
+        return self.invert(values, slopes, total - periods * period), periods
+
+    def states(self, x, periods):
+        # State of the formulation at table parameter x, periods radial periods on
+        chi, _ = self.anomaly(x)
+        u = self.u_mean + self.u_amplitude * np.cos(chi)
+        angle_rate, _ = self.rates(chi)
+        swept = self.interpolate(self.angle_table, self.angle_slopes, x) - self.start_angle
+        if self.bound:
+            swept = swept + periods * self.angle_per_period
+        r = 1 / u
+        phi = self.phi0 + self.direction * swept
+        radial = self.angular * self.u_amplitude * np.sin(chi) / angle_rate  # dr/dt or dr/dtau
+        if not self.geodesic:
+            return r, phi, self.mass * (1 - self.Rs * u) * radial, np.full_like(r, self.direction * self.mass * self.angular)
+        return r, phi, radial, np.full_like(r, self.direction * self.angular)
+
+    def states_at_times(self, t):
+        # (r, phi, radial, angular) arrays at the times t >= 0 after the initial state
+        x, periods = self.locate(self.time_table, self.time_slopes, t, self.start_time, self.radial_period)
+        return self.states(x, periods)
+
+    def times_at_angles(self, swept):
+        # Times at which the particle has swept the angles swept >= 0 (radians, in its
+        # direction of motion) from the initial state
+        x, periods = self.locate(self.angle_table, self.angle_slopes, swept, self.start_angle, self.angle_per_period)
+        return self.interpolate(self.time_table, self.time_slopes, x) - self.start_time + periods * self.radial_period
+
+    def states_at_angles(self, swept):
+        x, periods = self.locate(self.angle_table, self.angle_slopes, swept, self.start_angle, self.angle_per_period)
+        return self.states(x, periods)
+
+    def first_passage(self, chi):
+        # First time > 0 at which the orbit passes the anomaly chi, inf if it never does
+        if self.bound:
+            first = float(self.interpolate(self.time_table, self.time_slopes, chi % (2 * np.pi))) - self.start_time
+            return first + self.radial_period if first <= 0 else first
+        if not self.chi0 < chi < self.chi_inf:
+            return np.inf
+        return float(self.interpolate(self.time_table, self.time_slopes, np.arctanh(chi / self.chi_inf)))
+
+    def passages(self, chi, t_end):
+        # Times in (0, t_end] at which the orbit passes the anomaly chi
+        first = self.first_passage(chi)
+        if first > t_end:
+            return np.empty(0)
+        if not self.bound:
+            return np.array([first])
+        return first + self.radial_period * np.arange(int((t_end - first) // self.radial_period) + 1)
+
+    def apsis_times(self, t_end):
+        # Periapsis and apoapsis passages in (0, t_end]
+        return self.passages(0.0, t_end), self.passages(np.pi, t_end)
+
+    def escape_time(self, radius):
+        # First time r rises to radius, inf if it never does
+        u = 1 / radius
+        if self.u_amplitude == 0 or not self.u_mean - self.u_amplitude <= u <= self.u_mean + self.u_amplitude:
+            return np.inf
+        return self.first_passage(np.arccos(np.clip((u - self.u_mean) / self.u_amplitude, -1.0, 1.0)))
@@ -1,9 +1,11 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 from matplotlib.ticker import EngFormatter
+from trajectory import open_trajectory
 
-# Read CSV file
-df = pd.read_csv(r'mercury_1e9s\GR.csv')
+# Read the GR trajectory
+trajectory = open_trajectory(r'mercury_1e9s\GR.traj')
+df = pd.DataFrame({column: trajectory[column] for column in trajectory.columns})
 
 # Initialize lists to store the zero crossing index and corresponding values
 zero_crossings = []
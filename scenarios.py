@@ -0,0 +1,181 @@
+import numpy as np
+import json, os, sys, time, argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Scenarios as data files and a runner for them. A scenario is a scenario.json (in the
+# scenario directories next to this file) describing a test body around a central mass:
+#   {
+#     "central": {"mass": "10 M_sun", "radius": "1 Rs"},
+#     "body": {"mass": 1.675e-27, "position": ["4 Rs", 0], "velocity": [0, "-0.4 c"]},
+#     "target_time": 0.03, "resolution": 1e7,
+#     "gr": {...}, "newton": {...},
+#     "plot": {"limit": 200000, "interval": 5e-5, "label": "Event horizon", "export_animation": true,
+#              "duration": 20, "fps": 30}
+#   }
+# Quantities are numbers in SI units or "<number> <unit>" strings with the units of
+# `units` (Rs is the Schwarzschild radius of the central mass). "gr" and "newton" hold
+# extra keyword arguments of simulate_GR / simulate_newton, the Newton step defaults to
+# target_time / resolution and "G" / "c" may be given at the top level. Every scenario is
+# two independent jobs, GR and Newton, which run in separate worker processes and write
+# GR.traj / Newton.traj into the scenario's own output directory, so any number of
+# scenarios run side by side across the cores. With --cache the runs go through the
+# result cache (cache.py), so re-plotting a scenario costs no integration.
+#   python scenarios.py                      every scenario next to this file
+#   python scenarios.py mercury_orbit -j 2   one scenario, at most 2 processes
+#   python scenarios.py --plot               and plot every scenario afterwards
+
+SCENARIO_NAME = "scenario.json"
+DEFAULT_G = 6.67430e-11
+DEFAULT_C = 299792458
+M_SUN = 1.989e30
+
+
+def units(G, c, central_mass):
+    return {"m": 1.0, "s": 1.0, "kg": 1.0, "M_sun": M_SUN, "c": c, "Rs": 2 * G * central_mass / c**2}
+
+
+def quantity(value, unit_values):
+    # A number, a "<number> <unit>" string or a list of them
+    if isinstance(value, list):
+        return [quantity(v, unit_values) for v in value]
+    if isinstance(value, str):
+        number, _, unit = value.strip().partition(" ")
+        if unit.strip() not in unit_values:
+            raise ValueError(f"Unknown unit in {value!r}, expected one of {sorted(unit_values)}")
+        return float(number) * unit_values[unit.strip()]
+    return float(value)
+
+
+def scenario_path(path):
+    # A scenario directory or the scenario file itself
+    return os.path.join(path, SCENARIO_NAME) if os.path.isdir(path) else path
+
+
+def load_scenario(path, output_root=None):
+    # Reads a scenario file into plain SI values, outputs go next to the file unless
+    # output_root is given (output_root/<name> then)
+    path = scenario_path(path)
+    with open(path) as file:
+        data = json.load(file)
+    directory = os.path.dirname(os.path.abspath(path))
+    name = data.get("name", os.path.basename(directory))
+    G = float(data.get("G", DEFAULT_G))
+    c = float(data.get("c", DEFAULT_C))
+
+    central = data["central"]
+    central_mass = quantity(central["mass"], units(G, c, 0.0))
+    unit_values = units(G, c, central_mass)
+    body = data["body"]
+    target_time = quantity(data["target_time"], unit_values)
+    resolution = data["resolution"]
+    output = os.path.join(output_root, name) if output_root is not None else directory
+    return {
+        "name": name,
+        "G": G,
+        "c": c,
+        "Rs": unit_values["Rs"],
+        "central_mass": central_mass,
+        "central_position": quantity(central.get("position", [0, 0]), unit_values),
+        "central_velocity": quantity(central.get("velocity", [0, 0]), unit_values),
+        "central_radius": quantity(central.get("radius", "1 Rs"), unit_values),
+        "mass": quantity(body["mass"], unit_values),
+        "position": quantity(body["position"], unit_values),
+        "velocity": quantity(body["velocity"], unit_values),
+        "target_time": target_time,
+        "resolution": resolution,
+        "dt": quantity(data.get("newton", {}).get("dt", target_time / resolution), unit_values),
+        "gr": dict(data.get("gr", {})),
+        "newton": {key: value for key, value in data.get("newton", {}).items() if key != "dt"},
+        "plot": data.get("plot", {}),
+        "output": output,
+    }
+
+
+def find_scenarios(root=None):
+    # Every <directory>/scenario.json directly below root (the repository by default)
+    root = root or os.path.dirname(os.path.abspath(__file__))
+    return sorted(os.path.join(root, entry) for entry in os.listdir(root)
+                  if os.path.isfile(os.path.join(root, entry, SCENARIO_NAME)))
+
+
+def run_job(kind, scenario, cache=False):
+    # One GR or Newton run of a scenario, executed in a worker process. Returns the
+    # scenario name, the kind and the wall-clock time
+    from Schwarzschild import simulate_GR
+    from Newton import simulate_newton
+
+    start_time = time.time()
+    os.makedirs(scenario["output"], exist_ok=True)
+    x, y = scenario["position"]
+    vx, vy = scenario["velocity"]
+    if kind == "GR":
+        simulate_GR(scenario["mass"], x, y, vx, vy, scenario["Rs"], scenario["target_time"], scenario["resolution"], c=scenario["c"],
+                    output=os.path.join(scenario["output"], "GR.traj"), cache=cache, **scenario["gr"])
+    else:
+        simulate_newton(scenario["central_mass"], scenario["central_position"], scenario["central_velocity"],
+                        scenario["mass"], scenario["position"], scenario["velocity"], scenario["target_time"], scenario["dt"], G=scenario["G"],
+                        output=os.path.join(scenario["output"], "Newton.traj"), cache=cache, **scenario["newton"])
+    return scenario["name"], kind, time.time() - start_time
+
+
+def run_scenarios(scenarios, processes=None, cache=False):
+    # Runs the GR and Newton jobs of every scenario on a pool of processes (one per core
+    # by default), the scenarios with the most samples first. Returns {(name, kind):
+    # wall-clock time}, a job that failed is reported and raises once the others are done
+    processes = processes or (len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count())
+    jobs = [(kind, scenario) for scenario in sorted(scenarios, key=lambda s: -s["resolution"]) for kind in ("GR", "Newton")]
+    timings = {}
+    failures = []
+    # spawn, the workers must not inherit the numba threading state of this process
+    with ProcessPoolExecutor(max_workers=min(processes, len(jobs)), mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {pool.submit(run_job, kind, scenario, cache): (scenario["name"], kind) for kind, scenario in jobs}
+        for future in as_completed(futures):
+            name, kind = futures[future]
+            try:
+                timings[name, kind] = future.result()[2]
+                print(f"{name} {kind} finished in: {timings[name, kind]:.2f}s")
+            except Exception as error:
+                failures.append((name, kind, error))
+                print(f"{name} {kind} failed: {error!r}")
+    if failures:
+        raise RuntimeError(f"{len(failures)} of {len(jobs)} jobs failed: " + ", ".join(f"{name} {kind}" for name, kind, _ in failures))
+    return timings
+
+
+def plot_scenario(scenario):
+    # visualize.plot of both trajectories, an exported animation lands in the output directory
+    from visualize import plot, DEFAULT_DURATION, DEFAULT_FPS
+
+    settings = scenario["plot"]
+    working_directory = os.getcwd()
+    os.chdir(scenario["output"])
+    try:
+        plot("Newton.traj", "GR.traj", settings.get("limit", 5 * np.hypot(*scenario["position"])), settings.get("interval", 50e-8),
+             scenario["central_radius"], settings.get("label", "Event horizon"), export_animation=settings.get("export_animation", False),
+             duration=settings.get("duration", DEFAULT_DURATION), fps=settings.get("fps", DEFAULT_FPS))
+    finally:
+        os.chdir(working_directory)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Run GR and Newton scenarios in parallel.")
+    parser.add_argument("scenarios", nargs="*", help="scenario directories or files (default: all)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("-o", "--output", default=None, help="write into OUTPUT/<scenario> instead of the scenario directories")
+    parser.add_argument("--plot", action="store_true", help="plot every scenario once its runs are done")
+    parser.add_argument("--cache", action="store_true", help="reuse identical earlier runs from the result cache (see cache.py)")
+    arguments = parser.parse_args(arguments)
+
+    start_time = time.time()
+    scenarios = [load_scenario(path, arguments.output) for path in (arguments.scenarios or find_scenarios())]
+    run_scenarios(scenarios, arguments.jobs, arguments.cache)
+    print(f"{len(scenarios)} scenarios finished in: {time.time() - start_time:.2f}s")
+    if arguments.plot:
+        for scenario in scenarios:
+            plot_scenario(scenario)
+
+
+if __name__ == "__main__":
+    main()
+    sys.exit(0)
@@ -0,0 +1,54 @@
+import unittest
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+from barnes_hut import check_against_direct, allocate_quadtree
+from newton_kernels import integrate_nbody_chunk, FORCE_TREE, POST_NEWTONIAN_NONE, INTEGRATOR_LEAPFROG
+
+# Barnes-Hut accelerations against the direct sum (errors relative to the RMS
+# acceleration, see barnes_hut.check_against_direct)
+#   python -m unittest discover tests
+
+G = 6.67430e-11
+
+
+class TreeAccuracy(unittest.TestCase):
+    def test_exact_at_zero_opening_angle(self):
+        rms_error, max_error, _, _ = check_against_direct(1000, 0.0)
+        self.assertLess(max_error, 1e-12)
+
+    def test_error_within_tolerance(self):
+        rms_error, max_error, _, _ = check_against_direct(2000, 0.5)
+        self.assertLess(rms_error, 2e-3)
+        self.assertLess(max_error, 2e-2)
+
+    def test_error_grows_with_opening_angle(self):
+        errors = [check_against_direct(1000, theta)[0] for theta in (0.3, 0.5, 1.0)]
+        self.assertEqual(errors, sorted(errors))
+
+    def test_overflow_retry_is_exact(self):
+        # A step whose tree does not fit the arrays is taken again with larger ones, the
+        # run must not depend on the initial capacity
+        rng = np.random.default_rng(1)
+        n = 50
+        masses = rng.uniform(1e29, 1e30, n)
+        positions = rng.uniform(-1e12, 1e12, (n, 2))
+        velocities = rng.uniform(-1e4, 1e4, (n, 2))
+        results = []
+        for small in (False, True):
+            child, node_body, node_data, next_body = allocate_quadtree(n)
+            if small:
+                child, node_body, node_data = np.empty((8, 4), dtype=np.int64), np.empty(8, dtype=np.int64), np.empty((8, 6))
+            p, v = positions.copy(), velocities.copy()
+            out = np.empty((16, 1 + 2 * n))
+            integrate_nbody_chunk(G, masses, p, v, np.zeros((n, 2)), 0.0, 1e5, 1e4, 1, 0, out,
+                                  FORCE_TREE, 0.5, 299792458.0, POST_NEWTONIAN_NONE, INTEGRATOR_LEAPFROG, False, 0.01, 1e-5, 0.0, np.inf, False,
+                                  np.empty(64), np.empty(64, dtype=np.int64), child, node_body, node_data, next_body)
+            results.append((p, v))
+        np.testing.assert_array_equal(results[0][0], results[1][0])
+        np.testing.assert_array_equal(results[0][1], results[1][1])
+
+
+if __name__ == "__main__":
+    unittest.main()
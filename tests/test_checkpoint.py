@@ -0,0 +1,67 @@
+import unittest
+import os, sys, io, contextlib, tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+from Newton import simulate_nbody
+from Schwarzschild import simulate_GR
+from metrics import RunMetrics
+from trajectory import open_trajectory
+from checkpoint import checkpoint_path
+
+# A run interrupted after a checkpoint and resumed must write the same trajectory, bit
+# for bit, as the run that was never interrupted. The interruption is an exception from
+# the progress callback, checkpoint_every=0 checkpoints at every chunk boundary.
+#   python -m unittest discover tests
+
+
+class Interrupted(Exception):
+    pass
+
+
+def interrupt_after(calls):
+    count = [0]
+
+    def progress(_):
+        count[0] += 1
+        if count[0] > calls:
+            raise Interrupted
+    return RunMetrics(progress, progress_interval=0)
+
+
+class Resume(unittest.TestCase):
+    def assert_same_trajectory(self, path, reference):
+        resumed, complete = open_trajectory(path), open_trajectory(reference)
+        self.assertEqual(len(resumed), len(complete))
+        for column in complete.columns:
+            np.testing.assert_array_equal(resumed[column], complete[column])
+
+    def test_newton(self):
+        arguments = ([1.989e30, 3.3e23, 5.97e24], [[0, 0], [46e9, 0], [0, 1.5e11]], [[0, 0], [0, 58.97e3], [-29.8e3, 0]], 2e7, 500.0, 10)
+        options = dict(integrator="yoshida4", adaptive=True, chunk_size=100, apsides=True)
+        with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+            reference = os.path.join(directory, "complete.traj")
+            path = os.path.join(directory, "resumed.traj")
+            simulate_nbody(*arguments, output=reference, **options)
+            with self.assertRaises(Interrupted):
+                simulate_nbody(*arguments, output=path, checkpoint_every=0, metrics=interrupt_after(5), **options)
+            self.assertTrue(os.path.exists(checkpoint_path(path)))
+            simulate_nbody(*arguments, output=path, resume=True, **options)
+            self.assert_same_trajectory(path, reference)
+            np.testing.assert_array_equal(np.load(os.path.join(path, "events.npz"))["periapsis"], np.load(os.path.join(reference, "events.npz"))["periapsis"])
+
+    def test_gr(self):
+        arguments = (1.0, 1e5, 0.0, 0.0, 0.2 * 299792458, 2953.0, 1e-2, 20001, 1)
+        with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+            reference = os.path.join(directory, "complete.traj")
+            path = os.path.join(directory, "resumed.traj")
+            simulate_GR(*arguments, output=reference, chunk_size=1000)
+            with self.assertRaises(Interrupted):
+                simulate_GR(*arguments, output=path, chunk_size=1000, checkpoint_every=0, metrics=interrupt_after(5))
+            self.assertTrue(os.path.exists(checkpoint_path(path)))
+            simulate_GR(*arguments, output=path, chunk_size=1000, resume=True)
+            self.assert_same_trajectory(path, reference)
+
+
+if __name__ == "__main__":
+    unittest.main()
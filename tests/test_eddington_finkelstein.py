@@ -0,0 +1,73 @@
+import unittest
+import os, sys, io, contextlib, tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+from gr_kernels import solve_dop853, EQUATIONS_SCHWARZSCHILD, EQUATIONS_EDDINGTON_FINKELSTEIN
+from Schwarzschild import simulate_GR, cartesian_to_polar, analytic_orbit
+
+# The eddington_finkelstein formulation is the schwarzschild one in the time
+# T = t - (r - r0) / c: from the same initial conditions both give the same states at
+# t = T + (r - r0) / c, down to 1.1 Rs for an infall
+#   python -m unittest discover tests
+
+G = 6.67430e-11
+c = 299792458
+Rs = 2 * G * 10 * 1.989e30 / c**2
+mass = 1.675e-27
+RTOL = 2.220446049250313e-14
+ATOL = 1e-21
+
+
+def compare(test, x0, vy0, T_end, r_min=0.0):
+    # States of both formulations at the same coordinate times, r > r_min
+    y0 = np.array(cartesian_to_polar(x0, 0.0, 0.0, vy0, mass))
+    params = np.array([mass, Rs, c])
+    T = np.linspace(0.0, T_end, 2001)
+    ef = solve_dop853(EQUATIONS_EDDINGTON_FINKELSTEIN, params, y0, (0.0, T_end), T, RTOL, ATOL)
+    test.assertTrue(ef.success)
+    outside = ef.y[0] > r_min
+    t = ef.t[outside] + (ef.y[0][outside] - y0[0]) / c
+    schwarzschild = solve_dop853(EQUATIONS_SCHWARZSCHILD, params, y0, (0.0, t[-1]), t, RTOL, ATOL)
+    test.assertTrue(schwarzschild.success)
+    for row in range(4):
+        expected = schwarzschild.y[row]
+        np.testing.assert_allclose(ef.y[row][outside], expected, rtol=0, atol=1e-11 * np.abs(expected).max())
+    return ef
+
+
+class SameOrbit(unittest.TestCase):
+    def test_infall(self):
+        # Black_hole_fall: 2 Rs, vy = -0.4 c
+        ef = compare(self, 2 * Rs, -0.4 * c, 2.6e-4, 1.1 * Rs)
+        self.assertLess(ef.y[0].min(), 1.1 * Rs)
+
+    def test_bound_orbit(self):
+        compare(self, 40 * Rs, 0.13 * c, 0.5)
+
+    def test_horizon_event(self):
+        # Capture at 1.1 Rs, then past the horizon, which only this formulation reaches
+        with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+            output = os.path.join(directory, "GR.traj")
+            events = {}
+            for coordinates in ("schwarzschild", "eddington_finkelstein"):
+                events[coordinates] = simulate_GR(mass, 2 * Rs, 0.0, 0.0, -0.4 * c, Rs, 3e-4, 1000, 1, output=output,
+                                                  capture_radius=1.1 * Rs, coordinates=coordinates)["horizon"]
+            np.testing.assert_allclose(events["eddington_finkelstein"] + (1.1 * Rs - 2 * Rs) / c, events["schwarzschild"], rtol=1e-12)
+            inside = simulate_GR(mass, 2 * Rs, 0.0, 0.0, -0.4 * c, Rs, 3e-4, 1000, 1, output=output,
+                                 capture_radius=0.5 * Rs, coordinates="eddington_finkelstein")["horizon"]
+            self.assertEqual(len(inside), 1)
+
+    def test_analytic_orbit(self):
+        # The orbit equation timed in T against the integration
+        y0 = np.array(cartesian_to_polar(40 * Rs, 0.0, 0.0, 0.13 * c, mass))
+        T = np.linspace(0.0, 0.5, 201)
+        ef = solve_dop853(EQUATIONS_EDDINGTON_FINKELSTEIN, np.array([mass, Rs, c]), y0, (0.0, T[-1]), T, RTOL, ATOL)
+        orbit = analytic_orbit(mass, 40 * Rs, 0.0, 0.0, 0.13 * c, Rs, c, "eddington_finkelstein")
+        r, phi, _, _ = orbit.states_at_times(T)
+        np.testing.assert_allclose(r, ef.y[0], rtol=1e-10)
+        np.testing.assert_allclose(phi, ef.y[1], rtol=0, atol=1e-10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import os, sys, io, contextlib, tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+from Newton import simulate_nbody, simulate_newton_ensemble
+from Schwarzschild import simulate_GR, simulate_GR_ensemble
+from trajectory import open_trajectory
+
+# Every ensemble member against the same initial condition run on its own
+#   python -m unittest discover tests
+
+M_sun = 1.989e30
+c = 299792458
+Rs = 2953.0
+
+
+class NewtonEnsemble(unittest.TestCase):
+    def test_members_match_single_runs(self):
+        # One bound orbit that reaches escape_radius at aphelion, one hyperbolic flyby
+        positions = np.array([[46e9, 0.0], [50e9, 0.0]])
+        velocities = np.array([[0.0, 58.97e3], [0.0, 9e4]])
+        with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+            for integrator in ("euler", "leapfrog", "yoshida4"):
+                results = simulate_newton_ensemble(M_sun, [0, 0], [0, 0], 3.3e23, positions, velocities, 2e6, 100.0, integrator=integrator,
+                                                   capture_radius=1e9, escape_radius=6e10, output=None)
+                for k in range(2):
+                    final_positions, final_velocities, events = simulate_nbody([M_sun, 3.3e23], [[0, 0], positions[k]], [[0, 0], velocities[k]], 2e6, 100.0,
+                                                                               integrator=integrator, capture_radius=1e9, escape_radius=6e10,
+                                                                               output=os.path.join(directory, "Newton.traj"))
+                    self.assertEqual(results["status"][k], 2)
+                    self.assertEqual(results["time"][k], events["escape"][0])
+                    member = [[results["x1"][k], results["y1"][k]], [results["x2"][k], results["y2"][k]]]
+                    np.testing.assert_array_equal(member, final_positions)
+
+    def test_stopped_member_ends_on_the_boundary(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = simulate_newton_ensemble(M_sun, [0, 0], [0, 0], 3.3e23, [[46e9, 0.0], [46e9, 0.0]], [[0.0, 5e3], [0.0, 9e4]], 3e7, 100.0,
+                                               integrator="leapfrog", capture_radius=2e10, escape_radius=8e10, output=None)
+        separation = np.hypot(results["x2"] - results["x1"], results["y2"] - results["y1"])
+        np.testing.assert_array_equal(results["status"], [1, 2])
+        np.testing.assert_allclose(separation, [2e10, 8e10], rtol=1e-9)
+        np.testing.assert_allclose(results["r_min"], [2e10, 46e9], rtol=1e-9)
+
+
+class GREnsemble(unittest.TestCase):
+    def test_members_match_single_runs(self):
+        # A radial infall through the horizon and a bound orbit
+        x0 = np.array([2e4, 1e5])
+        vy0 = np.array([0.0, 0.2 * c])
+        with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+            results = simulate_GR_ensemble(1.0, x0, 0.0, 0.0, vy0, Rs, 1e-3, output=None)
+            events = simulate_GR(1.0, x0[0], 0.0, 0.0, vy0[0], Rs, 1e-3, 1001, 1, output=os.path.join(directory, "infall.traj"))
+            simulate_GR(1.0, x0[1], 0.0, 0.0, vy0[1], Rs, 1e-3, 1001, 1, output=os.path.join(directory, "orbit.traj"))
+            orbit = open_trajectory(os.path.join(directory, "orbit.traj"))
+            self.assertEqual(results["status"].tolist(), [1, 0])
+            self.assertEqual(results["time"][0], events["horizon"][0])
+            self.assertAlmostEqual(np.hypot(results["x"][0], results["y"][0]) / (1.001 * Rs), 1.0, places=9)
+            self.assertEqual(results["time"][1], orbit["time"][-1])
+            np.testing.assert_allclose([results["x"][1], results["y"][1]], [orbit["x"][-1], orbit["y"][-1]], rtol=1e-12, atol=1e-12 * x0[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
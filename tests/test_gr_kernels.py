@@ -0,0 +1,56 @@
+import unittest
+import os, sys, io, contextlib, tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import gr_kernels
+from Schwarzschild import simulate_GR
+from trajectory import open_trajectory
+
+# The compiled DOP853 (backend="compiled", the default) against scipy's stepper
+# (backend="scipy"): same tableau, and the same samples, interpolated from the dense
+# output of the same steps, and events up to round-off
+#   python -m unittest discover tests
+
+c = 299792458
+Rs = 2953.0
+
+
+class CompiledAgainstScipy(unittest.TestCase):
+    def test_tableau(self):
+        # Only checked while scipy still ships its (private) coefficient module
+        try:
+            from scipy.integrate._ivp import dop853_coefficients as scipy_tableau
+        except ImportError:
+            self.skipTest("scipy.integrate._ivp.dop853_coefficients is gone")
+        n = scipy_tableau.N_STAGES
+        self.assertEqual((gr_kernels.N_STAGES, gr_kernels.N_STAGES_EXTENDED, gr_kernels.INTERPOLATOR_POWER),
+                         (n, scipy_tableau.N_STAGES_EXTENDED, scipy_tableau.INTERPOLATOR_POWER))
+        np.testing.assert_array_equal(gr_kernels.TABLEAU_A, scipy_tableau.A)
+        np.testing.assert_array_equal(gr_kernels.TABLEAU_C, scipy_tableau.C)
+        for name in ("B", "E3", "E5", "D"):
+            np.testing.assert_array_equal(getattr(gr_kernels, name), getattr(scipy_tableau, name))
+
+    def test_dense_output(self):
+        # A bound, precessing orbit sampled far more often than it is stepped
+        with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+            for coordinates in ("schwarzschild", "eddington_finkelstein"):
+                samples = {}
+                events = {}
+                for backend in ("compiled", "scipy"):
+                    output = os.path.join(directory, f"{coordinates}_{backend}.traj")
+                    events[backend] = simulate_GR(1.0, 1e5, 0.0, 0.0, 0.13 * c, Rs, 5e-2, 10001, 1, output=output, backend=backend,
+                                                  coordinates=coordinates, apsides=True)
+                    samples[backend] = open_trajectory(output).to_array()
+                compiled, scipy = samples["compiled"], samples["scipy"]
+                self.assertEqual(compiled.shape, scipy.shape)
+                np.testing.assert_array_equal(compiled[:, 0], scipy[:, 0])
+                for column in range(1, scipy.shape[1]):
+                    np.testing.assert_allclose(compiled[:, column], scipy[:, column], rtol=0, atol=1e-12 * np.abs(scipy[:, column]).max())
+                self.assertGreater(len(events["scipy"]["periapsis"]) * len(events["scipy"]["apoapsis"]), 0)
+                for name, times in events["scipy"].items():
+                    np.testing.assert_allclose(events["compiled"][name], times, rtol=1e-12)
+
+
+if __name__ == "__main__":
+    unittest.main()
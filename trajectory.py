@@ -0,0 +1,293 @@
+import numpy as np
+import json, os, sys, csv
+import queue, threading
+
+# Binary columnar trajectory store used by both engines in place of Newton.csv / GR.csv.
+# A trajectory is a directory (Newton.traj, GR.traj) holding
+#   header.json    format version, column names, units and the run parameters
+#   <column>.f64   one file per column, raw little-endian float64 values
+# Rows are appended chunk by chunk while the simulation runs and every column can be
+# memory-mapped for reading without loading the file. `python trajectory.py GR.traj GR.csv`
+# exports a trajectory to the old CSV layout.
+
+FORMAT_VERSION = 1
+DTYPE = np.dtype("<f8")
+HEADER_NAME = "header.json"
+# Every INDEX_STRIDE-th time is kept in memory by a TimeIndex
+INDEX_STRIDE = 4096
+
+
+def column_path(path, column):
+    return os.path.join(path, f"{column}.f64")
+
+
+class TrajectoryWriter:
+    def __init__(self, path, columns, units=None, params=None, resume_rows=None):
+        # Creates (or truncates) the trajectory at path, units maps column -> unit string
+        # and params holds the physical and numerical inputs of the run. With resume_rows
+        # the existing trajectory is kept, cut back to its first resume_rows rows and
+        # appended to
+        self.path = path
+        self.columns = list(columns)
+        if resume_rows is not None:
+            with open(os.path.join(path, HEADER_NAME)) as file:
+                if json.load(file)["columns"] != self.columns:
+                    raise ValueError("The trajectory to resume has different columns.")
+            self.files = []
+            for column in self.columns:
+                file = open(column_path(path, column), "r+b")
+                if os.path.getsize(column_path(path, column)) < resume_rows * DTYPE.itemsize:
+                    file.close()
+                    raise ValueError(f"Column {column} is shorter than the {resume_rows} rows to resume from.")
+                file.truncate(resume_rows * DTYPE.itemsize)
+                file.seek(0, os.SEEK_END)
+                self.files.append(file)
+            self.rows = int(resume_rows)
+            return
+
+        os.makedirs(path, exist_ok=True)
+        header = {
+            "version": FORMAT_VERSION,
+            "dtype": DTYPE.str,
+            "columns": self.columns,
+            "units": {column: (units or {}).get(column, "") for column in self.columns},
+            "params": params or {},
+        }
+        with open(os.path.join(path, HEADER_NAME), "w") as file:
+            json.dump(header, file, indent=2, default=float)
+        self.files = [open(column_path(path, column), "wb") for column in self.columns]
+        self.rows = 0
+
+    def append(self, block):
+        # block (rows, len(columns)), row-major as produced by the integration kernels
+        block = np.asarray(block, dtype=DTYPE)
+        if block.ndim != 2 or block.shape[1] != len(self.columns):
+            raise ValueError(f"Expected a block of shape (rows, {len(self.columns)}).")
+        for k, file in enumerate(self.files):
+            np.ascontiguousarray(block[:, k]).tofile(file)
+        self.rows += block.shape[0]
+
+    def append_columns(self, *columns):
+        # Same as append for data that is already split into one array per column
+        if len(columns) != len(self.columns):
+            raise ValueError(f"Expected {len(self.columns)} columns.")
+        for file, values in zip(self.files, columns):
+            np.ascontiguousarray(values, dtype=DTYPE).tofile(file)
+        self.rows += len(columns[0])
+
+    def flush(self):
+        for file in self.files:
+            file.flush()
+
+    def close(self):
+        for file in self.files:
+            file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# What BackgroundWriter.acquire does when every buffer is still waiting to be written
+BACKPRESSURE_BLOCK = "block"  # wait for the writer, memory stays at buffers * buffer size
+BACKPRESSURE_GROW = "grow"  # allocate another buffer and keep computing, memory is unbounded
+
+
+class BackgroundWriter:
+    def __init__(self, writer, buffer_shape, buffers=2, backpressure=BACKPRESSURE_BLOCK):
+        # Drains filled (rows, columns) buffers into writer on a background thread so the
+        # integration continues while the previous chunk is formatted and written. The
+        # buffers are preallocated and recycled (double buffering with the default 2)
+        if backpressure not in (BACKPRESSURE_BLOCK, BACKPRESSURE_GROW):
+            raise ValueError(f"Unknown backpressure policy: {backpressure}")
+        if buffers < 2:
+            raise ValueError("At least two buffers are needed to overlap compute and I/O.")
+        self.writer = writer
+        self.buffer_shape = buffer_shape
+        self.backpressure = backpressure
+        self.free = queue.Queue()
+        for _ in range(buffers):
+            self.free.put(np.empty(buffer_shape, dtype=DTYPE))
+        self.pending = queue.Queue()
+        self.error = None
+        self.stalls = 0
+        self.thread = threading.Thread(target=self.drain, daemon=True)
+        self.thread.start()
+
+    def drain(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                self.pending.task_done()
+                return
+            buffer, rows = item
+            try:
+                if self.error is None:
+                    self.writer.append(buffer[:rows])
+            except BaseException as error:
+                self.error = error
+            self.free.put(buffer)
+            self.pending.task_done()
+
+    def check(self):
+        if self.error is not None:
+            raise self.error
+
+    def acquire(self):
+        # Returns an empty buffer to fill, applying the backpressure policy when the
+        # writer has fallen behind
+        self.check()
+        try:
+            return self.free.get_nowait()
+        except queue.Empty:
+            self.stalls += 1
+            if self.backpressure == BACKPRESSURE_GROW:
+                return np.empty(self.buffer_shape, dtype=DTYPE)
+            return self.free.get()
+
+    def submit(self, buffer, rows):
+        # Hands the first rows of buffer to the writer thread, buffer must not be
+        # touched again until acquire returns it
+        self.check()
+        if rows == 0:
+            self.free.put(buffer)
+            return
+        self.pending.put((buffer, rows))
+
+    def sync(self):
+        # Blocks until every submitted buffer has been written and flushed
+        self.pending.join()
+        self.writer.flush()
+        self.check()
+
+    def close(self):
+        # Waits until everything submitted is on disk
+        self.pending.put(None)
+        self.thread.join()
+        self.writer.flush()
+        self.check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Trajectory:
+    def __init__(self, path):
+        # Read-only view of a trajectory, columns are memory-mapped on first access
+        self.path = path
+        with open(os.path.join(path, HEADER_NAME)) as file:
+            header = json.load(file)
+        if header.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported trajectory format version: {header.get('version')}")
+        self.columns = header["columns"]
+        self.units = header["units"]
+        self.params = header["params"]
+        # A column may be one chunk ahead of the others while a run is still appending
+        self.rows = min(os.path.getsize(column_path(path, column)) // DTYPE.itemsize for column in self.columns)
+        self.cache = {}
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, column):
+        if column not in self.columns:
+            raise KeyError(column)
+        if column not in self.cache:
+            if self.rows == 0:
+                self.cache[column] = np.empty(0, dtype=DTYPE)
+            else:
+                self.cache[column] = np.memmap(column_path(self.path, column), dtype=DTYPE, mode="r", shape=(self.rows,))
+        return self.cache[column]
+
+    def to_array(self, columns=None):
+        # Loads the given columns (all by default) into one (rows, columns) array
+        columns = self.columns if columns is None else columns
+        return np.column_stack([self[column] for column in columns])
+
+    def time_index(self, column="time"):
+        # TimeIndex over the (non-decreasing) time column, built once per Trajectory
+        key = ("index", column)
+        if key not in self.cache:
+            self.cache[key] = TimeIndex(self[column])
+        return self.cache[key]
+
+    def at(self, times, columns=None):
+        # The given columns (all but time by default) interpolated at times
+        columns = [column for column in self.columns if column != "time"] if columns is None else columns
+        return self.time_index().interpolate([self[column] for column in columns], times)
+
+
+class TimeIndex:
+    def __init__(self, time, stride=INDEX_STRIDE):
+        # Seeks in a memory-mapped time column: every stride-th time is read into memory,
+        # a seek searches those and then the one stride-sized slice of the column around
+        # the time, O(log n) and a few pages of the file whatever the length of the run
+        self.time = time
+        self.stride = stride
+        self.coarse = np.array(time[::stride])
+
+    def __len__(self):
+        return len(self.time)
+
+    def locate(self, times):
+        # (left, weight) per time, time = (1 - weight) * time[left] + weight * time[left + 1],
+        # held at the first / last sample outside of the trajectory
+        times = np.atleast_1d(np.asarray(times, dtype=float))
+        rows = len(self.time)
+        if rows < 2:
+            return np.zeros(len(times), dtype=np.int64), np.zeros(len(times))
+        blocks = np.clip(np.searchsorted(self.coarse, times, side="right") - 1, 0, len(self.coarse) - 1)
+        right = np.empty(len(times), dtype=np.int64)
+        for block in np.unique(blocks):
+            start = block * self.stride
+            window = np.asarray(self.time[start:min(start + self.stride + 1, rows)])
+            selected = blocks == block
+            right[selected] = start + np.searchsorted(window, times[selected])
+        right = np.clip(right, 1, rows - 1)
+        left = right - 1
+        t0, t1 = np.asarray(self.time[left]), np.asarray(self.time[right])
+        weight = np.clip(np.divide(times - t0, t1 - t0, out=np.zeros(len(times)), where=t1 > t0), 0.0, 1.0)
+        return left, weight
+
+    def interpolate(self, columns, times):
+        # Each column linearly interpolated at times, NaN for an empty trajectory
+        if len(self.time) == 0:
+            return [np.full(np.size(times), np.nan) for _ in columns]
+        left, weight = self.locate(times)
+        right = np.minimum(left + 1, len(self.time) - 1)
+        return [np.asarray(column[left]) * (1 - weight) + np.asarray(column[right]) * weight for column in columns]
+
+
+def open_trajectory(path):
+    return Trajectory(path)
+
+
+def read_events(path):
+    # {event name: times} the engines save next to the columns (events.npz)
+    with np.load(os.path.join(path, "events.npz")) as events:
+        return {name: events[name] for name in events.files}
+
+
+def export_csv(path, csv_path, chunk_size=100000):
+    # Writes the trajectory in the CSV layout the engines used to produce
+    trajectory = open_trajectory(path)
+    with open(csv_path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow([f"{column} ({trajectory.units[column]})" if trajectory.units[column] else column
+                         for column in trajectory.columns])
+        for start in range(0, len(trajectory), chunk_size):
+            stop = min(start + chunk_size, len(trajectory))
+            writer.writerows(np.column_stack([trajectory[column][start:stop] for column in trajectory.columns]).tolist())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("usage: python trajectory.py <trajectory dir> <output.csv>")
+        sys.exit(1)
+    export_csv(sys.argv[1], sys.argv[2])
+    sys.exit(0)
@@ -0,0 +1,309 @@
+import numpy as np
+import json, os, sys, io, contextlib, tempfile, argparse, inspect
+from scenarios import load_scenario, scenario_path, find_scenarios
+
+# Step size / tolerance tuner. Given a target accuracy for a scenario it runs short pilot
+# integrations with both engines and picks the cheapest Newton dt (and integrator) and
+# the loosest GR rtol that still meet it. Accuracy metrics:
+#   energy            largest relative drift of the conserved energy (Newton only, the GR
+#                     output does not record it)
+#   angular_momentum  largest relative drift of the total angular momentum (Newton only, both GR
+#                     formulations conserve it exactly)
+#   position          final position error relative to the initial distance, against the
+#                     same run at half the step (Richardson, Newton) or at the strictest
+#                     tolerance (GR)
+# GR is always tuned on position, the output says so when another metric was asked for.
+# A pilot covers pilot_fraction of target_time but at least one Kepler period of the
+# initial state (never more than target_time), its error is extrapolated linearly to
+# target_time. A setting passes when it and the next finer one both meet the target, the
+# search halves dt / divides rtol by ten until one passes and then bisects (in log) REFINE
+# times between it and the last failing one. The Newton step is what resolution sets by
+# default (dt = target_time / resolution), for GR resolution only sets the sampling of
+# the output and is left alone.
+#   python tuner.py mercury_orbit --metric energy --target 1e-6
+#   python tuner.py black_hole_orbit --metric position --target 1e-8 --write
+
+METRICS = ("energy", "angular_momentum", "position")
+# Global error order of each Newton integrator (force evaluations per step are
+# Newton.FORCE_EVALUATIONS)
+ORDERS = {"euler": 1, "leapfrog": 2, "verlet": 2, "yoshida4": 4, "wisdom_holman": 2}
+PILOT_FRACTION = 0.05
+MIN_PILOT_STEPS = 64
+MAX_PILOT_STEPS = 2e7
+PILOT_SAMPLES = 1001
+# Newton pilots check the invariants at the ends of this many parts of the pilot
+SEGMENTS = 7
+# Loosest to strictest, the last is simulate_GR's default
+GR_RTOLS = [10.0**-k for k in range(4, 14)] + [2.220446049250313e-14]
+REFINE = 3
+
+
+def quiet():
+    # The engines report every pilot run
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def kepler_period(scenario):
+    # Period of the Kepler orbit of the initial state, None when unbound
+    mu = scenario["G"] * (scenario["central_mass"] + scenario["mass"])
+    r = np.subtract(scenario["position"], scenario["central_position"])
+    v = np.subtract(scenario["velocity"], scenario["central_velocity"])
+    energy = 0.5 * v @ v - mu / np.hypot(*r)
+    if energy >= 0:
+        return None
+    return 2 * np.pi * np.sqrt((-mu / (2 * energy))**3 / mu)
+
+
+def pilot_time(scenario, pilot_fraction=PILOT_FRACTION):
+    period = kepler_period(scenario)
+    return min(scenario["target_time"], max(scenario["target_time"] * pilot_fraction, period or 0.0))
+
+
+def initial_distance(scenario):
+    return np.hypot(*np.subtract(scenario["position"], scenario["central_position"]))
+
+
+def newton_invariants(G, masses, positions, velocities):
+    energy = 0.5 * np.sum(masses * np.sum(velocities**2, axis=1)) - G * masses[0] * masses[1] / np.hypot(*(positions[1] - positions[0]))
+    angular_momentum = np.sum(masses * (positions[:, 0] * velocities[:, 1] - positions[:, 1] * velocities[:, 0]))
+    return {"energy": energy, "angular_momentum": angular_momentum}
+
+
+class NewtonPilot:
+    # Pilot runs of simulate_nbody over t_pilot, one per (integrator, dt)
+    def __init__(self, scenario, t_pilot, directory):
+        self.scenario = scenario
+        self.t_pilot = t_pilot
+        self.output = os.path.join(directory, "Newton.traj")
+        self.masses = np.array([scenario["central_mass"], scenario["mass"]])
+        self.positions = np.array([scenario["central_position"], scenario["position"]])
+        self.velocities = np.array([scenario["central_velocity"], scenario["velocity"]])
+        self.initial = newton_invariants(scenario["G"], self.masses, self.positions, self.velocities)
+        self.runs = {}
+
+    def run(self, integrator, dt):
+        # States at the ends of SEGMENTS equal parts of the pilot, each a whole number of
+        # steps: a fixed-step run stops on the first step past target_time, which is
+        # therefore set half a step short of the last one
+        from Newton import simulate_nbody
+
+        if (integrator, dt) not in self.runs:
+            # The scenario's simulate_newton options that simulate_nbody also takes (mode,
+            # for one, it does not)
+            accepted = set(inspect.signature(simulate_nbody).parameters) - {"masses", "positions", "velocities", "target_time", "dt", "save_every", "G", "integrator", "output"}
+            options = {key: value for key, value in self.scenario["newton"].items() if key in accepted}
+            positions, velocities = self.positions, self.velocities
+            states = []
+            steps = max(int(round(self.t_pilot / dt)), SEGMENTS)
+            for segment in np.diff(np.linspace(0, steps, SEGMENTS + 1).round().astype(int)):
+                with quiet():
+                    positions, velocities, _ = simulate_nbody(self.masses, positions, velocities, (segment - 0.5) * dt, dt, 2**62, self.scenario["G"],
+                                                              integrator=integrator, output=self.output, **options)
+                states.append((positions, velocities))
+            self.runs[integrator, dt] = states
+        return self.runs[integrator, dt]
+
+    def error(self, metric, integrator, dt):
+        states = self.run(integrator, dt)
+        if metric == "position":
+            positions = states[-1][0]
+            finer = self.run(integrator, dt / 2)[-1][0]
+            gain = 2.0**ORDERS[integrator]
+            difference = (positions[1] - positions[0]) - (finer[1] - finer[0])
+            return np.hypot(*difference) * gain / (gain - 1) / initial_distance(self.scenario)
+        # Largest drift at the segment ends
+        return max(abs(newton_invariants(self.scenario["G"], self.masses, positions, velocities)[metric] / self.initial[metric] - 1)
+                   for positions, velocities in states)
+
+
+class GRPilot:
+    # Pilot runs of simulate_GR over t_pilot, one per rtol
+    def __init__(self, scenario, t_pilot, directory):
+        self.scenario = scenario
+        self.t_pilot = t_pilot
+        self.directory = directory
+        self.runs = {}
+
+    def run(self, rtol):
+        from Schwarzschild import simulate_GR
+        from trajectory import open_trajectory
+        from metrics import RunMetrics
+
+        if rtol not in self.runs:
+            scenario = self.scenario
+            output = os.path.join(self.directory, f"GR_{len(self.runs)}.traj")
+            options = {key: value for key, value in scenario["gr"].items() if key not in ("rtol", "save_every")}
+            metrics = RunMetrics()
+            with quiet():
+                simulate_GR(scenario["mass"], *scenario["position"], *scenario["velocity"], scenario["Rs"], self.t_pilot, PILOT_SAMPLES, 1,
+                            c=scenario["c"], output=output, rtol=rtol, metrics=metrics, **options)
+            trajectory = open_trajectory(output)
+            self.runs[rtol] = ({column: np.array(trajectory[column]) for column in ("x", "y")}, metrics.counters)
+        return self.runs[rtol]
+
+    def error(self, metric, rtol):
+        # Position error, the only GR metric
+        samples, _ = self.run(rtol)
+        reference, _ = self.run(GR_RTOLS[-1])
+        rows = min(len(samples["x"]), len(reference["x"]))
+        return np.hypot(samples["x"][rows - 1] - reference["x"][rows - 1], samples["y"][rows - 1] - reference["y"][rows - 1]) / initial_distance(self.scenario)
+
+
+def bisect(passes, passing, failing, steps=REFINE):
+    # Largest setting known to pass, log-bisecting between a passing and a larger failing one
+    for _ in range(steps):
+        middle = np.sqrt(passing * failing)
+        if passes(middle):
+            passing = middle
+        else:
+            failing = middle
+    return passing
+
+
+def tune_newton(scenario, metric, target, integrators=None, pilot_fraction=PILOT_FRACTION, directory=None):
+    # Cheapest (integrator, dt) whose extrapolated error meets target
+    from Newton import FORCE_EVALUATIONS
+
+    t_pilot = pilot_time(scenario, pilot_fraction)
+    scale = scenario["target_time"] / t_pilot
+    integrators = integrators or [scenario["newton"].get("integrator", "euler")]
+    with tempfile.TemporaryDirectory(dir=directory) as directory:
+        pilot = NewtonPilot(scenario, t_pilot, directory)
+        best = None
+        for integrator in integrators:
+            def passes(dt):
+                return all(pilot.error(metric, integrator, step) * scale <= target for step in (dt, dt / 2))
+
+            dt = t_pilot / MIN_PILOT_STEPS
+            while t_pilot / dt <= MAX_PILOT_STEPS and not passes(dt):
+                dt /= 2
+            if t_pilot / dt > MAX_PILOT_STEPS:
+                continue
+            if dt < t_pilot / MIN_PILOT_STEPS:
+                dt = bisect(passes, dt, 2 * dt)
+            steps = int(np.ceil(scenario["target_time"] / dt))
+            cost = steps * FORCE_EVALUATIONS[integrator]
+            if best is None or cost < best["rhs_evaluations"]:
+                best = {"integrator": integrator, "dt": dt, "resolution": scenario["target_time"] / dt, "error": pilot.error(metric, integrator, dt) * scale,
+                        "steps": steps, "rhs_evaluations": cost}
+        current_integrator = scenario["newton"].get("integrator", "euler")
+        current = {"integrator": current_integrator, "dt": scenario["dt"], "steps": int(np.ceil(scenario["target_time"] / scenario["dt"])),
+                   "rhs_evaluations": int(np.ceil(scenario["target_time"] / scenario["dt"])) * FORCE_EVALUATIONS[current_integrator]}
+        if t_pilot / scenario["dt"] <= MAX_PILOT_STEPS:
+            current["error"] = pilot.error(metric, current_integrator, scenario["dt"]) * scale
+        return {"metric": metric, "target": target, "pilot_time": t_pilot, "pilot_runs": len(pilot.runs), "met": best is not None,
+                "tuned": best, "current": current}
+
+
+def tune_gr(scenario, metric, target, pilot_fraction=PILOT_FRACTION, directory=None):
+    # Loosest rtol whose extrapolated error meets target
+    if metric == "angular_momentum":
+        raise ValueError("Both GR formulations conserve the angular momentum exactly, tune on position.")
+    if metric == "energy":
+        raise ValueError("The GR output does not record the energy, tune on position.")
+    if scenario["gr"].get("backend") == "analytic":
+        raise ValueError("The analytic backend has no tolerance to tune.")
+
+    t_pilot = pilot_time(scenario, pilot_fraction)
+    scale = scenario["target_time"] / t_pilot
+    with tempfile.TemporaryDirectory(dir=directory) as directory:
+        pilot = GRPilot(scenario, t_pilot, directory)
+
+        def passes(rtol):
+            # rtol and the next stricter candidate (or rtol / 10)
+            stricter = next((value for value in GR_RTOLS if value < rtol), rtol / 10)
+            return all(pilot.error(metric, value) * scale <= target for value in (rtol, max(stricter, GR_RTOLS[-1])))
+
+        index = next((i for i, rtol in enumerate(GR_RTOLS) if passes(rtol)), None)
+        rtol = None
+        if index is not None:
+            rtol = GR_RTOLS[index] if index == 0 else bisect(passes, GR_RTOLS[index], GR_RTOLS[index - 1])
+
+        def cost(rtol):
+            counters = pilot.run(rtol)[1]
+            return {"steps": int(counters.get("steps", 0) * scale), "rhs_evaluations": int(counters.get("rhs_evaluations", 0) * scale)}
+
+        tuned = None
+        if rtol is not None:
+            tuned = dict({"rtol": rtol, "error": pilot.error(metric, rtol) * scale}, **cost(rtol))
+        current_rtol = scenario["gr"].get("rtol", GR_RTOLS[-1])
+        current = dict({"rtol": current_rtol, "error": pilot.error(metric, current_rtol) * scale}, **cost(current_rtol))
+        return {"metric": metric, "target": target, "pilot_time": t_pilot, "pilot_runs": len(pilot.runs), "met": tuned is not None,
+                "tuned": tuned, "current": current}
+
+
+def tune(scenario, metric, target, integrators=None, pilot_fraction=PILOT_FRACTION):
+    # Both engines, {"newton": result, "gr": result or {"skipped": reason}}
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric: {metric}, expected one of {METRICS}")
+    results = {"newton": tune_newton(scenario, metric, target, integrators, pilot_fraction)}
+    try:
+        results["gr"] = tune_gr(scenario, "position", target, pilot_fraction)
+    except ValueError as error:
+        results["gr"] = {"skipped": str(error)}
+    if metric != "position":
+        results["gr"]["fallback"] = f"no {metric} metric for GR, tuned on position"
+    return results
+
+
+def write_settings(path, results):
+    # Stores the tuned Newton dt / integrator and GR rtol in the scenario file
+    path = scenario_path(path)
+    with open(path) as file:
+        data = json.load(file)
+    newton = results["newton"].get("tuned")
+    if newton is not None:
+        data.setdefault("newton", {})["dt"] = newton["dt"]
+        if newton["integrator"] != "euler" or "integrator" in data["newton"]:
+            data["newton"]["integrator"] = newton["integrator"]
+    gr = results["gr"].get("tuned")
+    if gr is not None:
+        data.setdefault("gr", {})["rtol"] = gr["rtol"]
+    with open(path, "w") as file:
+        json.dump(data, file, indent=2)
+        file.write("\n")
+
+
+def print_results(name, results):
+    for engine, result in results.items():
+        if "fallback" in result:
+            print(f"{name} {engine}: {result['fallback']}")
+        if "skipped" in result:
+            print(f"{name} {engine}: skipped, {result['skipped']}")
+            continue
+        setting = "dt" if engine == "newton" else "rtol"
+        current = result["current"]
+        error = f"{current['error']:.2e}" if "error" in current else "not piloted"
+        print(f"{name} {engine}: current {setting} = {current[setting]:.4g}, {current['steps']} steps, {result['metric']} error {error}")
+        tuned = result["tuned"]
+        if tuned is None:
+            print(f"{name} {engine}: no setting meets {result['metric']} <= {result['target']:g} within the pilot limits")
+            continue
+        integrator = f" ({tuned['integrator']})" if engine == "newton" else ""
+        cost = tuned["rhs_evaluations"] / current["rhs_evaluations"] if current["rhs_evaluations"] else np.inf
+        print(f"{name} {engine}: tuned   {setting} = {tuned[setting]:.4g}{integrator}, {tuned['steps']} steps, {result['metric']} error {tuned['error']:.2e}"
+              f" ({cost:.3g}x the current evaluations, {result['pilot_runs']} pilots over {result['pilot_time']:.4g}s)")
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Pick the cheapest Newton step and GR tolerance that meet a target accuracy.")
+    parser.add_argument("scenarios", nargs="*", help="scenario directories or files (default: all)")
+    parser.add_argument("--metric", choices=METRICS, default="energy")
+    parser.add_argument("--target", type=float, default=1e-6, help="largest acceptable error over target_time")
+    parser.add_argument("--integrators", default=None, help="comma separated Newton integrators to consider (default: the scenario's)")
+    parser.add_argument("--pilot-fraction", type=float, default=PILOT_FRACTION, help="fraction of target_time covered by a pilot run")
+    parser.add_argument("--write", action="store_true", help="store the tuned settings in the scenario files")
+    arguments = parser.parse_args(arguments)
+
+    integrators = arguments.integrators.split(",") if arguments.integrators else None
+    for path in arguments.scenarios or find_scenarios():
+        scenario = load_scenario(path)
+        results = tune(scenario, arguments.metric, arguments.target, integrators, arguments.pilot_fraction)
+        print_results(scenario["name"], results)
+        if arguments.write:
+            write_settings(path, results)
+
+
+if __name__ == "__main__":
+    main()
+    sys.exit(0)
@@ -1,143 +1,255 @@
-import csv
+from trajectory import open_trajectory
+from lod import LODLine, trajectory_pyramid
+import numpy as np
+import os, shutil, subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.patches import Circle
 from matplotlib.widgets import Slider
 from matplotlib import ticker
 from matplotlib.ticker import EngFormatter
 
+# Exported animations: seconds of video and frames per second, both trajectories are
+# resampled onto duration * fps evenly spaced simulation times
+DEFAULT_DURATION = 20.0
+DEFAULT_FPS = 30
+# Frames one export worker renders per task
+FRAMES_PER_TASK = 16
+FIGSIZE = (10, 8)
+DPI = 100
 
-def plot(body1_file, body2_file, limit, interval, body_radius, body_name, export_animation = False):
-        # Read data from files
-    class StopAnimationException(Exception):
-        pass
-
-    def read_csvN(file_path):
-        with open(file_path, 'r') as file:
-            reader = csv.reader(file)
-            # Skip header if present
-            next(reader, None)
-            data = []
-            for row in reader:
-                timestamp, _, _, x, y = map(float, row)
-                data.append((timestamp, x, y))
-            return data
-        
-    def read_csvG(file_path):
-        with open(file_path, 'r') as file:
-            reader = csv.reader(file)
-            # Skip header if present
-            next(reader, None)
-            data = []
-            for row in reader:
-                timestamp, x, y, _ = map(float, row)
-                data.append((timestamp, x, y))
-            return data
-
-    # Load data for both bodies
-    body1_data = read_csvN(body1_file)
-    body2_data = read_csvG(body2_file)
-
-    # Extract paths for plotting
-    body1_path_x = [point[1] for point in body1_data]  # X-coordinates
-    body1_path_y = [point[2] for point in body1_data]  # Y-coordinates
-    body2_path_x = [point[1] for point in body2_data]  # X-coordinates
-    body2_path_y = [point[2] for point in body2_data]  # Y-coordinates
 
-    # Initialize plot
-    fig, ax = plt.subplots(figsize=(10, 8))
-    ax.plot(body1_path_x, body1_path_y, 'b--', label='Newton Path')  # Dotted blue line for Body 1 path
-    ax.plot(body2_path_x, body2_path_y, 'r--', label='GR Path')  # Dotted red line for Body 2 path
-    body1, = ax.plot([], [], 'bo', label='Newton')  # Blue circle for Body 1
-    body2, = ax.plot([], [], 'ro', label='GR')  # Red circle for Body 2
-    ax.legend()
+def read_trajectoryN(file_path):
+    # Time and position of the last body of a Newton trajectory, memory-mapped
+    trajectory = open_trajectory(file_path)
+    x_column, y_column = trajectory.columns[-2:]
+    return trajectory, ("time", x_column, y_column)
+
 
-    # Set plot limits
+def read_trajectoryG(file_path):
+    trajectory = open_trajectory(file_path)
+    return trajectory, ("time", "x", "y")
+
+
+def draw_scene(ax, body1, body2, limit, body_radius, body_name):
+    # Paths, central body, limits and axes of the plot, body1 / body2 as returned by
+    # read_trajectoryN / read_trajectoryG. Returns the two path lines (lod.LODLine, they
+    # must stay referenced, matplotlib keeps its callbacks as weak references), the two
+    # body markers and the time text
+    (trajectory1, columns1), (trajectory2, columns2) = body1, body2
     ax.set_xlim(-limit, limit)
     ax.set_ylim(-limit, limit)
+    path1 = LODLine(ax, trajectory1[columns1[1]], trajectory1[columns1[2]], 'b--', label='Newton Path', pyramid=trajectory_pyramid(trajectory1, *columns1[1:]))  # Dotted blue line for Body 1 path
+    path2 = LODLine(ax, trajectory2[columns2[1]], trajectory2[columns2[2]], 'r--', label='GR Path', pyramid=trajectory_pyramid(trajectory2, *columns2[1:]))  # Dotted red line for Body 2 path
+    marker1, = ax.plot([], [], 'bo', label='Newton')  # Blue circle for Body 1
+    marker2, = ax.plot([], [], 'ro', label='GR')  # Red circle for Body 2
+    ax.legend()
 
-    circle = plt.Circle((0, 0), body_radius, color='black', fill=True, label=body_name)
+    circle = Circle((0, 0), body_radius, color='black', fill=True, label=body_name)
     ax.add_artist(circle)
 
-
     # Enable grid and set up major and minor ticks
     ax.grid(True)
     formatter1 = EngFormatter(places=0, sep="", unit="m")
-    #ax.xaxis.set_major_formatter(ticker.FuncFormatter(lambda x, _: f'{x/limit*tick:.0f}'))
     ax.xaxis.set_major_formatter(ticker.FuncFormatter(formatter1))
-    #ax.yaxis.set_major_formatter(ticker.FuncFormatter(lambda y, _: f'{y/limit*tick:.0f}'))
     ax.yaxis.set_major_formatter(ticker.FuncFormatter(formatter1))
+    ax.set_aspect('equal', adjustable='box')
 
     # Display text for simulation time
     time_text = ax.text(0.05, 0.9, '', transform=ax.transAxes)
+    return (path1, path2), (marker1, marker2), time_text
+
+
+def time_range(body1, body2):
+    # First and last simulation time over both trajectories
+    times = [trajectory["time"] for trajectory, _ in (body1, body2) if len(trajectory)]
+    return min(time[0] for time in times), max(time[-1] for time in times)
+
 
-    # Initialize frame index
-    frame_index = 0
-    last_x1, last_y1 = None, None
-    last_x2, last_y2 = None, None
+def positions_at(body1, body2, times):
+    # [(x, y) per body] interpolated at times through the trajectories' time index,
+    # without loading the columns
+    return [tuple(trajectory.at(times, list(columns[1:]))) for trajectory, columns in (body1, body2)]
+
+
+def frame_positions(body1, body2, frames):
+    # Both bodies at frames evenly spaced simulation times covering both trajectories
+    times = np.linspace(*time_range(body1, body2), frames)
+    return times, positions_at(body1, body2, times)
+
+
+# State of an export worker process, set by start_renderer
+renderer = None
+
+
+def start_renderer(body1_file, body2_file, limit, body_radius, body_name):
+    # Builds the figure once per worker (headless, Agg) and keeps a copy of the static
+    # background that every frame starts from
+    global renderer
+    figure = Figure(figsize=FIGSIZE, dpi=DPI)
+    canvas = FigureCanvasAgg(figure)
+    ax = figure.add_subplot()
+    paths, markers, time_text = draw_scene(ax, read_trajectoryN(body1_file), read_trajectoryG(body2_file), limit, body_radius, body_name)
+    canvas.draw()
+    renderer = (canvas, ax, paths, markers, time_text, canvas.copy_from_bbox(figure.bbox))
+
+
+def render_frames(times, positions):
+    # RGBA bytes of one frame per time, positions = [(x, y) per body] at those times
+    canvas, ax, _, markers, time_text, background = renderer
     formatter2 = EngFormatter(places=0, sep="", unit="s")
+    frames = []
+    for k, current_time in enumerate(times):
+        canvas.restore_region(background)
+        for marker, (x, y) in zip(markers, positions):
+            marker.set_data([x[k]], [y[k]])
+            ax.draw_artist(marker)
+        time_text.set_text(f'Simulation Time: {formatter2.format_eng(current_time)}')
+        ax.draw_artist(time_text)
+        frames.append(bytes(canvas.buffer_rgba()))
+    return frames
 
-    def init():
-        body1.set_data([], [])
-        body2.set_data([], [])
-        time_text.set_text('')
-        return body1, body2, time_text
 
-    def update(frame):
-        nonlocal frame_index, last_x1, last_y1, last_x2, last_y2
+def save_animation(body1_file, body2_file, limit, body_radius, body_name, output='animation.mp4',
+                   duration=DEFAULT_DURATION, fps=DEFAULT_FPS, processes=None):
+    # Renders duration * fps frames of both bodies at shared, evenly spaced simulation
+    # times on a pool of worker processes and streams them in order into ffmpeg
+    encoder = shutil.which("ffmpeg")
+    if encoder is None:
+        raise RuntimeError("Exporting an animation needs ffmpeg on the PATH.")
+    frames = max(int(round(duration * fps)), 1)
+    body1, body2 = read_trajectoryN(body1_file), read_trajectoryG(body2_file)
+    times, positions = frame_positions(body1, body2, frames)
+    # Built (and stored next to large trajectories) once, before the workers load them
+    for trajectory, columns in (body1, body2):
+        trajectory_pyramid(trajectory, *columns[1:])
+    width, height = (int(round(size * DPI)) for size in FIGSIZE)
 
-        # If data exists for Body 1, update it; otherwise, keep it at the last known position
-        if frame_index < len(body1_data):
-            t1, x1, y1 = body1_data[frame_index]
-            body1.set_data([x1], [y1])
-            last_x1, last_y1 = x1, y1  # Update last known position
-        else:
-            body1.set_data([last_x1], [last_y1])  # Use last known position
+    processes = processes or (len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count())
+    command = [encoder, "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgba", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+               "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-vcodec", "libx264", "-pix_fmt", "yuv420p", output]
+    print(f"Exporting animation: {frames} frames on {processes} processes")
+    encoding = subprocess.Popen(command, stdin=subprocess.PIPE)
+    try:
+        # spawn, the workers must not inherit the numba threading state of this process
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"), initializer=start_renderer,
+                                 initargs=(body1_file, body2_file, limit, body_radius, body_name)) as pool:
+            tasks = (slice(start, min(start + FRAMES_PER_TASK, frames)) for start in range(0, frames, FRAMES_PER_TASK))
+            pending = []
+            # At most two tasks per worker in flight, the frames are written in order
+            for task in tasks:
+                pending.append(pool.submit(render_frames, times[task], [(x[task], y[task]) for x, y in positions]))
+                if len(pending) >= 2 * processes:
+                    write_frames(encoding, pending.pop(0).result(), width, height)
+            for future in pending:
+                write_frames(encoding, future.result(), width, height)
+    finally:
+        encoding.stdin.close()
+        status = encoding.wait()
+    if status != 0:
+        raise RuntimeError(f"ffmpeg failed with exit status {status}.")
+    print(f"Exported {frames} frames to {output}")
 
-        # If data exists for Body 2, update it; otherwise, keep it at the last known position
-        if frame_index < len(body2_data):
-            t2, x2, y2 = body2_data[frame_index]
-            body2.set_data([x2], [y2])
-            last_x2, last_y2 = x2, y2  # Update last known position
-        else:
-            body2.set_data([last_x2], [last_y2])  # Use last known position
-
-        # Synchronize time display to the maximum available timestamp
-        current_time = max(
-            body1_data[frame_index][0] if frame_index < len(body1_data) else 0,
-            body2_data[frame_index][0] if frame_index < len(body2_data) else 0
-        )
-        if frame_index > len(body1_data) and frame_index > len(body2_data):
-            print("stop")
-            raise StopAnimationException("Stopping the animation export.")
-        
-        formatted_time = formatter2.format_eng(current_time)
-        if export_animation:
-            print(f'Simulation Time: {formatted_time}s')
-        time_text.set_text(f'Simulation Time: {formatted_time}s')
 
-        frame_index += 1
-        return body1, body2, time_text
+def write_frames(encoding, frames, width, height):
+    for frame in frames:
+        if len(frame) != width * height * 4:
+            raise RuntimeError(f"Rendered a frame of {len(frame)} bytes, expected {width}x{height} RGBA.")
+        encoding.stdin.write(frame)
 
-    # Animation
-    ani = animation.FuncAnimation(fig, update, init_func=init,
-                                blit=True, interval=interval)
-    
+
+def plot(body1_file, body2_file, limit, interval, body_radius, body_name, export_animation=False,
+         duration=DEFAULT_DURATION, fps=DEFAULT_FPS, processes=None):
+    # Interactive plot of both trajectories. The animation plays the run in duration * fps
+    # frames, one every interval milliseconds; dragging the time slider jumps to any
+    # simulation time (a time index seek, see trajectory.TimeIndex) and pauses, space
+    # pauses / resumes. With export_animation the animation is first saved to
+    # animation.mp4 (see save_animation for duration, fps and processes)
     if export_animation:
-        print("Exporting animation")
-        ani.save('animation.mp4', writer='ffmpeg', fps=1/interval)
+        save_animation(body1_file, body2_file, limit, body_radius, body_name, 'animation.mp4', duration, fps, processes)
 
+    # Load data for both bodies, the columns are read on demand
+    body1_trajectory, body2_trajectory = read_trajectoryN(body1_file), read_trajectoryG(body2_file)
+    start_time, end_time = time_range(body1_trajectory, body2_trajectory)
+    time_step = (end_time - start_time) / max(int(round(duration * fps)) - 1, 1)
 
+    # Initialize plot
+    fig, ax = plt.subplots(figsize=FIGSIZE)
+    fig.subplots_adjust(bottom=0.15)
+    paths, (body1, body2), time_text = draw_scene(ax, body1_trajectory, body2_trajectory, limit, body_radius, body_name)
+
+    # Time slider, redrawn by the animation while it plays
+    formatter2 = EngFormatter(places=0, sep="", unit="s")
+    slider = Slider(fig.add_axes([0.2, 0.04, 0.6, 0.03]), 'Time', start_time, end_time, valinit=start_time)
+    slider.drawon = False
+    slider_artists = [*slider.ax.patches, *slider.ax.lines, *slider.ax.texts]
+    playing = True
+
+    def show(current_time):
+        (x1, y1), (x2, y2) = positions_at(body1_trajectory, body2_trajectory, [current_time])
+        body1.set_data(x1, y1)
+        body2.set_data(x2, y2)
+        formatted_time = formatter2.format_eng(current_time)
+        time_text.set_text(f'Simulation Time: {formatted_time}')
+        slider.valtext.set_text(formatted_time)
+
+    def scrub(current_time):
+        # Slider moved, by the animation or by the user
+        nonlocal playing
+        show(current_time)
+        if playing and not animating:
+            playing = False
+            ani.pause()
+        if not playing:
+            fig.canvas.draw_idle()
+
+    def toggle(event):
+        nonlocal playing
+        if event.key != ' ':
+            return
+        playing = not playing
+        if playing:
+            if slider.val >= end_time:
+                slider.set_val(start_time)
+            ani.resume()
+        else:
+            ani.pause()
+            fig.canvas.draw_idle()
+
+    animating = False
+
+    def init():
+        show(slider.val)
+        return (body1, body2, time_text, *slider_artists)
+
+    def update(frame):
+        nonlocal animating, playing
+        animating = True
+        slider.set_val(min(slider.val + time_step, end_time))
+        animating = False
+        if slider.val >= end_time:
+            playing = False
+            ani.pause()
+        return (body1, body2, time_text, *slider_artists)
+
+    slider.on_changed(scrub)
+    fig.canvas.mpl_connect('key_press_event', toggle)
+
+    # Animation
+    ani = animation.FuncAnimation(fig, update, init_func=init, blit=True, interval=interval, cache_frame_data=False)
 
     # Enable interactive pan/zoom in the plot
-    plt.gca().set_aspect('auto', adjustable='box')
     fig.canvas.toolbar_visible = True  # Shows the interactive toolbar with pan and zoom options
-    ax.set_aspect('equal', adjustable='box')
     plt.show()
 
 if __name__ == "__main__":
     # File paths for body data
-    body1_file = "Newton.csv"
-    body2_file = "GR.csv"
+    body1_file = "Newton.traj"
+    body2_file = "GR.traj"
 
     # Set up simulation parameters
     limit = 79818000000  # Adjust plot limits